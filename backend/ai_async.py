@@ -0,0 +1,361 @@
+import asyncio
+import os
+from llm_registry import get_llm
+from ai_handler import (
+    DETECT_MODE,
+    completion_cache,
+    incremental_detector,
+    passage_index,
+    split_batch_result,
+    _count_generation,
+    _count_passage,
+    _format_prompt,
+    _numbered,
+    _prompt_tokens,
+    _replay,
+    _DEADLINE_ERRORS,
+    _flight_key,
+    _semantic_lookup,
+    _semantic_store,
+    _sentence_index,
+    resilience,
+)
+from incremental_detect import DETECT_MODES, DetectionFailed
+from json_stream import ErrorObjectStream
+from output_guard import guard_stats, make_guard
+from scheduler import PriorityScheduler, estimate_tokens
+from singleflight import AsyncSingleFlight, AsyncStreamFlight
+from worker_pool import AsyncWorkerPool, PoolOverloaded
+from metrics import (
+    JSON_PARSE_FAILURES_TOTAL,
+    TIMEOUTS_TOTAL,
+    UPSTREAM_TTFT_SECONDS,
+    TokenTimer,
+    observe_request,
+    tone_label,
+)
+
+"""
+asyncio 엔진 — ai_handler의 비동기 버전
+LangChain astream/ainvoke를 직접 사용하므로 스트림마다 OS 스레드나 Queue가 필요 없다.
+프롬프트, 공유 클라이언트, 완성 캐시, 생성 통계, 지표는 동기 엔진과 같은 것을 쓴다.
+업스트림 호출은 async_pool에서 차례를 받는다 — 동기 작업 풀과 같은 한도(WORKER_*) · 같은 스케줄러(SCHEDULER),
+받을 수 없으면 PoolOverloaded.
+같은 입력의 동시 요청은 동기 엔진처럼 업스트림 1회로 병합한다 (call_flight / stream_flight).
+"""
+
+# 업스트림 호출 입장 제어 (작업 풀과 같은 기능별 한도 · 대기열 한도 · 대기 시간 한도 · 대기열 정책)
+scheduler = PriorityScheduler.from_env() if os.getenv("SCHEDULER", "priority") == "priority" else None
+async_pool = AsyncWorkerPool.from_env(queue=scheduler)
+# single-flight 병합 (동기 엔진의 ai_handler.call_flight / stream_flight에 해당)
+call_flight = AsyncSingleFlight()
+stream_flight = AsyncStreamFlight()
+
+
+def _upstream_cost(feature: str, formatted):
+    """스케줄러 예산에서 미리 뺄 예상 토큰 수 (ai_handler._upstream_cost와 같음)"""
+    if scheduler is None:
+        return 0
+    return scheduler.estimate(feature, _prompt_tokens(formatted))
+
+
+def _record_output(feature: str, tokens: int):
+    if scheduler is not None:
+        scheduler.record_output(feature, tokens)
+
+
+# -----------------------------------------------------------
+# 1️⃣ 스트리밍 공통 처리 — 태스크 취소(연결 종료) 시 업스트림도 함께 닫힘
+# -----------------------------------------------------------
+async def _astream_tokens(feature: str, tone: str, llm, formatted, on_complete=None, guard=None):
+    """
+    업스트림 스트림 하나 — 기능별 첫 토큰·전체 마감과 회로 차단기 적용 (헤지는 동기 엔진에서만)
+    대기열에 들어가면 빈 문자열을 먼저 내보낸다 (asgi_app이 첫 항목을 당겨 입장 거절을 응답 전에 확인).
+    """
+    try:
+        resilience.admit(feature)
+    except PoolOverloaded as e:
+        yield f"[ERROR]: {str(e)}"
+        return
+    slot = async_pool.reserve(feature, cost=_upstream_cost(feature, formatted))  # 받을 수 없으면 PoolOverloaded
+    outcome = "completed"
+    ok = None
+    ttft = None
+    pieces = []
+    received = 0
+    timer = TokenTimer(feature, tone)
+    loop = asyncio.get_running_loop()
+    ttft_deadline = resilience.ttft_deadline(feature)
+    stream = None
+    try:
+        yield ""
+        await slot.acquire()
+        started = loop.time()
+        deadline = started + resilience.total_deadline(feature)
+        stream = llm.astream(formatted)
+        while True:
+            limit = deadline - loop.time()
+            if ttft is None and ttft_deadline is not None:
+                limit = min(limit, started + ttft_deadline - loop.time())
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), max(0.0, limit))
+            except StopAsyncIteration:
+                break
+            if not chunk.content:
+                continue
+            if ttft is None:
+                ttft = loop.time() - started
+            timer.token()
+            received += 1
+            text, stop = guard.feed(chunk.content) if guard else (chunk.content, False)
+            if text:
+                pieces.append(text)
+                yield text
+            if stop:
+                break  # 출력 계약 충족 (output_guard)
+        rest = guard.finish() if guard else ""
+        if rest:
+            pieces.append(rest)
+            yield rest
+        ok = True
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    except asyncio.TimeoutError:
+        outcome, ok = "timed_out", False
+        reason = "ttft" if ttft is None and ttft_deadline is not None else "total"
+        resilience.count(feature, f"{reason}_timeouts")
+        TIMEOUTS_TOTAL.labels(feature).inc()
+        yield f"[ERROR]: {_DEADLINE_ERRORS[reason]}"
+    except PoolOverloaded as e:
+        outcome = "failed"  # 대기 시간 초과 — 업스트림 실패가 아니므로 회로 차단기에는 반영하지 않음
+        yield f"[ERROR]: {str(e)}"
+    except Exception as e:
+        outcome, ok = "failed", False
+        yield f"[ERROR]: {str(e)}"
+    finally:
+        if stream is not None:
+            await stream.aclose()
+            _record_output(feature, received)
+        slot.release()
+        resilience.record(feature, ok, ttft)
+        if guard:
+            guard_stats.record(feature, guard, received)
+        timer.finish()
+        _count_generation(feature, outcome)
+        if outcome == "completed" and on_complete:
+            on_complete("".join(pieces))
+
+
+async def _acached_stream(endpoint: str, user_input: str, tone: str, temperature: float, prefix: bool = False,
+                         reference: str = None, semantic: bool = False):
+    with observe_request(endpoint, tone):
+        cached = completion_cache.get(user_input, tone, endpoint, prefix=prefix)
+        if cached is not None:
+            for piece in _replay(cached):
+                yield piece
+            return
+        # 임베딩 계산은 CPU 작업이므로 이벤트 루프 밖에서
+        match = await asyncio.to_thread(_semantic_lookup, endpoint, user_input, tone) if semantic else None
+        if match and match.completion is not None:
+            for piece in _replay(match.completion):
+                yield piece
+            return
+
+        def store(text):
+            completion_cache.put(user_input, tone, endpoint, text)
+            if semantic:
+                _semantic_store(endpoint, user_input, tone, text, match)
+
+        def start():
+            llm = get_llm(temperature=temperature, streaming=True, feature=endpoint)
+            formatted = _format_prompt(endpoint, user_input, tone, reference)
+            return _astream_tokens(endpoint, tone, llm, formatted, on_complete=store, guard=make_guard(endpoint))
+
+        # 같은 입력의 생성이 진행 중이면 합류 (이미 나온 토큰은 재생)
+        async for token in stream_flight.stream(_flight_key(endpoint, user_input, tone), start):
+            yield token
+
+
+async def _ainvoke(endpoint: str, temperature: float, user_input: str, tone: str):
+    """
+    llm.ainvoke()를 기능별 전체 마감 안에서 실행 (시간 초과 시 asyncio.TimeoutError)
+    회로가 열려 있거나 작업 풀이 받을 수 없으면 업스트림을 부르지 않고 PoolOverloaded (라우트에서 503/429)
+    """
+    resilience.admit(endpoint)
+    llm = get_llm(temperature=temperature, feature=endpoint)
+    formatted = _format_prompt(endpoint, user_input, tone)
+    slot = async_pool.reserve(endpoint, cost=_upstream_cost(endpoint, formatted))
+    try:
+        await slot.acquire()
+    except BaseException:
+        slot.release()
+        raise
+    started = asyncio.get_running_loop().time()
+    ok = False
+    try:
+        response = await asyncio.wait_for(llm.ainvoke(formatted), resilience.total_deadline(endpoint))
+        ok = True
+        _record_output(endpoint, estimate_tokens(response.content))
+    except asyncio.TimeoutError:
+        TIMEOUTS_TOTAL.labels(endpoint).inc()
+        resilience.count(endpoint, "total_timeouts")
+        raise
+    except asyncio.CancelledError:
+        ok = None
+        raise
+    finally:
+        slot.release()
+        elapsed = asyncio.get_running_loop().time() - started
+        resilience.record(endpoint, ok, elapsed if ok else None)
+    UPSTREAM_TTFT_SECONDS.labels(endpoint, tone_label(tone)).observe(elapsed)
+    return response.content.strip()
+
+
+# -----------------------------------------------------------
+# 2️⃣ 일괄 응답 (문장 제안 / 오타·문법 탐지)
+# -----------------------------------------------------------
+async def agenerate_suggestions(user_input: str, tone: str = "자동 감지"):
+    """비스트리밍 방식 문장 제안 (async, 동일 입력 동시 요청은 업스트림 1회로 병합)"""
+    with observe_request("suggest", tone):
+        cached = completion_cache.get(user_input, tone, "suggest")
+        if cached is not None:
+            return cached
+        match = await asyncio.to_thread(_semantic_lookup, "suggest", user_input, tone)
+        if match and match.completion is not None:
+            return match.completion
+        return await call_flight.do(
+            _flight_key("suggest", user_input, tone),
+            lambda: _agenerate_suggestions(user_input, tone, match),
+        )
+
+
+async def _agenerate_suggestions(user_input: str, tone: str, match=None):
+    try:
+        content = await _ainvoke("suggest", 0.7, user_input, tone)
+    except asyncio.TimeoutError:
+        return "[ERROR] 문장 제안 응답 없음 또는 시간 초과"
+    except PoolOverloaded:
+        raise  # 라우트에서 503/429
+    except Exception as e:
+        return f"[ERROR] 문장 제안 실패: {str(e)}"
+
+    if not content:
+        return "[ERROR] 문장 제안 응답 없음 또는 시간 초과"
+    completion_cache.put(user_input, tone, "suggest", content)
+    _semantic_store("suggest", user_input, tone, content, match)
+    return content
+
+
+async def adetect_errors(user_input: str, tone: str = "자동 감지", mode: str = None):
+    """오타·문법 탐지 및 수정 제안 (async) — 동기 엔진과 같은 문장 단위 증분 탐지 · 같은 문장 캐시"""
+    mode = mode if mode in DETECT_MODES else DETECT_MODE
+    with observe_request("detect", tone):
+        return await call_flight.do(
+            _flight_key("detect", user_input, tone) + (mode,),
+            lambda: _adetect_errors(user_input, tone, mode),
+        )
+
+
+async def _adetect_errors(user_input: str, tone: str, mode: str):
+    try:
+        return await incremental_detector.adetect(user_input, tone, _acheck_sentences, mode)
+    except DetectionFailed as e:
+        return e.result
+
+
+async def _acheck_sentences(sentences, tone: str, hints=None):
+    """문장 묶음을 한 번에 검사 (ai_handler._check_sentences의 async 버전)"""
+    try:
+        content = await _ainvoke("detect_batch", 0.5, _numbered(sentences, hints), tone)
+    except asyncio.TimeoutError:
+        content = None
+    except PoolOverloaded:
+        raise  # 라우트에서 503/429
+    except Exception as e:
+        raise DetectionFailed({"error": f"[ERROR] 오타·문법 탐지 실패: {str(e)}", "errors": []})
+    return split_batch_result(content, sentences)
+
+
+async def adetect_errors_stream(user_input: str, tone: str = "자동 감지", mode: str = None):
+    """오타·문법 탐지 (async 스트리밍) — ("item", error) … ("summary", 요약), ai_handler.detect_errors_stream과 같은 이벤트"""
+    mode = mode if mode in DETECT_MODES else DETECT_MODE
+    with observe_request("detect_stream", tone):
+        async for event in incremental_detector.adetect_stream(user_input, tone, _astream_sentences, mode):
+            yield event
+
+
+async def _astream_sentences(sentences, tone: str, hints=None):
+    """문장 묶음 검사 응답을 증분 파싱 → (문장 위치, error) … 마지막에 (None, 응답을 끝까지 받았는지)"""
+    llm = get_llm(temperature=0.5, streaming=True, feature="detect_batch")
+    formatted = _format_prompt("detect_batch", _numbered(sentences, hints), tone)
+    parser = ErrorObjectStream()
+    tokens = _astream_tokens("detect_stream", tone, llm, formatted)
+    try:
+        try:
+            await tokens.__anext__()  # 회로 차단 · 작업 풀 입장 확인 (첫 항목)
+        except PoolOverloaded:
+            yield None, False  # 남은 문장은 partial로 보고
+            return
+        async for content in tokens:
+            if content.startswith("[ERROR]:"):
+                break  # 회로 차단 · 마감 초과 · 업스트림 실패 → 남은 문장은 partial로 보고
+            for error in parser.feed(content):
+                index = _sentence_index(error, sentences)
+                if index is not None:
+                    yield index, {k: v for k, v in error.items() if k != "sentence"}
+    finally:
+        await tokens.aclose()
+    if not parser.complete or parser.malformed:
+        JSON_PARSE_FAILURES_TOTAL.inc()
+    yield None, parser.complete
+
+
+# -----------------------------------------------------------
+# 3️⃣ 실시간 스트리밍 (AI Cursor / 실시간 제안 / 스트리밍형 제안)
+# -----------------------------------------------------------
+async def astream_predict_text(user_input: str, tone: str = "자동 감지"):
+    """현재 입력 중인 문장을 실시간으로 이어서 예측 (async, 유명 구절은 색인에서 바로)"""
+    match = passage_index.lookup(user_input)
+    if match and match.strong:
+        continuation = match.continuation(user_input)
+        if continuation:
+            _count_passage("served")
+            with observe_request("predict", tone):
+                yield continuation
+            return
+    if match:
+        _count_passage("grounded")
+    async for token in _acached_stream("predict", user_input, tone, temperature=0.6, prefix=True,
+                                       reference=match.reference() if match else None):
+        yield token
+
+
+async def astream_generate_suggestions(user_input: str, tone: str = "자동 감지"):
+    """문체 분석 기반 실시간 문장 제안 (async)"""
+    async for token in _acached_stream("suggest_stream", user_input, tone, temperature=0.7):
+        yield token
+
+
+async def agenerate_suggestions_streamed(user_input: str, tone: str = "자동 감지"):
+    """일괄 문장 제안을 토큰 단위로 스트리밍 (async, 색인에서 찾은 관련 구절을 먼저 보냄)"""
+    match = passage_index.lookup(user_input)
+    # 관련 구절보다 먼저 작업 풀에 입장 → 거절은 첫 항목을 당길 때 바로 드러남
+    tokens = _acached_stream("suggest_streamed", user_input, tone, temperature=0.65,
+                             reference=match.reference() if match else None, semantic=True)
+    try:
+        try:
+            first = await tokens.__anext__()
+        except StopAsyncIteration:
+            first = None
+        if match:
+            _count_passage("grounded")
+            for line in match.related():
+                yield line
+                yield "\n"
+        if first is not None:
+            yield first
+        async for token in tokens:
+            yield token
+    finally:
+        await tokens.aclose()
@@ -1,71 +1,237 @@
+import json
+import os
+import re
 import threading
-from queue import Queue
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.callbacks import BaseCallbackHandler
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from llm_registry import DEFAULT_MODEL, get_llm, get_prompt, resolve_route, route_stats
+from completion_cache import CompletionCache, normalize_input
+from singleflight import Broadcast, SingleFlight, StreamFlight
+from incremental_detect import DETECT_MODES, IncrementalDetector, DetectionFailed
+from json_stream import ErrorObjectStream
+from local_checker import LocalChecker
+from passage_index import DEFAULT_CORPUS, PassageIndex
+from output_guard import guard_stats, make_guard
+from worker_pool import PoolOverloaded, WorkerPool, offload
+from scheduler import PriorityScheduler, estimate_tokens
+from context_window import ContextBuilder
+from resilience import Resilience, StreamRace
+from semantic_cache import SemanticCache
+from shared_cache import SharedStore
+from metrics import (
+    JSON_PARSE_FAILURES_TOTAL,
+    PROMPT_FORMAT_SECONDS,
+    SEMANTIC_LOOKUP_SECONDS,
+    TIMEOUTS_TOTAL,
+    UPSTREAM_TTFT_SECONDS,
+    WORKER_WAIT_SECONDS,
+    TokenTimer,
+    observe_request,
+    register_stats_provider,
+    tone_label,
+)
 
 """
 문맥필 / 글잇다 v2.4
 AI는 대신 쓰지 않는다. 사람의 사고를 확장시킨다.
 """
 
+# 워커 프로세스 간 공유 저장소 (SHARED_CACHE_PATH: serve.py로 여러 프로세스를 띄울 때)
+shared_store = SharedStore.from_env()
+
+# 완성 결과 캐시 (정확 일치 + AI Cursor 접두 일치, 메모리에 없으면 공유 저장소)
+completion_cache = CompletionCache(
+    max_entries=int(os.getenv("COMPLETION_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("COMPLETION_CACHE_TTL", "600")),
+    shared=shared_store,
+)
+
+# 의미 캐시 (SEMANTIC_CACHE=1: 정확 일치가 없을 때 뜻이 비슷한 이전 입력의 제안을 재사용)
+semantic_cache = SemanticCache.from_env(offload=offload)
+
+# 동일 (입력, 문체, 기능) 동시 요청 병합
+call_flight = SingleFlight()
+stream_flight = StreamFlight()
+
+# 업스트림 LLM 호출 공유 작업 풀 (기능별 동시 실행 한도 · 대기열 한도 · 대기 시간 한도)
+# SCHEDULER=priority(기본): 우선순위 등급 · 사용자별 공정성 · RPM/TPM 예산 순서로 꺼냄, fifo: 먼저 온 순서
+scheduler = PriorityScheduler.from_env() if os.getenv("SCHEDULER", "priority") == "priority" else None
+worker_pool = WorkerPool.from_env(queue=scheduler)
+
+
+# 유명 구절 색인 (애국가·시·속담 등은 LLM 없이 바로 이어 쓰기)
+PASSAGE_CORPUS = os.getenv("PASSAGE_CORPUS", os.path.join(os.path.dirname(__file__), DEFAULT_CORPUS))
+if os.path.exists(PASSAGE_CORPUS):
+    passage_index = PassageIndex.load(PASSAGE_CORPUS)
+else:
+    print(f"[경고] 구절 코퍼스를 찾을 수 없습니다: {PASSAGE_CORPUS}")
+    passage_index = PassageIndex()
+
+# 기능별 첫 토큰·전체 마감, 느린 첫 토큰에 대한 헤지 요청, 업스트림 경로(제공자:모델)별 회로 차단기
+# 탐지 스트림은 detect_batch 프롬프트의 경로를 쓴다
+_ROUTE_FEATURES = {"detect_stream": "detect_batch"}
+resilience = Resilience.from_env(
+    route_of=lambda feature: ":".join(filter(None, resolve_route(_ROUTE_FEATURES.get(feature, feature))))
+)
+_DEADLINE_ERRORS = {"ttft": "첫 토큰 응답 시간 초과", "total": "응답 시간 초과"}
+
+# 긴 글은 최근 문장 + 앞부분 요약으로 줄여 프롬프트에 넣음 (기능별 토큰 예산)
+context_builder = ContextBuilder.from_env(model=DEFAULT_MODEL)
+
+
+def _flight_key(feature: str, user_input: str, tone: str):
+    return (feature, normalize_input(user_input), tone)
+
+
+def _semantic_lookup(endpoint: str, user_input: str, tone: str):
+    """의미 캐시 조회 → SemanticMatch (꺼져 있으면 None)"""
+    if semantic_cache is None:
+        return None
+    started = time.perf_counter()
+    match = semantic_cache.lookup(user_input, tone, endpoint)
+    if match.vector is not None:
+        result = "hit" if match.completion is not None else "miss"
+        SEMANTIC_LOOKUP_SECONDS.labels(endpoint, result).observe(time.perf_counter() - started)
+    return match
+
+
+def _semantic_store(endpoint: str, user_input: str, tone: str, completion: str, match=None):
+    """새로 생성한 결과를 의미 캐시에 저장 (조회 때 만든 임베딩 재사용)"""
+    if semantic_cache is not None:
+        semantic_cache.put(user_input, tone, endpoint, completion, vector=match.vector if match else None)
+
+
+def _format_prompt(endpoint: str, user_input: str, tone: str, reference: str = None):
+    """프롬프트 포맷 (프롬프트 이름 = 엔드포인트 이름, 긴 입력은 문맥 창으로 줄임) + 소요 시간 기록"""
+    started = time.perf_counter()
+    input_text, tokens_before, tokens_after = context_builder.build(endpoint, user_input)
+    formatted = get_prompt(endpoint).format_messages(
+        input_text=input_text, tone=tone, reference=reference or "(없음)"
+    )
+    PROMPT_FORMAT_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+    context_builder.record(endpoint, tokens_before, tokens_after, _prompt_tokens(formatted))
+    return formatted
+
+
+def _prompt_tokens(formatted):
+    return context_builder.counter.count("".join(str(m.content) for m in formatted))
+
+
+def _upstream_cost(feature: str, formatted):
+    """스케줄러 예산에서 미리 뺄 예상 토큰 수 (프롬프트 + 평균 출력)"""
+    if scheduler is None:
+        return 0
+    return scheduler.estimate(feature, _prompt_tokens(formatted))
+
+
+def _record_output(feature: str, tokens: int):
+    if scheduler is not None:
+        scheduler.record_output(feature, tokens)
+
+
+def _invoke(endpoint: str, temperature: float, user_input: str, tone: str):
+    """
+    작업 풀에서 llm.invoke()를 실행하고 기능별 전체 마감(resilience)까지 기다린다.
+    최근 응답 시간의 p백분위를 넘기도록 끝나지 않으면 같은 호출을 한 번 더(헤지) 보내고 먼저 끝난 결과를 쓴다.
+    반환: {"content", "error"} — 둘 다 None이면 시간 초과
+    풀이 가득 찼거나 대기 시간을 넘겼거나 회로가 열려 있으면 PoolOverloaded (라우트에서 503/429).
+    """
+    result_container = {"content": None, "error": None}
+    label = tone_label(tone)
+    requested = time.perf_counter()
+
+    formatted = _format_prompt(endpoint, user_input, tone)
+    cost = _upstream_cost(endpoint, formatted)
+
+    def run_invoke(attempt):
+        if attempt == 0:
+            WORKER_WAIT_SECONDS.labels(endpoint, label).observe(time.perf_counter() - requested)
+        llm = get_llm(temperature=temperature, feature=endpoint)
+        started = time.perf_counter()
+        response = llm.invoke(formatted)
+        elapsed = time.perf_counter() - started
+        UPSTREAM_TTFT_SECONDS.labels(endpoint, label).observe(elapsed)
+        content = response.content.strip()
+        _record_output(endpoint, estimate_tokens(content))
+        return content, elapsed
+
+    resilience.admit(endpoint)
+    try:
+        futures = [worker_pool.submit(endpoint, run_invoke, 0, cost=cost)]
+    except PoolOverloaded:
+        resilience.record(endpoint, None)
+        raise
+    started = time.monotonic()
+    deadline = started + resilience.total_deadline(endpoint)
+    hedge_at = resilience.hedge_delay(endpoint)
+    pending, winner, error = set(futures), None, None
+    while pending and winner is None:
+        wake = deadline if hedge_at is None else min(deadline, started + hedge_at)
+        done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                winner = future
+                break
+            error = future.exception()
+        now = time.monotonic()
+        if winner is None and hedge_at is not None and now >= started + hedge_at:
+            hedge_at = None
+            if pending and resilience.try_hedge(endpoint):
+                try:
+                    futures.append(worker_pool.submit(endpoint, run_invoke, 1, cost=cost))
+                    pending.add(futures[-1])
+                except PoolOverloaded:
+                    pass
+        if now >= deadline:
+            break
+    # 대기 중인 호출은 취소 (실행 중인 호출은 끝날 때까지 풀 자리를 차지하므로 스레드가 무한히 쌓이지 않는다)
+    for future in pending:
+        future.cancel()
+
+    if winner is not None:
+        if winner is not futures[0]:
+            resilience.count(endpoint, "hedge_wins")
+        result_container["content"], elapsed = winner.result()
+        resilience.record(endpoint, True, elapsed)  # 헤지 지연 계산용 — 이긴 호출 자신의 응답 시간
+    elif isinstance(error, PoolOverloaded):
+        resilience.record(endpoint, None)  # 풀 거절은 업스트림 상태와 무관
+        raise error
+    elif error is not None:
+        result_container["error"] = str(error)
+        resilience.record(endpoint, False)
+    else:
+        TIMEOUTS_TOTAL.labels(endpoint).inc()
+        resilience.count(endpoint, "total_timeouts")
+        resilience.record(endpoint, False)
+    return result_container
+
+
 # -----------------------------------------------------------
 # 1️⃣ 다중 문장 제안 + 삽입 위치 설명 (일괄 응답)
 # -----------------------------------------------------------
 def generate_suggestions(user_input: str, tone: str = "자동 감지"):
-    """비스트리밍 방식 문장 제안"""
-    result_container = {"content": None, "error": None}
-
-    def run_invoke():
-        try:
-            llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.7)
-            prompt = ChatPromptTemplate.from_template("""
-당신은 글을 대신 쓰는 작가가 아닙니다.
-당신의 역할은 사용자가 현재 작성한 문장 조각에 이어 붙일 수 있는 등가적인 문장들을 제안하는 것입니다.
-
-요구사항:
-1. 등가적 문장 제안 (매우 중요):
-   - 입력된 문장 조각의 마지막 부분을 분석하세요.
-   - 그 조각에 자연스럽게 이어 붙일 수 있는 등가적인 문장들을 제안하세요.
-   - 모든 제안 문장은 같은 위치에 들어갈 수 있는 대안이어야 합니다.
-   - 문맥상 어울리지 않는 연결어(따라서, 그런데, 하지만 등)를 사용하지 마세요.
-   - 예시: "성능에" → "성능에 따라 달라질 수 있습니다", "성능에 영향을 미칩니다", "성능에 비례합니다" (등가적)
-   - 잘못된 예: "성능에 따라서~" (문맥상 어울리지 않음)
-
-2. 문맥 인식 및 관련 구절 추천:
-   - 유명한 문구, 시, 노래, 명언 등이 포함되어 있다면 그와 관련된 구절을 반드시 추천하세요.
-   - 애국가 구절이 나오면 → 애국가의 다른 구절을 자연스럽게 제안
-   - 특정 주제나 테마가 보이면 → 그 주제와 관련된 유명한 표현이나 구절 제안
-   - 역사적 맥락이 있으면 → 관련된 역사적 표현이나 문구 제안
-   - 시나 노래의 일부가 나오면 → 같은 작품의 다른 구절 제안
-
-3. 출력 형식:
-   - 2~3개의 등가적인 제안 문장을 제공합니다.
-   - 각 문장 앞에 번호를 붙이세요 (1., 2., 3.).
-   - 각 문장마다 '어디에 넣으면 자연스러운지' 간단히 설명하세요.
-
-4. 문체 유지:
-   - tone이 '자동 감지'이면 문체를 스스로 판단하세요.
-   - 원문의 문체와 톤을 일관되게 유지하세요.
-
-현재 문체 모드: {tone}
-
-입력 문장:
-{input_text}
-""")
-            formatted = prompt.format_messages(input_text=user_input, tone=tone)
-            response = llm.invoke(formatted)
-            result_container["content"] = response.content.strip()
-        except Exception as e:
-            result_container["error"] = str(e)
-
-    thread = threading.Thread(target=run_invoke)
-    thread.start()
-    thread.join(timeout=20)
+    """비스트리밍 방식 문장 제안 (동일 입력 동시 요청은 업스트림 1회로 병합)"""
+    with observe_request("suggest", tone):
+        cached = completion_cache.get(user_input, tone, "suggest")
+        if cached is not None:
+            return cached
+        match = _semantic_lookup("suggest", user_input, tone)
+        if match and match.completion is not None:
+            return match.completion
+        return call_flight.do(
+            _flight_key("suggest", user_input, tone),
+            lambda: _generate_suggestions(user_input, tone, match),
+        )
+
+
+def _generate_suggestions(user_input: str, tone: str, match=None):
+    result_container = _invoke("suggest", 0.7, user_input, tone)
 
     if result_container["error"]:
         return f"[ERROR] 문장 제안 실패: {result_container['error']}"
     elif result_container["content"]:
+        completion_cache.put(user_input, tone, "suggest", result_container["content"])
+        _semantic_store("suggest", user_input, tone, result_container["content"], match)
         return result_container["content"]
     else:
         return "[ERROR] 문장 제안 응답 없음 또는 시간 초과"
@@ -74,307 +240,457 @@ def generate_suggestions(user_input: str, tone: str = "자동 감지"):
 # -----------------------------------------------------------
 # 2️⃣ 오타·문법 탐지 및 수정 제안 (일괄 응답)
 # -----------------------------------------------------------
-def detect_errors(user_input: str, tone: str = "자동 감지"):
-    """오타·문법 탐지 및 수정 제안"""
-    result_container = {"content": None, "error": None}
+def parse_detect_content(content: str):
+    """탐지 응답에서 JSON 블록을 추출해 파싱, 실패 시 원본 텍스트를 요약으로 반환"""
+    try:
+        # JSON 블록 추출 시도
+        if "{" in content and "}" in content:
+            json_start = content.find("{")
+            json_end = content.rfind("}") + 1
+            return json.loads(content[json_start:json_end])
+        JSON_PARSE_FAILURES_TOTAL.inc()
+        return {"error": None, "errors": [], "summary": content}
+    except ValueError:
+        JSON_PARSE_FAILURES_TOTAL.inc()
+        # 잘리거나 일부가 깨진 응답에서도 온전히 닫힌 오류 객체는 살린다
+        parser = ErrorObjectStream()
+        errors = parser.feed(content)
+        if errors:
+            return {"error": None, "errors": errors, "summary": parser.summary or content}
+        return {"error": None, "errors": [], "summary": content}
+
+
+# 탐지 모드: llm(전부 업스트림, 기본) / hybrid(로컬 검사에서 의심 구간이 나온 문장만) / local(업스트림 없음)
+# hybrid · local은 요청의 mode나 DETECT_MODE로 명시했을 때만 (로컬 검사는 문법 · 문맥 오류를 못 본다)
+DETECT_MODE = os.getenv("DETECT_MODE", "llm")
+
+
+def detect_errors(user_input: str, tone: str = "자동 감지", mode: str = None):
+    """오타·문법 탐지 및 수정 제안 (동일 입력 동시 요청은 업스트림 1회로 병합)"""
+    mode = mode if mode in DETECT_MODES else DETECT_MODE
+    with observe_request("detect", tone):
+        return call_flight.do(
+            _flight_key("detect", user_input, tone) + (mode,),
+            lambda: _detect_errors(user_input, tone, mode),
+        )
+
+
+def _detect_errors(user_input: str, tone: str, mode: str = "llm"):
+    try:
+        return incremental_detector.detect(user_input, tone, mode)
+    except DetectionFailed as e:
+        return e.result
+
+
+def _hint_suffix(flags):
+    if not flags:
+        return ""
+    spans = ", ".join(f'"{flag["original"]}"' for flag in flags)
+    return f"  ⟨의심: {spans}⟩"
+
+
+def _numbered(sentences, hints=None):
+    """[번호] 문장 ⟨의심: ...⟩ 형식의 묶음 입력"""
+    hints = hints or [None] * len(sentences)
+    return "\n".join(
+        f"[{i}] {sentence}{_hint_suffix(flags)}" for i, (sentence, flags) in enumerate(zip(sentences, hints), 1)
+    )
 
-    def run_invoke():
-        try:
-            llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.5)
-            prompt = ChatPromptTemplate.from_template("""
-당신은 오타, 문법 오류, 문맥 오류를 탐지하고 수정 제안을 제공하는 전문가입니다.
-
-요구사항:
-1. 오타 탐지 (철저히):
-   - 철자 오류를 정확히 탐지하세요.
-   - 예시: "불벼함" → "불변함" (벼→변 오타)
-   - 예시: "보존하세" → "보전하세" (존→전 오타, 문맥상 올바른 단어)
-   - 자음/모음 오타, 비슷한 글자 혼동 등을 놓치지 마세요.
-
-2. 맞춤법 및 문법 오류:
-   - 띄어쓰기, 조사 사용, 어미 활용 등을 확인하세요.
-
-3. 문맥 오류 (매우 중요):
-   - 문맥에 맞지 않는 단어 사용을 반드시 탐지하세요.
-   - 유명한 문구나 고정된 표현이 있다면 정확한 원문을 기준으로 판단하세요.
-   - 예시: "대한사람 대한으로 길이 보존하세" → "보전하세"가 올바름 (국가의 공식 표현)
-   - 예시: "바람서리 불벼함은" → "불변함은"이 올바름 (불변함 = 변하지 않음)
-   - 원문의 의미와 문맥을 깊이 고려하여 올바른 단어를 제안하세요.
-
-4. 탐지 방법 (중요):
-   - 전체 문맥을 철저히 분석하세요.
-   - 각 단어가 문맥상 적절한지, 원문의 의도와 맞는지 확인하세요.
-   - 유명한 문구(국가, 시, 노래 등)는 정확한 원문을 기준으로 판단하세요.
-   - 비슷한 발음이나 의미의 단어가 잘못 사용되었는지 확인하세요.
-   - 오타가 있는지 철자 하나하나를 꼼꼼히 확인하세요.
-
-5. 출력 형식:
-   - 각 오류에 대해 원본 텍스트와 수정된 텍스트를 명확히 제시하세요.
-   - 오류 유형을 정확히 분류하세요: "오타", "맞춤법", "문법", "문맥오류"
-   - 오류 이유를 구체적으로 설명하세요 (예: "국가의 공식 표현에서 '보전하세'가 올바른 표현입니다")
-   - 오류가 없다면 "오류가 발견되지 않았습니다."라고 표시하세요.
-   - JSON 형식으로 반환: {{"errors": [{{"original": "원본 텍스트", "corrected": "수정된 텍스트", "type": "오타/맞춤법/문법/문맥오류", "reason": "구체적인 오류 이유"}}], "summary": "전체 요약"}}
-
-주의사항:
-- 작은 오타라도 놓치지 마세요.
-- 문맥상 잘못된 단어 사용은 반드시 지적하세요.
-- 유명한 문구의 경우 정확한 원문을 기준으로 판단하세요.
-
-현재 문체 모드: {tone}
-
-입력 문장:
-{input_text}
-""")
-            formatted = prompt.format_messages(input_text=user_input, tone=tone)
-            response = llm.invoke(formatted)
-            result_container["content"] = response.content.strip()
-        except Exception as e:
-            result_container["error"] = str(e)
 
-    thread = threading.Thread(target=run_invoke)
-    thread.start()
-    thread.join(timeout=20)
+def _check_sentences(sentences, tone: str, hints=None):
+    """새로 작성·수정된 문장 묶음을 한 번에 검사 → 문장별 오류 목록"""
+    result_container = _invoke("detect_batch", 0.5, _numbered(sentences, hints), tone)
 
     if result_container["error"]:
-        return {"error": f"[ERROR] 오타·문법 탐지 실패: {result_container['error']}", "errors": []}
-    elif result_container["content"]:
-        # JSON 파싱 시도, 실패 시 원본 텍스트 반환
+        raise DetectionFailed({"error": f"[ERROR] 오타·문법 탐지 실패: {result_container['error']}", "errors": []})
+    return split_batch_result(result_container["content"], sentences)
+
+
+def split_batch_result(content: str, sentences):
+    """묶음 검사 응답 → 문장별 오류 목록 (동기 · async 엔진 공용, 응답이 없거나 형식이 틀리면 DetectionFailed)"""
+    if not content:
+        raise DetectionFailed({"error": "[ERROR] 오타·문법 탐지 응답 없음 또는 시간 초과", "errors": []})
+
+    parsed = parse_detect_content(content)
+    if not isinstance(parsed.get("errors"), list):
+        raise DetectionFailed({"error": None, "errors": [], "summary": content})
+
+    per_sentence = [[] for _ in sentences]
+    for error in parsed["errors"]:
+        if not isinstance(error, dict):
+            continue
+        index = _sentence_index(error, sentences)
+        if index is None:
+            continue
+        error = {k: v for k, v in error.items() if k != "sentence"}
+        per_sentence[index].append(error)
+    return per_sentence
+
+
+def _sentence_index(error, sentences):
+    """오류가 속한 문장 위치 (번호가 없거나 틀리면 원본 텍스트로 찾음)"""
+    try:
+        index = int(error.get("sentence")) - 1
+        if 0 <= index < len(sentences):
+            return index
+    except (TypeError, ValueError):
+        pass
+    original = error.get("original") or ""
+    for index, sentence in enumerate(sentences):
+        if original and original in sentence:
+            return index
+    return None
+
+
+# 로컬 형태소 사전 검사 (kiwipiepy가 없으면 llm 모드로만 동작)
+local_checker = LocalChecker.from_env() if LocalChecker.available() else None
+
+# 문장 단위 증분 탐지 (수정된 문장만 업스트림으로)
+incremental_detector = IncrementalDetector(
+    _check_sentences,
+    max_batch_chars=int(os.getenv("DETECT_BATCH_CHARS", "1500")),
+    prefilter=(lambda sentences: offload(local_checker.check_many, sentences)) if local_checker else None,
+)
+
+
+def detect_errors_stream(user_input: str, tone: str = "자동 감지", mode: str = None, idle_tick: float = None):
+    """
+    오타·문법 탐지 (스트리밍) — ("item", error) 이벤트를 준비되는 대로, 마지막에 ("summary", 요약)
+    업스트림 JSON은 증분 파싱하므로 오류 객체가 닫히는 즉시 전달된다.
+    idle_tick초 동안 응답이 없으면 ("tick", None)을 내보낸다 (소비 측이 마감을 확인하고 닫을 수 있도록).
+    """
+    mode = mode if mode in DETECT_MODES else DETECT_MODE
+
+    def stream_batch(sentences, tone, hints=None):
+        return _stream_sentences(sentences, tone, hints, idle_tick=idle_tick)
+
+    with observe_request("detect_stream", tone):
+        yield from incremental_detector.detect_stream(user_input, tone, stream_batch, mode)
+
+
+def _stream_sentences(sentences, tone: str, hints=None, idle_tick: float = None):
+    """문장 묶음 검사 응답을 스트리밍으로 받아 (문장 위치, error)를 내보냄 → 완료 여부 반환 (유휴 중엔 None)"""
+    llm = get_llm(temperature=0.5, streaming=True, feature="detect_batch")
+    formatted = _format_prompt("detect_batch", _numbered(sentences, hints), tone)
+    parser = ErrorObjectStream()
+    chunks = Broadcast()
+
+    def run_stream():
+        if chunks.cancel.is_set():
+            chunks.finish()
+            return
+        timer = TokenTimer("detect_stream", tone)
+        stream = llm.stream(formatted)
         try:
-            import json
-            # JSON 블록 추출 시도
-            content = result_container["content"]
-            if "{" in content and "}" in content:
-                json_start = content.find("{")
-                json_end = content.rfind("}") + 1
-                json_str = content[json_start:json_end]
-                parsed = json.loads(json_str)
-                return parsed
-            else:
-                return {"error": None, "errors": [], "summary": content}
-        except:
-            return {"error": None, "errors": [], "summary": result_container["content"]}
-    else:
-        return {"error": "[ERROR] 오타·문법 탐지 응답 없음 또는 시간 초과", "errors": []}
+            for chunk in stream:
+                if not chunk.content:
+                    continue
+                timer.token()
+                if not chunks.publish(chunk.content):
+                    break
+        except Exception as e:
+            print(f"[경고] 오타·문법 탐지 스트림 실패: {e}")
+        finally:
+            stream.close()
+            timer.finish()
+            _record_output("detect_stream", timer.tokens)
+            chunks.finish()
+
+    try:
+        resilience.admit("detect_stream")
+    except PoolOverloaded:
+        return False  # 회로가 열려 있음 → 남은 문장은 partial로 보고
+    try:
+        _submit_stream("detect_stream", run_stream, chunks, cost=_upstream_cost("detect_stream", formatted))
+    except PoolOverloaded:
+        resilience.record("detect_stream", None)
+        return False  # 남은 문장은 partial로 보고
+
+    started = time.perf_counter()
+    ttft_deadline = resilience.ttft_deadline("detect_stream")
+    total_deadline = resilience.total_deadline("detect_stream")
+    ttft = ok = None
+    try:
+        for content in chunks.iter(idle=min(0.5, idle_tick or 0.5)):
+            elapsed = time.perf_counter() - started
+            if content and ttft is None:
+                ttft = elapsed
+            for error in parser.feed(content):
+                index = _sentence_index(error, sentences)
+                if index is not None:
+                    yield index, {k: v for k, v in error.items() if k != "sentence"}
+            if parser.complete:
+                ok = True
+                break
+            late_first = ttft is None and ttft_deadline and elapsed > ttft_deadline
+            if late_first or elapsed > total_deadline:
+                TIMEOUTS_TOTAL.labels("detect_stream").inc()
+                resilience.count("detect_stream", "ttft_timeouts" if late_first else "total_timeouts")
+                ok = False
+                break
+            if not content and idle_tick:
+                yield None
+        else:
+            ok = parser.complete
+    finally:
+        chunks.cancel.set()  # 작업 스레드가 다음 청크에서 업스트림을 닫음
+        resilience.record("detect_stream", ok, ttft)
+    if not parser.complete or parser.malformed:
+        JSON_PARSE_FAILURES_TOTAL.inc()
+    return parser.complete
 
 
 # -----------------------------------------------------------
-# 4️⃣ 실시간 예측 (AI Cursor) — ✅ 중복 토큰 버그 수정됨
+# 3️⃣ 스트리밍 공통 처리 — 요청 병합 + 연결 종료 시 업스트림 생성 중단
 # -----------------------------------------------------------
-def stream_predict_text(user_input: str, tone: str = "자동 감지"):
-    """현재 입력 중인 문장을 실시간으로 이어서 예측"""
-
-    class StreamHandler(BaseCallbackHandler):
-        def __init__(self, queue: Queue):
-            self.queue = queue
-        def on_llm_new_token(self, token: str, **kwargs):
-            # 토큰을 실시간으로 전송 (중복 제거)
-            self.queue.put(token)
-        def on_llm_end(self, *args, **kwargs):
-            self.queue.put("[DONE]")
-        def on_llm_error(self, error: Exception, **kwargs):
-            self.queue.put(f"[ERROR]: {str(error)}")
-            self.queue.put("[DONE]")
-
-    q = Queue()
-    handler = StreamHandler(q)
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0.6,
-        streaming=True,
-        callbacks=[handler],
-    )
+_stats_lock = threading.Lock()
+_generation_stats = {}  # feature -> {"completed", "cancelled", "failed", "rejected", "timed_out"}
 
-    prompt = ChatPromptTemplate.from_template("""
-당신은 글을 대신 쓰지 않습니다.
-현재 사용자가 작성 중인 문맥을 바탕으로, 다음에 자연스럽게 이어질 문장 조각을 예측하세요.
 
-현재 문체 모드: {tone}
-입력 문장:
-{input_text}
+def _count_generation(feature: str, outcome: str):
+    with _stats_lock:
+        stats = _generation_stats.setdefault(
+            feature, {"completed": 0, "cancelled": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+        )
+        stats[outcome] += 1
 
-요청:
-- 완성형 문장이 아니라 자연스럽게 이어지는 조각으로 제안
-- tone을 유지하고 문맥을 끊지 말 것
-""")
-    formatted = prompt.format_messages(input_text=user_input, tone=tone)
 
-    def run_model():
-        try:
-            # ✅ BaseCallbackHandler가 이미 토큰 전송 처리 → 루프는 단순 실행만
-            for _ in llm.stream(formatted):
-                pass
-            q.put("[DONE]")
-        except Exception as e:
-            q.put(f"[ERROR]: {str(e)}")
-            q.put("[DONE]")
+_passage_stats = {"served": 0, "grounded": 0}  # 색인으로 바로 응답 / 프롬프트 근거로 사용
 
-    threading.Thread(target=run_model, daemon=True).start()
 
-    while True:
-        token = q.get()
-        if token == "[DONE]":
-            break
-        yield token
+def _count_passage(outcome: str):
+    with _stats_lock:
+        _passage_stats[outcome] += 1
 
 
-# -----------------------------------------------------------
-# 5️⃣ 실시간 문장 제안 (SSE)
-# -----------------------------------------------------------
-def stream_generate_suggestions(user_input: str, tone: str = "자동 감지"):
-    """문체 분석 기반 실시간 문장 제안"""
-    class StreamHandler(BaseCallbackHandler):
-        def __init__(self, queue: Queue):
-            self.queue = queue
-        def on_llm_new_token(self, token: str, **kwargs):
-            self.queue.put(token)
-        def on_llm_end(self, *args, **kwargs):
-            self.queue.put("[DONE]")
-        def on_llm_error(self, error: Exception, **kwargs):
-            self.queue.put(f"[ERROR]: {str(error)}")
-            self.queue.put("[DONE]")
-
-    q = Queue()
-    handler = StreamHandler(q)
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0.7,
-        streaming=True,
-        callbacks=[handler],
-    )
+def get_generation_stats():
+    """기능별 완료/취소/실패 생성 횟수 스냅샷"""
+    with _stats_lock:
+        return {feature: dict(stats) for feature, stats in _generation_stats.items()}
+
+
+def _start_generation(feature: str, tone: str, llm, formatted, broadcast, callbacks=None, on_complete=None,
+                      guard=None):
+    """
+    백그라운드 스레드에서 llm.stream()을 실행하고 토큰을 broadcast에 게시한다.
+    구독자(SSE 연결)가 모두 떠나면 broadcast.cancel이 설정되고,
+    생산 스레드는 다음 청크에서 업스트림 스트림을 닫고 종료한다.
+    callbacks는 요청 단위 config로 전달되므로 공유 클라이언트를 다시 만들지 않는다.
+    on_complete는 생성이 끝까지 완료된 경우에만 전체 텍스트로 호출된다.
+    guard(output_guard)가 있으면 토큰을 거른 텍스트만 게시하고, 출력 계약이 채워지면
+    그 자리에서 업스트림을 닫는다 (정상 완료로 집계 · 캐시).
+    첫 토큰이 늦으면 같은 생성을 한 번 더(헤지) 보내 먼저 토큰을 받은 쪽만 게시하고,
+    기능별 첫 토큰·전체 마감을 넘기면 "[ERROR]" 토큰으로 스트림을 끝낸다 (resilience).
+    회로가 열려 있으면 PoolOverloaded(circuit_open)를 바로 던진다.
+    """
+    requested = time.perf_counter()
+    cost = _upstream_cost(feature, formatted)
 
-    prompt = ChatPromptTemplate.from_template("""
-당신은 글을 대신 쓰는 작가가 아닙니다.
-사용자가 현재 입력 중인 문장을 완성하는 데 도움을 주는 역할입니다.
-
-요구사항:
-1. 완성된 문장 제안 (매우 중요):
-   - 사용자가 입력 중인 문장 조각을 분석하세요.
-   - 그 조각을 자연스럽게 완성할 수 있는 하나의 완성된 문장을 제안하세요.
-   - 절대 번호(1., 2., 3. 등)를 붙이지 마세요.
-   - 절대 여러 문장을 나열하지 마세요.
-   - 하나의 완성된 문장만 제안하세요.
-   - 문맥상 어울리지 않는 연결어를 사용하지 마세요.
-
-2. 문맥 인식 및 관련 구절 추천:
-   - 유명한 문구, 시, 노래, 명언 등이 포함되어 있다면 그와 관련된 구절을 반드시 추천하세요.
-   - 애국가 구절이 나오면 → 애국가의 다른 구절을 자연스럽게 제안
-   - 특정 주제나 테마가 보이면 → 그 주제와 관련된 유명한 표현이나 구절 제안
-   - 역사적 맥락이 있으면 → 관련된 역사적 표현이나 문구 제안
-   - 시나 노래의 일부가 나오면 → 같은 작품의 다른 구절 제안
-
-3. 출력 형식 (엄격히 준수):
-   - 번호(1., 2., 3. 등)를 절대 사용하지 마세요.
-   - 하나의 완성된 문장만 출력하세요.
-   - 불필요한 설명, 부가 설명, 줄바꿈 없이 문장만 제시하세요.
-   - 여러 문장을 제안하지 마세요.
-
-4. 문체 유지:
-   - tone이 '자동 감지'이면 문체를 스스로 판단하세요.
-   - 원문의 문체와 톤을 일관되게 유지하세요.
-
-주의사항:
-- 번호를 사용하면 안 됩니다.
-- 여러 문장을 나열하면 안 됩니다.
-- 하나의 완성된 문장만 제안하세요.
-
-현재 문체 모드: {tone}
-입력 문장:
-{input_text}
-""")
-    formatted = prompt.format_messages(input_text=user_input, tone=tone)
+    def expire(reason):
+        TIMEOUTS_TOTAL.labels(feature).inc()
+        _count_generation(feature, "timed_out")
+        broadcast.publish(f"[ERROR]: {_DEADLINE_ERRORS[reason]}")
+        broadcast.finish()
 
     def run_model():
+        attempt = race.begin()
+        if attempt == 0:
+            WORKER_WAIT_SECONDS.labels(feature, tone_label(tone)).observe(time.perf_counter() - requested)
+        elif not race.pending():
+            race.leave(attempt, None)  # 헤지가 실행되기 전에 원 요청이 토큰을 받음 → 호출 생략
+            return
+        if broadcast.cancel.is_set():
+            # 대기열에 있는 동안 구독자가 모두 떠남 → 업스트림 호출 생략
+            if race.leave(attempt, None):
+                _count_generation(feature, "cancelled")
+                broadcast.finish()
+            return
+        outcome = "completed"
+        won = False
+        error = None
+        pieces = []
+        received = 0
+        timer = TokenTimer(feature, tone)
+        stream = llm.stream(formatted, config={"callbacks": callbacks} if callbacks else None)
         try:
-            for _ in llm.stream(formatted):
-                pass
-            q.put("[DONE]")
+            for chunk in stream:
+                # ✅ 청크 내용만 전달 (콜백을 함께 쓰면 토큰이 중복됨)
+                if not chunk.content:
+                    continue
+                if not race.claim(attempt):
+                    outcome = "cancelled"  # 다른 시도가 먼저 토큰을 받았거나 마감 초과
+                    break
+                won = True
+                timer.token()
+                received += 1
+                text, stop = guard.feed(chunk.content) if guard else (chunk.content, False)
+                if text:
+                    pieces.append(text)
+                    if not broadcast.publish(text):
+                        outcome = "cancelled"
+                        break
+                if stop:
+                    break  # 출력 계약 충족 → 나머지 토큰은 받지 않음
         except Exception as e:
-            q.put(f"[ERROR]: {str(e)}")
-            q.put("[DONE]")
+            outcome = "cancelled" if broadcast.cancel.is_set() else "failed"
+            error = e
+        finally:
+            stream.close()  # 업스트림 HTTP 응답 해제
+            timer.finish()
+            _record_output(feature, received)
+            ok = {"completed": True, "failed": False}.get(outcome)
+            # 이 시도가 스트림을 끝낼 차례인지 (진 시도 · 마감 초과로 이미 닫힌 경우는 아님)
+            if race.settle(ok) if won else race.leave(attempt, ok):
+                if guard:
+                    rest = guard.finish() if outcome == "completed" else ""
+                    if rest:
+                        pieces.append(rest)
+                        broadcast.publish(rest)
+                    guard_stats.record(feature, guard, received)
+                if error is not None:
+                    broadcast.publish(f"[ERROR]: {str(error)}")
+                _count_generation(feature, outcome)
+                if outcome == "completed" and on_complete:
+                    on_complete("".join(pieces))
+                broadcast.finish()
+
+    race = StreamRace(resilience, feature, lambda: worker_pool.submit(feature, run_model, cost=cost), expire)
+    resilience.admit(feature)
+    try:
+        _submit_stream(feature, run_model, broadcast, cost=cost)
+    except PoolOverloaded:
+        resilience.record(feature, None)
+        raise
+
+
+def _submit_stream(feature: str, run, broadcast, cost: int = 0):
+    """
+    스트리밍 생성을 작업 풀에 넣는다 (가득 차 있으면 PoolOverloaded를 바로 던짐).
+    대기 시간을 넘겨 실행되지 못하면 구독자에게 오류 토큰을 보내고 스트림을 닫는다.
+    """
+    def expired(future):
+        error = None if future.cancelled() else future.exception()
+        if isinstance(error, PoolOverloaded):
+            _count_generation(feature, "rejected")
+            broadcast.publish(f"[ERROR]: {error}")
+            broadcast.finish()
+
+    worker_pool.submit(feature, run, cost=cost).add_done_callback(expired)
+
+
+def _replay(text: str):
+    """캐시된 텍스트를 줄 단위 토큰으로 재생 (줄바꿈은 LLM 토큰처럼 별도 토큰)"""
+    for piece in re.split(r"(\n)", text):
+        if piece:
+            yield piece
+
+
+def _cached_stream(endpoint: str, user_input: str, tone: str, temperature: float, prefix: bool = False,
+                   reference: str = None, idle_tick: float = None, semantic: bool = False):
+    """
+    완성 캐시를 먼저 확인하고(적중 시 프롬프트 포맷·LLM 호출 모두 생략),
+    없으면 진행 중인 동일 생성에 합류하거나 새로 시작하고 결과를 캐시에 저장.
+    semantic=True면 정확 일치 실패 시 의미 캐시도 확인한다.
+    프롬프트 이름 = 엔드포인트 이름. reference는 프롬프트에 넣을 구절 색인 근거.
+    idle_tick초 동안 토큰이 없으면 빈 문자열을 내보낸다 (sse.SSEWriter 프레임 모으기용).
+    """
+    with observe_request(endpoint, tone):
+        cached = completion_cache.get(user_input, tone, endpoint, prefix=prefix)
+        if cached is not None:
+            yield from _replay(cached)
+            return
+        match = _semantic_lookup(endpoint, user_input, tone) if semantic else None
+        if match and match.completion is not None:
+            yield from _replay(match.completion)
+            return
+
+        def store(text):
+            completion_cache.put(user_input, tone, endpoint, text)
+            if semantic:
+                _semantic_store(endpoint, user_input, tone, text, match)
+
+        def start(broadcast):
+            llm = get_llm(temperature=temperature, streaming=True, feature=endpoint)
+            formatted = _format_prompt(endpoint, user_input, tone, reference)
+            _start_generation(endpoint, tone, llm, formatted, broadcast, on_complete=store,
+                              guard=make_guard(endpoint))
+
+        # 같은 입력의 생성이 진행 중이면 합류 (이미 나온 토큰은 재생)
+        yield from stream_flight.stream(_flight_key(endpoint, user_input, tone), start, idle=idle_tick)
 
-    threading.Thread(target=run_model, daemon=True).start()
 
-    while True:
-        token = q.get()
-        if token == "[DONE]":
-            break
-        yield token
+# -----------------------------------------------------------
+# 4️⃣ 실시간 예측 (AI Cursor) — ✅ 중복 토큰 버그 수정됨
+# -----------------------------------------------------------
+def stream_predict_text(user_input: str, tone: str = "자동 감지", idle_tick: float = None):
+    """현재 입력 중인 문장을 실시간으로 이어서 예측 (유명 구절은 색인에서 바로)"""
+    match = passage_index.lookup(user_input)
+    if match and match.strong:
+        continuation = match.continuation(user_input)
+        if continuation:
+            _count_passage("served")
+            with observe_request("predict", tone):
+                yield continuation
+            return
+    if match:
+        _count_passage("grounded")
+    yield from _cached_stream("predict", user_input, tone, temperature=0.6, prefix=True,
+                              reference=match.reference() if match else None, idle_tick=idle_tick)
 
 
 # -----------------------------------------------------------
-# 6️⃣ 문장 제안 (스트리밍형)
+# 5️⃣ 실시간 문장 제안 (SSE)
 # -----------------------------------------------------------
-def generate_suggestions_streamed(user_input: str, tone: str = "자동 감지"):
-    """일괄 문장 제안을 토큰 단위로 스트리밍"""
-    class StreamHandler(BaseCallbackHandler):
-        def __init__(self, queue: Queue):
-            self.queue = queue
-        def on_llm_new_token(self, token: str, **kwargs):
-            self.queue.put(token)
-        def on_llm_end(self, *args, **kwargs):
-            self.queue.put("[DONE]")
-        def on_llm_error(self, error: Exception, **kwargs):
-            self.queue.put(f"[ERROR]: {str(error)}")
-            self.queue.put("[DONE]")
-
-    q = Queue()
-    handler = StreamHandler(q)
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0.65,
-        streaming=True,
-        callbacks=[handler],
-    )
+def stream_generate_suggestions(user_input: str, tone: str = "자동 감지", idle_tick: float = None):
+    """문체 분석 기반 실시간 문장 제안"""
+    yield from _cached_stream("suggest_stream", user_input, tone, temperature=0.7, idle_tick=idle_tick)
 
-    prompt = ChatPromptTemplate.from_template("""
-당신은 글쓰기 코치이자 문장 제안 전문가입니다.
-입력된 문장을 분석하고, 그 문장을 보완하거나 확장할 수 있는 문장을 제안하세요.
-
-요구사항:
-1. 문맥 인식 및 관련 구절 추천 (매우 중요):
-   - 입력 문장의 문맥을 깊이 분석하세요.
-   - 유명한 문구, 시, 노래, 명언 등이 포함되어 있다면 그와 관련된 구절을 반드시 추천하세요.
-   
-   구체적 예시:
-   - 애국가 구절이 나오면 → 애국가의 다른 구절을 자연스럽게 제안
-     * 예: "동해물과 백두산이 마르고 닳도록" → "무궁화 삼천리 화려강산", "남산 위에 저 소나무 철갑을 두른 듯" 등 애국가의 다른 구절 제안
-     * 예: "대한사람 대한으로 길이 보전하세" → "가을 하늘 공활한데 높고 구름 없이", "이 기상과 이 맘으로 충성을 다하여" 등 제안
-   - 특정 주제나 테마가 보이면 → 그 주제와 관련된 유명한 표현이나 구절 제안
-   - 역사적 맥락이 있으면 → 관련된 역사적 표현이나 문구 제안
-   - 시나 노래의 일부가 나오면 → 같은 작품의 다른 구절 제안
-   
-   중요: 유명한 문구를 인식했다면 반드시 그와 관련된 구절을 우선적으로 제안하세요.
-
-2. 일반 문장 제안:
-   - 문맥상 유명한 구절이 없다면, 입력된 문장을 보완하거나 확장할 수 있는 문장을 제안하세요.
-   - 2~3개의 문장을 생성합니다.
-
-3. 출력 형식:
-   - 각 문장은 한 줄마다 구분되게 하세요.
-
-4. 문체 유지:
-   - tone이 '자동 감지'이면 문체를 스스로 판단하세요.
-   - 원문의 문체와 톤을 일관되게 유지하세요.
-
-현재 문체 모드: {tone}
-입력 문장:
-{input_text}
-""")
-    formatted = prompt.format_messages(input_text=user_input, tone=tone)
 
-    def run_model():
-        try:
-            for _ in llm.stream(formatted):
-                pass
-            q.put("[DONE]")
-        except Exception as e:
-            q.put(f"[ERROR]: {str(e)}")
-            q.put("[DONE]")
+# -----------------------------------------------------------
+# 6️⃣ 문장 제안 (스트리밍형)
+# -----------------------------------------------------------
+def generate_suggestions_streamed(user_input: str, tone: str = "자동 감지", idle_tick: float = None):
+    """일괄 문장 제안을 토큰 단위로 스트리밍 (색인에서 찾은 관련 구절을 먼저 보냄)"""
+    match = passage_index.lookup(user_input)
+    # 관련 구절보다 먼저 작업 풀에 입장 → 거절은 첫 항목을 당길 때 바로 드러남
+    tokens = _cached_stream("suggest_streamed", user_input, tone, temperature=0.65,
+                            reference=match.reference() if match else None, idle_tick=idle_tick, semantic=True)
+    try:
+        first = next(tokens, None)
+        if match:
+            _count_passage("grounded")
+            for line in match.related():
+                yield line
+                yield "\n"
+        if first is not None:
+            yield first
+        yield from tokens
+    finally:
+        tokens.close()
 
-    threading.Thread(target=run_model, daemon=True).start()
 
-    while True:
-        token = q.get()
-        if token == "[DONE]":
-            break
-        yield token
+# -----------------------------------------------------------
+# 7️⃣ 운영 통계
+# -----------------------------------------------------------
+def get_stats():
+    """생성 결과, 캐시, 요청 병합 통계를 한 번에 반환 (/stats)"""
+    return {
+        "generations": get_generation_stats(),
+        "completion_cache": completion_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else {"enabled": False},
+        "shared_store": dict(shared_store.stats(), pid=os.getpid()) if shared_store else {"enabled": False},
+        "incremental_detect": incremental_detector.stats(),
+        "passage_index": dict(passage_index.stats(), **_passage_stats),
+        "output_guard": guard_stats.snapshot(),
+        "worker_pool": worker_pool.stats(),
+        "context_window": context_builder.stats(),
+        "models": route_stats(),
+        "resilience": resilience.stats(),
+        "single_flight": {
+            "calls": call_flight.stats(),
+            "streams": stream_flight.stats(),
+        },
+    }
+
+
+register_stats_provider(get_stats)
@@ -1,15 +1,35 @@
+if __name__ == "__main__":
+    # 스크립트로 실행하면 다른 모듈을 불러오기 전에 patch — 모듈 수준에서 만드는 락 · 조건 변수(작업 풀,
+    # 스케줄러, 복원력 타이머, 캐시)가 gevent 것이어야 greenlet끼리 나눠 쓸 수 있다 (serve.py의 워커와 같은 순서)
+    from gevent.monkey import patch_all
+
+    patch_all()
+
 from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
+import json
 import os
-import sys
 from ai_handler import (
     stream_predict_text,
     stream_generate_suggestions,
     generate_suggestions,
     detect_errors,
+    context_builder,
+    detect_errors_stream,
     generate_suggestions_streamed,  # ✅ 새 함수 추가
+    get_stats,
+    local_checker,
+    semantic_cache,
+    shared_store,
 )
+from assist import assist_stream, channel_pool
+from session_store import InputStore, DEFAULT_TONE
+from sse import DONE, ResumeBuffer, SSEWriter, encode_event, sse_stats
+from worker_pool import PoolOverloaded, admit_eagerly
+from scheduler import current_user
+from llm_registry import warmup as warmup_llm_clients
+from metrics import render_latest
 
 # ------------------------------------------------------------
 # 환경 변수 로드
@@ -23,42 +43,150 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     print("[경고] OPENAI_API_KEY가 .env에서 감지되지 않았습니다.")
 
+# 공유 LLM 클라이언트를 미리 생성 → 첫 요청에서 클라이언트 생성 비용 제거
+try:
+    warmup_llm_clients()
+except Exception as e:
+    print(f"[경고] LLM 클라이언트 초기화 실패: {e}")
+
+# 형태소 분석기(로컬 오타 사전 검사) 미리 로드
+if local_checker:
+    local_checker.warmup()
+
+# 프롬프트 토큰 계산용 토크나이저 미리 로드
+context_builder.warmup()
+
+# 의미 캐시 임베딩 모델 미리 로드 (SEMANTIC_CACHE=1일 때)
+if semantic_cache:
+    semantic_cache.warmup()
+
 
 # ------------------------------------------------------------
-# 1️⃣ 최신 입력 데이터 임시 저장
+# 1️⃣ 세션별 입력 저장 (동시 사용자 간 입력 덮어쓰기 방지)
 # ------------------------------------------------------------
-latest_input = {"message": "", "tone": "자동 감지"}
+input_store = InputStore(ttl=float(os.getenv("INPUT_TTL_SECONDS", "300")), shared=shared_store)
+
+# 재연결(Last-Event-ID) 시 놓친 부분을 다시 보내기 위한 최근 스트림 텍스트
+resume_buffer = ResumeBuffer(ttl=float(os.getenv("SSE_RESUME_TTL", "120")))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Transfer-Encoding": "chunked",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*",
+}
+
+
+def _request_data():
+    """요청 본문 JSON (text/plain으로 보내도 파싱 → CORS preflight 왕복 생략 가능)"""
+    return request.get_json(force=True, silent=True) or {}
+
+
+def _session_key(data=None):
+    """클라이언트가 보낸 세션 토큰 (쿼리 > 헤더 > 본문) — 없으면 None"""
+    return (
+        request.args.get("session_id")
+        or request.headers.get("X-Session-Id")
+        or (data or {}).get("session_id")
+    )
+
+
+@app.before_request
+def _bind_user():
+    """
+    스케줄러의 사용자별 공정성 단위 = 세션 토큰, 없으면 클라이언트 주소.
+    주소는 공정성에만 쓴다 (NAT · 프록시 뒤 사용자들이 같은 주소 → 세션 키로 쓰면 입력이 서로 덮어써짐).
+    """
+    session_id = _session_key(_request_data() if request.method == "POST" else None)
+    current_user.set(session_id or f"addr:{request.remote_addr}")
+
+
+def _stream_input():
+    """POST면 본문에서 바로, GET이면 세션 저장소에서 입력을 읽는다"""
+    if request.method == "POST":
+        data = _request_data()
+        return data.get("message", ""), data.get("tone", DEFAULT_TONE)
+    stored = input_store.get(_session_key())  # 토큰 없는 GET은 다른 사용자의 입력을 읽지 않도록 404
+    if stored is None:
+        return None
+    return stored["message"], stored["tone"]
+
+
+def _sse_response(stream_fn, user_input):
+    """
+    스트림 함수 결과를 SSE 응답으로 변환 (sse.SSEWriter — 기본 compact: 15ms 단위로 토큰을 모아 전송).
+    ?framing=legacy면 토큰 하나당 프레임 하나인 기존 방식.
+    재연결한 클라이언트는 Last-Event-ID로 놓친 부분부터 이어받는다 (끝난 스트림이면 보관된 텍스트만).
+    클라이언트가 연결을 끊으면 WSGI 서버가 프레임 제너레이터를 닫고,
+    작성기가 토큰 이터레이터도 닫아 ai_handler 쪽 업스트림 생성을 취소한다.
+    """
+    writer = SSEWriter.from_env(framing=request.args.get("framing"), resume=resume_buffer)
+    last_event_id = request.headers.get("Last-Event-ID")
+    # 이미 끝난 스트림의 재연결이면 보관된 텍스트만 다시 보냄 (생성을 새로 시작하지 않는다)
+    replay = writer.replay(last_event_id)
+    if replay is not None:
+        return Response(replay, mimetype="text/event-stream", headers=SSE_HEADERS)
+    # 작업 풀 입장을 먼저 확인 → 과부하면 스트림 대신 503/429 (overloaded 핸들러)
+    tokens = admit_eagerly(stream_fn(*user_input, idle_tick=writer.idle_tick))
+    frames = writer.stream(tokens, last_event_id=last_event_id)
+    return Response(frames, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def _sse_event_response(events):
+    """
+    (이벤트 이름, 페이로드) 이터레이터를 이름 있는 SSE 이벤트로 변환
+    → "event: item\ndata: {...}\n\n" ... "data: [DONE]\n\n"
+    """
+    def generate():
+        try:
+            for event, payload in events:
+                yield encode_event(json.dumps(payload, ensure_ascii=False), event=event)
+            yield encode_event(DONE)
+        finally:
+            close = getattr(events, "close", None)
+            if close:
+                close()
+
+    return Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.errorhandler(PoolOverloaded)
+def overloaded(e):
+    """작업 풀 거절 → 즉시 503(전체 포화)/429(기능별 한도) + Retry-After"""
+    response = jsonify({"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def _session_not_found():
+    return jsonify({"error": "세션 입력이 없거나 만료되었습니다. /stream으로 다시 전송하고 "
+                             "받은 session_id로 요청하세요."}), 404
 
 
 @app.route("/stream", methods=["POST"])
 def stream_post():
-    """React에서 입력 데이터를 받아 저장"""
-    data = request.json or {}
-    latest_input["message"] = data.get("message", "")
-    latest_input["tone"] = data.get("tone", "자동 감지")
-    return jsonify({"status": "ready"})
+    """React에서 입력 데이터를 받아 세션별로 저장 (GET 스트리밍 경로 호환용, 토큰이 없으면 새로 발급)"""
+    data = _request_data()
+    session_id = input_store.put(
+        _session_key(data),
+        data.get("message", ""),
+        data.get("tone", DEFAULT_TONE),
+    )
+    return jsonify({"status": "ready", "session_id": session_id})
 
 
 # ------------------------------------------------------------
 # 2️⃣ 실시간 예측 (AI Cursor)
 # ------------------------------------------------------------
-@app.route("/stream-events", methods=["GET"])
+@app.route("/stream-events", methods=["GET", "POST"])
 def stream_events():
-    """문장 입력 중 실시간 예측 스트리밍"""
-    def generate():
-        for token in stream_predict_text(latest_input["message"], latest_input["tone"]):
-            yield f"data: {token}\n\n"
-            sys.stdout.flush()
-        yield "data: [DONE]\n\n"
-        sys.stdout.flush()
-
-    return Response(generate(), mimetype="text/event-stream", headers={
-        "Cache-Control": "no-cache",
-        "X-Accel-Buffering": "no",
-        "Transfer-Encoding": "chunked",
-        "Connection": "keep-alive",
-        "Access-Control-Allow-Origin": "*",
-    })
+    """문장 입력 중 실시간 예측 스트리밍 (POST: 입력 전송 + 스트리밍을 한 번에)"""
+    user_input = _stream_input()
+    if user_input is None:
+        return _session_not_found()
+    return _sse_response(stream_predict_text, user_input)
 
 
 # ------------------------------------------------------------
@@ -67,9 +195,9 @@ def stream_events():
 @app.route("/suggest", methods=["POST"])
 def suggest():
     """문장 제안 (일괄 응답)"""
-    data = request.json or {}
+    data = _request_data()
     user_input = data.get("message", "")
-    tone = data.get("tone", "자동 감지")
+    tone = data.get("tone", DEFAULT_TONE)
 
     suggestions = generate_suggestions(user_input, tone)
     return jsonify({
@@ -80,23 +208,13 @@ def suggest():
 # ------------------------------------------------------------
 # 4️⃣ 실시간 문장 제안 (SSE) - 문장 번호 부여
 # ------------------------------------------------------------
-@app.route("/suggest-stream", methods=["GET"])
+@app.route("/suggest-stream", methods=["GET", "POST"])
 def suggest_stream():
     """문장 제안 (SSE) - 문장 번호 및 가독성 강화"""
-    def generate():
-        for token in stream_generate_suggestions(latest_input["message"], latest_input["tone"]):
-            yield f"data: {token}\n\n"
-            sys.stdout.flush()
-        yield "data: [DONE]\n\n"
-        sys.stdout.flush()
-
-    return Response(generate(), mimetype="text/event-stream", headers={
-        "Cache-Control": "no-cache",
-        "X-Accel-Buffering": "no",
-        "Transfer-Encoding": "chunked",
-        "Connection": "keep-alive",
-        "Access-Control-Allow-Origin": "*",
-    })
+    user_input = _stream_input()
+    if user_input is None:
+        return _session_not_found()
+    return _sse_response(stream_generate_suggestions, user_input)
 
 
 # ------------------------------------------------------------
@@ -105,49 +223,100 @@ def suggest_stream():
 @app.route("/detect", methods=["POST"])
 def detect():
     """오타·문법 탐지 및 수정 제안"""
-    data = request.json or {}
+    data = _request_data()
     user_input = data.get("message", "")
-    tone = data.get("tone", "자동 감지")
+    tone = data.get("tone", DEFAULT_TONE)
 
-    result = detect_errors(user_input, tone)
+    # mode: llm / hybrid / local (생략 시 DETECT_MODE 환경 변수)
+    result = detect_errors(user_input, tone, data.get("mode"))
     return jsonify(result)
 
 
+@app.route("/detect-stream", methods=["POST"])
+def detect_stream():
+    """
+    오타·문법 탐지 (스트리밍)
+    event: item    → 오류 객체 하나 ({"original", "corrected", "type", "reason", "start", "end"})
+    event: summary → {"summary", "count", "partial", "incremental"}
+    """
+    data = _request_data()
+    return _sse_event_response(
+        detect_errors_stream(data.get("message", ""), data.get("tone", DEFAULT_TONE), data.get("mode"))
+    )
+
+
 # ------------------------------------------------------------
 # 6️⃣ 새로운 기능: 문장 제안 (스트리밍 전용)
 # ------------------------------------------------------------
-@app.route("/suggest-streamed", methods=["GET"])
+@app.route("/suggest-streamed", methods=["GET", "POST"])
 def suggest_streamed():
     """
     새롭게 추가된 문장 제안 스트리밍 기능.
     기존 일괄 방식(generate_suggestions)과 다르게,
     generate_suggestions_streamed()를 통해 토큰 단위로 실시간 전송.
     """
-    def generate():
-        for token in generate_suggestions_streamed(latest_input["message"], latest_input["tone"]):
-            yield f"data: {token}\n\n"
-            sys.stdout.flush()
-        yield "data: [DONE]\n\n"
-        sys.stdout.flush()
-
-    return Response(generate(), mimetype="text/event-stream", headers={
-        "Cache-Control": "no-cache",
-        "X-Accel-Buffering": "no",
-        "Transfer-Encoding": "chunked",
-        "Connection": "keep-alive",
-        "Access-Control-Allow-Origin": "*",
-    })
+    user_input = _stream_input()
+    if user_input is None:
+        return _session_not_found()
+    return _sse_response(generate_suggestions_streamed, user_input)
 
 
 # ------------------------------------------------------------
-# 7️⃣ Gevent 서버 실행 (Windows 호환)
+# 7️⃣ 통합 보조 스트림 (예측 · 제안 · 탐지 동시 실행)
+# ------------------------------------------------------------
+@app.route("/assist", methods=["POST"])
+def assist():
+    """
+    입력을 한 번만 보내고 선택한 기능을 서버에서 동시에 실행.
+    본문: {"message", "tone", "features": ["predict", "suggest", "detect"], "mode", "deadlines": {"detect": 10}}
+    event: predict / suggest / detect / done(채널별)
+    """
+    data = _request_data()
+    return _sse_event_response(assist_stream(
+        data.get("message", ""),
+        data.get("tone", DEFAULT_TONE),
+        features=data.get("features"),
+        mode=data.get("mode"),
+        deadlines=_deadlines(data.get("deadlines")),
+    ))
+
+
+def _deadlines(raw):
+    """채널별 마감 시간(초) — 숫자가 아닌 값은 무시"""
+    if not isinstance(raw, dict):
+        return None
+    deadlines = {}
+    for channel, seconds in raw.items():
+        try:
+            deadlines[channel] = float(seconds)
+        except (TypeError, ValueError):
+            continue
+    return deadlines
+
+
+# ------------------------------------------------------------
+# 8️⃣ 운영 통계 (/stats JSON, /metrics Prometheus)
+# ------------------------------------------------------------
+@app.route("/stats", methods=["GET"])
+def stats():
+    """업스트림 생성 완료·취소·실패 횟수, 완성 캐시, 요청 병합, SSE 프레임 통계"""
+    return jsonify(dict(get_stats(), sse=sse_stats(), assist_pool=channel_pool.stats()))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 지표 (엔드포인트·문체별 지연 히스토그램, 토큰 수, 타임아웃 등)"""
+    body, content_type = render_latest()
+    return Response(body, content_type=content_type)
+
+
+# ------------------------------------------------------------
+# 9️⃣ Gevent 서버 실행 (Windows 호환)
 # ------------------------------------------------------------
 if __name__ == "__main__":
     from gevent import pywsgi
-    from gevent.monkey import patch_all
-
-    patch_all()
 
-    server = pywsgi.WSGIServer(("127.0.0.1", 5000), app)
-    print("✅ Gevent WSGIServer running on http://127.0.0.1:5000")
+    port = int(os.getenv("PORT", "5000"))
+    server = pywsgi.WSGIServer(("127.0.0.1", port), app)
+    print(f"✅ Gevent WSGIServer running on http://127.0.0.1:{port}")
     server.serve_forever()
@@ -0,0 +1,287 @@
+import json
+import os
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+from ai_async import (
+    async_pool,
+    call_flight,
+    stream_flight,
+    astream_predict_text,
+    astream_generate_suggestions,
+    agenerate_suggestions,
+    adetect_errors,
+    adetect_errors_stream,
+    agenerate_suggestions_streamed,
+)
+from ai_handler import context_builder, get_stats, semantic_cache, shared_store
+from assist import aassist_stream
+from doc_sync import DocSession, ws_stats
+from scheduler import current_user
+from session_store import InputStore, DEFAULT_TONE
+from sse import DONE, ResumeBuffer, SSEWriter, encode_event, sse_stats
+from worker_pool import PoolOverloaded, aadmit_eagerly
+from llm_registry import warmup as warmup_llm_clients
+from metrics import render_latest
+
+"""
+ASGI 서빙 경로 (starlette + uvicorn)
+app.py(Flask + gevent)와 같은 라우트 · 같은 SSE 형식을 제공하지만,
+스트림 하나가 코루틴 하나이므로 프로세스 하나로 수천 개의 스트림을 유지할 수 있다.
+Flask 앱은 그대로 대체 경로로 남겨 둔다.
+/ws는 이 경로에만 있다 — 편집 델타를 받는 WebSocket 문서 동기화 채널 (doc_sync).
+  서버 쪽 시제품: serve.py(Flask WSGI)는 /ws를 제공하지 않고, 프론트엔드는 아직 /stream-events를 쓴다.
+
+실행: uvicorn asgi_app:app --host 127.0.0.1 --port 5000
+  여러 프로세스: SHARED_CACHE_PATH=/tmp/glitda.sqlite3 uvicorn asgi_app:app --workers 4 (캐시·세션 공유)
+"""
+
+load_dotenv()
+
+if not os.getenv("OPENAI_API_KEY"):
+    print("[경고] OPENAI_API_KEY가 .env에서 감지되지 않았습니다.")
+
+try:
+    warmup_llm_clients()
+except Exception as e:
+    print(f"[경고] LLM 클라이언트 초기화 실패: {e}")
+
+context_builder.warmup()
+if semantic_cache:
+    semantic_cache.warmup()
+
+input_store = InputStore(ttl=float(os.getenv("INPUT_TTL_SECONDS", "300")), shared=shared_store)
+resume_buffer = ResumeBuffer(ttl=float(os.getenv("SSE_RESUME_TTL", "120")))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
+
+
+# ------------------------------------------------------------
+# 1️⃣ 공통 처리 (요청 본문, 세션, SSE 응답)
+# ------------------------------------------------------------
+async def _request_data(request):
+    """요청 본문 JSON (Content-Type과 무관하게 파싱) — 본문의 session_id도 스케줄러 사용자에 반영"""
+    body = await request.body()
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        data = {}
+    data = data if isinstance(data, dict) else {}
+    current_user.set(_user_key(request, data))
+    return data
+
+
+def _session_key(request, data=None):
+    """클라이언트가 보낸 세션 토큰 (쿼리 > 헤더 > 본문) — 없으면 None"""
+    return (
+        request.query_params.get("session_id")
+        or request.headers.get("X-Session-Id")
+        or (data or {}).get("session_id")
+    )
+
+
+def _user_key(request, data=None):
+    """스케줄러 공정성 단위 = 세션 토큰, 없으면 클라이언트 주소 (주소는 세션 키로 쓰지 않음)"""
+    client = request.client.host if request.client else "unknown"
+    return _session_key(request, data) or f"addr:{client}"
+
+
+class BindUserMiddleware:
+    """
+    모든 요청에서 scheduler.current_user를 설정 (app.py의 _bind_user에 해당) — 쿼리 · 헤더의 세션 토큰, 없으면 주소.
+    본문의 session_id는 라우트가 _request_data로 읽을 때 반영된다.
+    순수 ASGI 미들웨어라서 라우트 · 스트리밍 응답 태스크가 같은 컨텍스트를 물려받는다.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            current_user.set(_user_key(HTTPConnection(scope)))
+        await self.app(scope, receive, send)
+
+
+async def _stream_input(request):
+    """POST면 본문에서 바로, GET이면 세션 저장소에서 입력을 읽는다"""
+    if request.method == "POST":
+        data = await _request_data(request)
+        return data.get("message", ""), data.get("tone", DEFAULT_TONE)
+    stored = input_store.get(_session_key(request))  # 토큰 없는 GET은 404
+    if stored is None:
+        return None
+    return stored["message"], stored["tone"]
+
+
+async def _sse_response(tokens, request):
+    """
+    비동기 토큰 이터레이터를 SSE 응답으로 변환 (sse.SSEWriter — app.py와 같은 프레이밍·재연결 규칙).
+    클라이언트가 끊으면 starlette가 전송 태스크를 취소하고, 제너레이터가 닫히며 업스트림도 닫힌다.
+    """
+    writer = SSEWriter.from_env(framing=request.query_params.get("framing"), resume=resume_buffer)
+    last_event_id = request.headers.get("last-event-id")
+    # 이미 끝난 스트림의 재연결이면 보관된 텍스트만 다시 보냄 — 토큰 이터레이터는 시작 전에 닫는다 (생성 없음)
+    replay = writer.replay(last_event_id)
+    if replay is not None:
+        await tokens.aclose()
+        return Response("".join(replay), media_type="text/event-stream", headers=SSE_HEADERS)
+    # 작업 풀 입장을 먼저 확인 → 과부하면 스트림 대신 503/429 (overloaded 핸들러)
+    tokens = await aadmit_eagerly(tokens)
+    frames = writer.astream(tokens, last_event_id=last_event_id)
+    return StreamingResponse(frames, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def _sse_event_response(events):
+    """
+    (이벤트 이름, 페이로드) async 이터레이터를 이름 있는 SSE 이벤트로 변환
+    (스트림 하나 = 코루틴 하나, 스레드 풀 자리를 차지하지 않음 — 끊기면 제너레이터가 닫히며 업스트림도 닫힘)
+    """
+    async def generate():
+        try:
+            async for event, payload in events:
+                yield encode_event(json.dumps(payload, ensure_ascii=False), event=event)
+            yield encode_event(DONE)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def overloaded(request, e):
+    """작업 풀 거절 → 즉시 503(전체 포화)/429(기능별 한도) + Retry-After (app.py와 같은 응답)"""
+    return JSONResponse({"error": str(e), "reason": e.reason, "retry_after": e.retry_after},
+                        status_code=e.status, headers={"Retry-After": str(e.retry_after)})
+
+
+def _session_not_found():
+    return JSONResponse(
+        {"error": "세션 입력이 없거나 만료되었습니다. /stream으로 다시 전송하고 받은 session_id로 요청하세요."},
+        status_code=404,
+    )
+
+
+def _streaming_endpoint(stream_fn):
+    async def endpoint(request):
+        user_input = await _stream_input(request)
+        if user_input is None:
+            return _session_not_found()
+        return await _sse_response(stream_fn(*user_input), request)
+
+    return endpoint
+
+
+# ------------------------------------------------------------
+# 2️⃣ 라우트 (app.py와 동일)
+# ------------------------------------------------------------
+async def stream_post(request):
+    """React에서 입력 데이터를 받아 세션별로 저장 (GET 스트리밍 경로 호환용, 토큰이 없으면 새로 발급)"""
+    data = await _request_data(request)
+    session_id = input_store.put(
+        _session_key(request, data),
+        data.get("message", ""),
+        data.get("tone", DEFAULT_TONE),
+    )
+    return JSONResponse({"status": "ready", "session_id": session_id})
+
+
+async def suggest(request):
+    """문장 제안 (일괄 응답)"""
+    data = await _request_data(request)
+    suggestions = await agenerate_suggestions(data.get("message", ""), data.get("tone", DEFAULT_TONE))
+    return JSONResponse({"suggestions": suggestions})
+
+
+async def detect(request):
+    """오타·문법 탐지 및 수정 제안"""
+    data = await _request_data(request)
+    result = await adetect_errors(data.get("message", ""), data.get("tone", DEFAULT_TONE), data.get("mode"))
+    return JSONResponse(result)
+
+
+async def detect_stream(request):
+    """오타·문법 탐지 (스트리밍, 증분 탐지 엔진 사용) — event: item / summary"""
+    data = await _request_data(request)
+    return _sse_event_response(
+        adetect_errors_stream(data.get("message", ""), data.get("tone", DEFAULT_TONE), data.get("mode"))
+    )
+
+
+async def assist(request):
+    """예측 · 제안 · 탐지 동시 실행 (채널마다 asyncio 태스크) — app.py /assist와 같은 이벤트"""
+    data = await _request_data(request)
+    deadlines = data.get("deadlines")
+    return _sse_event_response(aassist_stream(
+        data.get("message", ""),
+        data.get("tone", DEFAULT_TONE),
+        features=data.get("features"),
+        mode=data.get("mode"),
+        deadlines={k: float(v) for k, v in deadlines.items() if isinstance(v, (int, float))}
+        if isinstance(deadlines, dict) else None,
+    ))
+
+
+async def ws_endpoint(websocket):
+    """WebSocket 문서 동기화 — 연결마다 문서 사본 하나, 편집마다 예측을 다시 시작"""
+    await websocket.accept()
+    session = DocSession(websocket.send_text, user=_user_key(websocket))
+    try:
+        while True:
+            await session.handle(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+
+
+async def stats(request):
+    """업스트림 생성 완료·취소·실패 횟수, 완성 캐시, 요청 병합 통계"""
+    # 이 경로의 업스트림 입장 제어는 async_pool (동기 작업 풀은 쓰지 않음)
+    return JSONResponse(dict(get_stats(), worker_pool=async_pool.stats(),
+                             single_flight={"calls": call_flight.stats(), "streams": stream_flight.stats()},
+                             sse=sse_stats(), ws=ws_stats()))
+
+
+async def metrics(request):
+    """Prometheus 지표"""
+    body, content_type = render_latest()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+routes = [
+    Route("/stream", stream_post, methods=["POST"]),
+    Route("/stream-events", _streaming_endpoint(astream_predict_text), methods=["GET", "POST"]),
+    Route("/suggest", suggest, methods=["POST"]),
+    Route("/suggest-stream", _streaming_endpoint(astream_generate_suggestions), methods=["GET", "POST"]),
+    Route("/detect", detect, methods=["POST"]),
+    Route("/detect-stream", detect_stream, methods=["POST"]),
+    Route("/assist", assist, methods=["POST"]),
+    Route("/suggest-streamed", _streaming_endpoint(agenerate_suggestions_streamed), methods=["GET", "POST"]),
+    WebSocketRoute("/ws", ws_endpoint),
+    Route("/stats", stats, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(BindUserMiddleware),
+    ],
+    exception_handlers={PoolOverloaded: overloaded},
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    print("✅ Uvicorn ASGI server running on http://127.0.0.1:5000")
+    uvicorn.run(app, host="127.0.0.1", port=5000)
@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import time
+from ai_async import adetect_errors_stream, astream_generate_suggestions, astream_predict_text
+from ai_handler import detect_errors_stream, stream_generate_suggestions, stream_predict_text
+from metrics import observe_request
+from worker_pool import PoolOverloaded, WorkerPool, parse_map
+
+"""
+통합 보조 스트림 (/assist)
+입력을 한 번 받아 실시간 예측 · 문장 제안 · 오타 탐지를 서버에서 동시에 실행하고,
+하나의 SSE 스트림에 채널 이름을 붙인 이벤트로 섞어 보낸다 (먼저 끝나는 기능이 먼저 보임).
+- event: predict / suggest → {"token": "..."}
+- event: detect            → 오류 객체 하나
+- event: done              → {"channel", "status", "elapsed_ms"} (+ detect는 "summary")
+채널마다 마감 시간이 있어 늦은 채널만 timeout으로 끝내고 나머지는 계속 흘려보낸다.
+assist_stream은 동기 엔진(app.py), aassist_stream은 채널마다 asyncio 태스크 하나인 async 엔진(asgi_app)용.
+"""
+
+CHANNEL_DEADLINES = {
+    "predict": float(os.getenv("ASSIST_PREDICT_DEADLINE", "8")),
+    "suggest": float(os.getenv("ASSIST_SUGGEST_DEADLINE", "15")),
+    "detect": float(os.getenv("ASSIST_DETECT_DEADLINE", "25")),
+}
+
+_FINISHED = object()
+
+# 채널 실행 스레드 풀 — 요청마다 스레드를 만들지 않고, 받을 수 없으면 응답 전에 503/429 (worker_pool과 같은 입장 제어).
+# 채널 안의 업스트림 호출은 공유 작업 풀(ai_handler.worker_pool)에 다시 들어가므로 같은 풀을 쓰면
+# 채널이 자리를 모두 차지한 채 자기 업스트림 작업을 기다리는 교착이 생길 수 있어 따로 둔다.
+channel_pool = WorkerPool(
+    max_workers=int(os.getenv("ASSIST_POOL_SIZE", "24")),
+    max_queue=int(os.getenv("ASSIST_QUEUE_SIZE", "24")),
+    queue_timeout=float(os.getenv("ASSIST_QUEUE_TIMEOUT", "1")),
+    limits=parse_map(os.getenv("ASSIST_LIMITS"), int),
+    default_limit=int(os.getenv("ASSIST_CHANNEL_LIMIT", "8")),
+)
+
+# 채널 제너레이터가 이 간격마다 유휴 틱을 내보내 → 첫 토큰을 기다리는 중에도 마감에 맞춰 닫힌다
+IDLE_TICK = float(os.getenv("ASSIST_IDLE_TICK", "0.25"))
+
+
+def _channel_events(channel: str, user_input: str, tone: str, mode=None):
+    """채널별 (이벤트 종류, 페이로드) 제너레이터 — 기존 ai_handler 함수를 그대로 사용 (유휴 중엔 ("tick", None))"""
+    if channel == "predict":
+        for token in stream_predict_text(user_input, tone, idle_tick=IDLE_TICK):
+            yield ("token", {"token": token}) if token else ("tick", None)
+    elif channel == "suggest":
+        for token in stream_generate_suggestions(user_input, tone, idle_tick=IDLE_TICK):
+            yield ("token", {"token": token}) if token else ("tick", None)
+    elif channel == "detect":
+        yield from detect_errors_stream(user_input, tone, mode, idle_tick=IDLE_TICK)
+
+
+def _run_channel(channel, events, out, cancel, due):
+    """
+    채널 하나를 끝까지(또는 취소 · 마감까지) 돌리며 이벤트를 공용 큐에 넣는다.
+    마감(due, perf_counter 기준)은 채널 스레드가 직접 확인한다 — 소비 측이 멈춰 있어도 제너레이터를 닫음.
+    """
+    status = "completed"
+    try:
+        for kind, payload in events:
+            if cancel.is_set() or time.perf_counter() >= due:
+                status = "cancelled"
+                break
+            if kind != "tick":
+                out.put((channel, kind, payload))
+    except Exception as e:
+        status = "failed"
+        out.put((channel, "failed", {"error": str(e)}))
+    finally:
+        # 제너레이터는 실행 중인 스레드에서 닫아야 한다 → 업스트림 생성도 여기서 취소됨
+        events.close()
+        out.put((channel, _FINISHED, status))
+
+
+def _submit_channel(channel, events, out, cancel, due):
+    """채널을 채널 풀에 넣음 (가득 차면 PoolOverloaded) — 대기열에서 만료되면 rejected로 끝냄"""
+    # 요청 컨텍스트(scheduler.current_user)를 채널 스레드로 복사
+    future = channel_pool.submit(f"assist_{channel}", contextvars.copy_context().run,
+                                 _run_channel, channel, events, out, cancel, due)
+
+    def rejected(future):
+        if future.cancelled() or future.exception() is not None:
+            out.put((channel, _FINISHED, "rejected"))
+
+    future.add_done_callback(rejected)
+    return future
+
+
+def _done(channel, status, started, summaries):
+    payload = {"channel": channel, "status": status,
+               "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if channel in summaries:
+        payload["summary"] = summaries[channel]
+    return "done", payload
+
+
+def assist_stream(user_input: str, tone: str = "자동 감지", features=None, mode=None, deadlines=None):
+    """
+    선택한 채널을 채널 풀에서 동시에 실행 → (이벤트 이름, 페이로드) 이터레이터
+    채널 풀이 받을 수 없으면 스트림을 시작하기 전에 PoolOverloaded (라우트에서 503/429).
+    """
+    channels = [c for c in (features or CHANNEL_DEADLINES) if c in CHANNEL_DEADLINES]
+    limits = dict(CHANNEL_DEADLINES, **(deadlines or {}))
+    out = queue.Queue()
+    cancels = {channel: threading.Event() for channel in channels}
+    started = time.perf_counter()
+    due = {channel: started + limits[channel] for channel in channels}
+    futures = []
+    try:
+        for channel in channels:
+            futures.append(_submit_channel(
+                channel, _channel_events(channel, user_input, tone, mode), out, cancels[channel], due[channel]
+            ))
+    except PoolOverloaded:
+        for cancel in cancels.values():
+            cancel.set()
+        for future in futures:
+            future.cancel()
+        raise
+    return _relay(tone, out, cancels, started, due)
+
+
+def _relay(tone, out, cancels, started, due):
+    with observe_request("assist", tone):
+        summaries = {}
+
+        def done(channel, status):
+            return _done(channel, status, started, summaries)
+
+        try:
+            while due:
+                timeout = max(0.0, min(due.values()) - time.perf_counter())
+                try:
+                    channel, kind, payload = out.get(timeout=timeout)
+                except queue.Empty:
+                    now = time.perf_counter()
+                    for channel in [c for c, t in due.items() if t <= now]:
+                        cancels[channel].set()  # 채널 스레드도 같은 마감을 보고 제너레이터를 닫는다
+                        del due[channel]
+                        yield done(channel, "timeout")
+                    continue
+
+                if channel not in due:
+                    continue  # 마감 후 도착한 이벤트는 버림
+                if kind is _FINISHED:
+                    del due[channel]
+                    yield done(channel, payload)
+                elif kind in ("summary", "failed"):
+                    summaries[channel] = payload  # done 이벤트에 함께 보냄
+                else:
+                    yield channel, payload
+        finally:
+            # 클라이언트가 끊었거나 모든 채널이 끝남 → 남은 채널 생성 중단
+            for cancel in cancels.values():
+                cancel.set()
+
+
+# -----------------------------------------------------------
+# async 엔진 (asgi_app) — 스레드 없이 채널마다 태스크 하나
+# -----------------------------------------------------------
+async def _achannel_events(channel: str, user_input: str, tone: str, mode=None):
+    if channel == "predict":
+        async for token in astream_predict_text(user_input, tone):
+            if token:
+                yield "token", {"token": token}
+    elif channel == "suggest":
+        async for token in astream_generate_suggestions(user_input, tone):
+            if token:
+                yield "token", {"token": token}
+    elif channel == "detect":
+        async for event in adetect_errors_stream(user_input, tone, mode):  # 태스크 취소로 바로 끝나므로 유휴 틱 없음
+            yield event
+
+
+async def _arun_channel(channel, events, out):
+    """_run_channel의 async 버전 — 마감 · 연결 종료 시 태스크 취소로 업스트림 스트림까지 닫힘"""
+    status = "completed"
+    try:
+        async for kind, payload in events:
+            out.put_nowait((channel, kind, payload))
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception as e:
+        status = "failed"
+        out.put_nowait((channel, "failed", {"error": str(e)}))
+    finally:
+        await events.aclose()
+        out.put_nowait((channel, _FINISHED, status))
+
+
+async def aassist_stream(user_input: str, tone: str = "자동 감지", features=None, mode=None, deadlines=None):
+    """assist_stream의 async 버전 → (이벤트 이름, 페이로드) async 이터레이터"""
+    channels = [c for c in (features or CHANNEL_DEADLINES) if c in CHANNEL_DEADLINES]
+    limits = dict(CHANNEL_DEADLINES, **(deadlines or {}))
+    out = asyncio.Queue()
+
+    with observe_request("assist", tone):
+        started = time.perf_counter()
+        due = {channel: started + limits[channel] for channel in channels}
+        summaries = {}
+        tasks = {
+            channel: asyncio.create_task(_arun_channel(channel, _achannel_events(channel, user_input, tone, mode), out))
+            for channel in channels
+        }
+        try:
+            while due:
+                timeout = max(0.0, min(due.values()) - time.perf_counter())
+                try:
+                    channel, kind, payload = await asyncio.wait_for(out.get(), timeout)
+                except asyncio.TimeoutError:
+                    now = time.perf_counter()
+                    for channel in [c for c, t in due.items() if t <= now]:
+                        tasks[channel].cancel()  # 첫 토큰을 기다리는 중이어도 바로 끝남
+                        del due[channel]
+                        yield _done(channel, "timeout", started, summaries)
+                    continue
+
+                if channel not in due:
+                    continue
+                if kind is _FINISHED:
+                    del due[channel]
+                    yield _done(channel, payload, started, summaries)
+                elif kind in ("summary", "failed"):
+                    summaries[channel] = payload
+                else:
+                    yield channel, payload
+        finally:
+            for task in tasks.values():
+                task.cancel()
@@ -0,0 +1,1025 @@
+"""
+스트리밍 경로 부하·지연 벤치마크 (오프라인)
+가짜 LLM(fake_llm)으로 Flask 앱의 6개 라우트를 동시성 N으로 호출하고
+TTFT / 토큰 처리량 / 전체 지연 p50·p95·p99, 열린 스트림당 메모리, 사용 스레드 수를 보고한다.
+네트워크나 API 키 없이 실행되므로 배포 전 스트리밍 경로 회귀를 잡는 용도.
+
+실행 예:
+    python benchmark.py --concurrency 50 --requests 200
+    python benchmark.py --routes stream-events suggest-stream --ttft 0.5 --token-delay 0.03
+    python benchmark.py --same-input        # 동일 입력 → 요청 병합 효과 확인
+    python benchmark.py --passage-index     # 구절 색인 메모리·조회 지연만 측정
+    python benchmark.py --framing both      # SSE 프레임 모으기(compact) vs 토큰당 프레임(legacy)
+    python benchmark.py --scheduler both --tpm 6000   # 타이핑 사용자 + 일괄 작업 폭주: fifo vs 우선순위
+    python benchmark.py --backends --remote openai    # AI Cursor 타이핑: 원격 모델 vs CPU 로컬 모델
+    python benchmark.py --resilience both --slow-rate 0.05 --slow-ttft 2   # 느린 응답 주입: 헤지 없음 vs 헤지
+    python benchmark.py --serve-workers 1 2 4 --routes stream-events suggest   # serve.py 워커 수별 처리량
+    python benchmark.py --ws --requests 40 --token-delay 0.005   # 5,000자 글 편집: 전체 재전송 vs WebSocket 델타
+    python benchmark.py --smoke             # python app.py를 스크립트로 띄워 모든 라우트가 200으로 끝나는지 확인
+"""
+import os
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import argparse
+import http.client
+import json
+import logging
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import psutil
+except ImportError:  # 메모리 측정만 생략
+    psutil = None
+
+from werkzeug.serving import make_server
+
+# (이름, 경로, SSE 여부)
+ROUTES = [
+    ("stream", "/stream", False),
+    ("stream-events", "/stream-events", True),
+    ("suggest", "/suggest", False),
+    ("suggest-stream", "/suggest-stream", True),
+    ("detect", "/detect", False),
+    ("suggest-streamed", "/suggest-streamed", True),
+]
+
+SAMPLE_INPUT = "데이터 전처리는 모델의 성능에"
+
+
+# -----------------------------------------------------------
+# 1️⃣ 측정 도구
+# -----------------------------------------------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class ResourceSampler(threading.Thread):
+    """주기적으로 RSS, 스레드 수, 열린 스트림 수를 기록"""
+
+    def __init__(self, interval=0.02, busy=None):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.busy = busy  # 실행 중인 업스트림 작업 수 (작업 풀)
+        self.open_streams = 0
+        self.lock = threading.Lock()
+        self.peak_streams = 0
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self.peak_upstream_threads = 0
+        self._halt = threading.Event()
+        self._process = psutil.Process() if psutil else None
+
+    def rss(self):
+        return self._process.memory_info().rss if self._process else 0
+
+    def stream_opened(self):
+        with self.lock:
+            self.open_streams += 1
+
+    def stream_closed(self):
+        with self.lock:
+            self.open_streams -= 1
+
+    def run(self):
+        while not self._halt.is_set():
+            threads = threading.enumerate()
+            upstream = self.busy() if self.busy else 0
+            with self.lock:
+                self.peak_streams = max(self.peak_streams, self.open_streams)
+            self.peak_rss = max(self.peak_rss, self.rss())
+            self.peak_threads = max(self.peak_threads, len(threads))
+            self.peak_upstream_threads = max(self.peak_upstream_threads, upstream)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+# -----------------------------------------------------------
+# 2️⃣ HTTP 클라이언트 (SSE 프레임 단위 수신)
+# -----------------------------------------------------------
+def call_route(port, path, streaming, payload, sampler):
+    """요청 1회 실행 → {"ok", "ttft", "total", "tokens", "frames", "bytes"}"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request("POST", path, body=body, headers={"Content-Type": "text/plain;charset=UTF-8"})
+        resp = conn.getresponse()
+        if resp.status != 200:
+            resp.read()
+            return {"ok": False, "status": resp.status}
+
+        if not streaming:
+            resp.read()
+            elapsed = time.perf_counter() - start
+            return {"ok": True, "ttft": elapsed, "total": elapsed, "tokens": 0, "frames": 0, "bytes": 0}
+
+        sampler.stream_opened()
+        try:
+            ttft = None
+            tokens = 0
+            frames = 0
+            size = 0
+            buffer = b""
+            while True:
+                chunk = resp.read1(65536)
+                if not chunk:
+                    break
+                size += len(chunk)
+                buffer += chunk
+                while b"\n\n" in buffer:
+                    frame, buffer = buffer.split(b"\n\n", 1)
+                    frames += 1
+                    data = b"\n".join(
+                        line[5:].lstrip(b" ") for line in frame.split(b"\n") if line.startswith(b"data:")
+                    )
+                    if data == b"[DONE]":
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    tokens += 1
+            total = time.perf_counter() - start
+            return {"ok": True, "ttft": ttft if ttft is not None else total, "total": total, "tokens": tokens,
+                    "frames": frames, "bytes": size}
+        finally:
+            sampler.stream_closed()
+    except (OSError, http.client.HTTPException) as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        conn.close()
+
+
+# -----------------------------------------------------------
+# 3️⃣ 벤치마크 실행
+# -----------------------------------------------------------
+def start_server(app):
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # 요청별 접근 로그 생략
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_route(port, name, path, streaming, args, sampler, framing=None):
+    payloads = [
+        {
+            "message": SAMPLE_INPUT if args.same_input else f"{SAMPLE_INPUT} #{name}-{i}",
+            "tone": args.tone,
+        }
+        for i in range(args.requests)
+    ]
+    if framing:
+        path = f"{path}?framing={framing}"
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda p: call_route(port, path, streaming, p, sampler), payloads))
+    wall = time.perf_counter() - started
+
+    ok = [r for r in results if r.get("ok")]
+    ttfts = [r["ttft"] for r in ok]
+    totals = [r["total"] for r in ok]
+    rates = [
+        r["tokens"] / (r["total"] - r["ttft"])
+        for r in ok
+        if r["tokens"] > 1 and r["total"] > r["ttft"]
+    ]
+    return {
+        "route": f"{name} ({framing})" if framing else name,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "ttft_ms": {f"p{p}": _ms(percentile(ttfts, p)) for p in (50, 95, 99)},
+        "total_ms": {f"p{p}": _ms(percentile(totals, p)) for p in (50, 95, 99)},
+        "tokens_per_sec": round(sum(rates) / len(rates), 1) if rates else None,
+        "frames_per_response": round(sum(r["frames"] for r in ok) / len(ok), 1) if ok else None,
+        "bytes_per_response": round(sum(r["bytes"] for r in ok) / len(ok), 1) if ok else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+# -----------------------------------------------------------
+# 4️⃣ 구절 색인 벤치마크 (서버 없이 색인만)
+# -----------------------------------------------------------
+def _typo(text, rng):
+    """한 글자를 다른 한글 음절로 바꿔 오타 입력을 흉내"""
+    positions = [i for i, ch in enumerate(text) if "가" <= ch <= "힣"]
+    if not positions:
+        return text
+    i = rng.choice(positions)
+    return text[:i] + chr(rng.randint(ord("가"), ord("힣"))) + text[i + 1:]
+
+
+def bench_passage_index(args):
+    from passage_index import DEFAULT_CORPUS, PassageIndex
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DEFAULT_CORPUS)
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = PassageIndex.load(path)
+    load_ms = (time.perf_counter() - started) * 1000
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(0)
+    lines = index.passages()
+    queries = {"exact": [], "typo": [], "miss": []}
+    for _ in range(args.requests):
+        line = rng.choice(lines)
+        prefix = line[:rng.randint(max(3, len(line) // 2), len(line))]
+        queries["exact"].append(prefix)
+        queries["typo"].append(_typo(prefix, rng))
+        queries["miss"].append(f"{SAMPLE_INPUT} #{rng.randint(0, 10 ** 6)}")
+
+    result = {"load_ms": round(load_ms, 2), "memory_kb": round(traced / 1024, 1),
+              "estimated_kb": index.stats()["memory_kb"], "lookups": {}}
+    for kind, items in queries.items():
+        latencies, hits = [], 0
+        for query in items:
+            started = time.perf_counter()
+            match = index.lookup(query)
+            latencies.append(time.perf_counter() - started)
+            hits += match is not None
+        result["lookups"][kind] = {
+            "hit_rate": round(hits / len(items), 3),
+            **{f"p{p}_us": round(percentile(latencies, p) * 1e6, 1) for p in (50, 95, 99)},
+        }
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(f"[passage-index] load={result['load_ms']}ms memory={result['memory_kb']}KB "
+              f"(estimate {result['estimated_kb']}KB)")
+        for kind, r in result["lookups"].items():
+            print(f"  {kind:<5} hit_rate={r['hit_rate']} p50={r['p50_us']}us p95={r['p95_us']}us p99={r['p99_us']}us")
+    return result
+
+
+# -----------------------------------------------------------
+# 5️⃣ 스케줄러 벤치마크 (타이핑 사용자 여럿 + 일괄 작업 폭주, 서버 없이 ai_handler 직접 호출)
+# -----------------------------------------------------------
+def _jain(values):
+    if not values or not any(values):
+        return None
+    return round(sum(values) ** 2 / (len(values) * sum(v * v for v in values)), 4)
+
+
+def bench_scheduler(args, mode):
+    import ai_handler
+    from scheduler import PriorityScheduler, current_user
+    from worker_pool import PoolOverloaded, WorkerPool
+
+    ai_handler.completion_cache.clear()
+    ai_handler.scheduler = PriorityScheduler(rpm=args.rpm, tpm=args.tpm) if mode == "priority" else None
+    ai_handler.worker_pool = WorkerPool(max_workers=args.concurrency, queue=ai_handler.scheduler)
+
+    stop_at = time.perf_counter() + args.duration
+    lock = threading.Lock()
+    typing = {"ttft": [], "ok": {}, "rejected": 0, "errors": 0}
+    batch = {"latency": [], "ok": 0, "rejected": 0, "errors": 0}
+
+    def typist(user):
+        current_user.set(user)
+        i = 0
+        while time.perf_counter() < stop_at:
+            i += 1
+            started = time.perf_counter()
+            ttft = None
+            try:
+                for token in ai_handler.stream_predict_text(f"{SAMPLE_INPUT} {user} {i}", args.tone):
+                    if token and ttft is None:
+                        ttft = time.perf_counter() - started
+                        failed = token.startswith("[ERROR]")
+                with lock:
+                    if ttft is None or failed:
+                        typing["errors"] += 1
+                    else:
+                        typing["ttft"].append(ttft)
+                        typing["ok"][user] = typing["ok"].get(user, 0) + 1
+            except PoolOverloaded:
+                with lock:
+                    typing["rejected"] += 1
+            time.sleep(args.keystroke_gap)
+
+    def bulk(worker):
+        current_user.set("bulk")
+        i = 0
+        while time.perf_counter() < stop_at:
+            i += 1
+            started = time.perf_counter()
+            try:
+                if i % 2:
+                    result = ai_handler.generate_suggestions(f"{SAMPLE_INPUT} bulk {worker} {i}", args.tone)
+                    failed = result.startswith("[ERROR]")
+                else:
+                    result = ai_handler.detect_errors(f"{SAMPLE_INPUT} bulk {worker} {i}.", args.tone, "llm")
+                    failed = bool(result.get("error"))
+                with lock:
+                    batch["errors" if failed else "ok"] += 1
+                    batch["latency"].append(time.perf_counter() - started)
+            except PoolOverloaded:
+                with lock:
+                    batch["rejected"] += 1
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=typist, args=(f"user-{n}",)) for n in range(args.users)]
+    threads += [threading.Thread(target=bulk, args=(n,)) for n in range(args.background)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    counts = [typing["ok"].get(f"user-{n}", 0) for n in range(args.users)]
+    pool = ai_handler.worker_pool.stats()
+    return {
+        "mode": mode,
+        "interactive": {
+            "completed": sum(counts),
+            "rejected": typing["rejected"],
+            "errors": typing["errors"],
+            **{f"ttft_p{p}_ms": _ms(percentile(typing["ttft"], p)) for p in (50, 95, 99)},
+            "fairness": _jain(counts),
+        },
+        "background": {
+            "completed": batch["ok"],
+            "rejected": batch["rejected"],
+            "errors": batch["errors"],
+            **{f"latency_p{p}_ms": _ms(percentile(batch["latency"], p)) for p in (50, 95, 99)},
+        },
+        "pool": {k: pool[k] for k in ("workers", "peak_queued")},
+        "scheduler": pool.get("scheduler"),
+    }
+
+
+# -----------------------------------------------------------
+# 6️⃣ 모델 경로 비교 (AI Cursor 타이핑 시퀀스: 원격 vs CPU 로컬)
+# -----------------------------------------------------------
+def _keystrokes(count, rng):
+    """글을 1~3글자씩 늘려 가며 입력하는 접두 목록 (끝까지 가면 처음부터 다시)"""
+    from fake_llm import DEFAULT_RESPONSE
+
+    text = SAMPLE_INPUT + DEFAULT_RESPONSE
+    prefixes, end = [], len(SAMPLE_INPUT)
+    while len(prefixes) < count:
+        end += rng.randint(1, 3)
+        if end > len(text):
+            end = len(SAMPLE_INPUT)
+        prefixes.append(text[:end])
+    return prefixes
+
+
+def bench_backends(args):
+    import llm_registry
+    from ai_handler import _format_prompt
+    from local_llm import LocalEngine
+
+    prefixes = _keystrokes(args.requests, random.Random(0))
+    remote = "openai" if args.remote == "openai" else "fake"
+    report = []
+    for backend in ("remote", "local"):
+        if backend == "local" and not LocalEngine.available():
+            report.append({"backend": "local", "skipped": "transformers/torch 미설치"})
+            continue
+        llm_registry.use_provider(remote, routes={"predict": "local"} if backend == "local" else {},
+                                  ttft=args.ttft, inter_token_delay=args.token_delay)
+        llm = llm_registry.get_llm(temperature=0.6, streaming=True, feature="predict")
+        engine = getattr(llm, "engine", None)
+        if engine is not None:
+            engine.warmup()
+        ttfts, totals, errors = [], [], 0
+        for text in prefixes:
+            formatted = _format_prompt("predict", text, args.tone)
+            started = time.perf_counter()
+            ttft = None
+            try:
+                for chunk in llm.stream(formatted):
+                    if chunk.content and ttft is None:
+                        ttft = time.perf_counter() - started
+            except Exception:
+                errors += 1
+                continue
+            totals.append(time.perf_counter() - started)
+            if ttft is not None:
+                ttfts.append(ttft)
+        result = {
+            "backend": backend,
+            "model": ":".join(filter(None, llm_registry.resolve_route("predict"))),
+            "keystrokes": len(prefixes),
+            "errors": errors,
+            **{f"ttft_p{p}_ms": _ms(percentile(ttfts, p)) for p in (50, 95, 99)},
+            **{f"total_p{p}_ms": _ms(percentile(totals, p)) for p in (50, 95, 99)},
+        }
+        if engine is not None:
+            result["engine"] = engine.stats()
+        report.append(result)
+    llm_registry.use_provider("fake", routes={})
+    return report
+
+
+# -----------------------------------------------------------
+# 7️⃣ 복원력 (느린 업스트림 응답 주입 → 헤지 · 마감의 꼬리 지연 효과, 서버 없이 ai_handler 직접 호출)
+# -----------------------------------------------------------
+def bench_resilience(args, mode):
+    import ai_handler
+    from resilience import DEFAULT_HEDGE_FEATURES, Resilience
+
+    ai_handler.completion_cache.clear()
+    # off: 마감과 회로 차단기는 그대로 두고 헤지만 끔
+    ai_handler.resilience = Resilience(hedge_features=() if mode == "off" else DEFAULT_HEDGE_FEATURES,
+                                       route_of=ai_handler.resilience.route_of)
+    lock = threading.Lock()
+    results = {"predict": {"ttft": [], "total": [], "errors": 0},
+               "suggest": {"ttft": [], "total": [], "errors": 0}}
+
+    def predict(i):
+        started = time.perf_counter()
+        ttft, failed = None, False
+        for token in ai_handler.stream_predict_text(f"{SAMPLE_INPUT} {mode} {i}", args.tone):
+            if token and ttft is None:
+                ttft = time.perf_counter() - started
+                failed = token.startswith("[ERROR]")
+        return ttft, time.perf_counter() - started, failed or ttft is None
+
+    def suggest(i):
+        started = time.perf_counter()
+        result = ai_handler.generate_suggestions(f"{SAMPLE_INPUT} {mode} 제안 {i}", args.tone)
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed, result.startswith("[ERROR]")
+
+    def run(job):
+        feature, fn, i = job
+        try:
+            ttft, total, failed = fn(i)
+        except Exception:
+            ttft, total, failed = None, None, True
+        with lock:
+            r = results[feature]
+            if failed:
+                r["errors"] += 1
+            else:
+                r["ttft"].append(ttft)
+                r["total"].append(total)
+
+    jobs = [job for i in range(args.requests) for job in (("predict", predict, i), ("suggest", suggest, i))]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(run, jobs))
+
+    stats = ai_handler.resilience.stats()["features"]
+    report = {"mode": mode}
+    for feature, r in results.items():
+        counters = stats.get(feature, {})
+        report[feature] = {
+            "ok": len(r["total"]),
+            "errors": r["errors"],
+            **{f"ttft_p{p}_ms": _ms(percentile(r["ttft"], p)) for p in (50, 95, 99)},
+            **{f"total_p{p}_ms": _ms(percentile(r["total"], p)) for p in (50, 95, 99)},
+            **{k: counters.get(k, 0) for k in ("hedged", "hedge_wins", "hedge_denied", "ttft_timeouts", "total_timeouts")},
+        }
+    return report
+
+
+# -----------------------------------------------------------
+# 8️⃣ 워커 수 확장 (serve.py를 워커 수별로 띄워 같은 부하를 보냄)
+# -----------------------------------------------------------
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_workers(args):
+    import signal
+    import subprocess
+    import sys
+    import tempfile
+
+    report = []
+    for workers in args.serve_workers:
+        port = _free_port()
+        cache_dir = tempfile.mkdtemp(prefix="glitda-bench-")
+        env = dict(
+            os.environ,
+            LLM_PROVIDER="fake",
+            FAKE_LLM_TTFT=str(args.ttft),
+            FAKE_LLM_TOKEN_DELAY=str(args.token_delay),
+            FAKE_LLM_ERROR_RATE=str(args.error_rate),
+            SHARED_CACHE_PATH=os.path.join(cache_dir, "shared.sqlite3"),
+            PYTHONUNBUFFERED="1",
+        )
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py"),
+             "--workers", str(workers), "--port", str(port), "--graceful-timeout", "5"],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            for line in server.stdout:  # 모든 워커가 준비되면 마스터가 ✅ 줄을 출력
+                if line.startswith("✅"):
+                    break
+            else:
+                report.append({"workers": workers, "skipped": "serve.py 시작 실패"})
+                continue
+            results = [
+                run_route(port, name, path, streaming, args, ResourceSampler())
+                for name, path, streaming in ROUTES
+                if name in args.routes
+            ]
+            ok = sum(r["requests"] - r["errors"] for r in results)
+            report.append({
+                "workers": workers,
+                "throughput_rps": round(sum(r["throughput_rps"] or 0 for r in results) / len(results), 2)
+                if results else None,
+                "ok": ok,
+                "errors": sum(r["errors"] for r in results),
+                "routes": results,
+            })
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return report
+
+
+# -----------------------------------------------------------
+# 9️⃣ 문서 동기화 (긴 글 편집: /stream + /stream-events 전체 재전송 vs /ws 편집 델타)
+# -----------------------------------------------------------
+def _counting_socket(port):
+    """주고받은 바이트를 세는 TCP 소켓 (헤더 · 프레이밍 포함, 실제 전송량)"""
+    import socket
+
+    class CountingSocket(socket.socket):
+        sent = received = 0
+
+        def sendall(self, data, *args):
+            self.sent += len(data)
+            return super().sendall(data, *args)
+
+        def recv(self, size, *args):
+            data = super().recv(size, *args)
+            self.received += len(data)
+            return data
+
+    sock = CountingSocket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(("127.0.0.1", port))
+    return sock
+
+
+def _http(sock, method, path, body=None):
+    """HTTP/1.1 요청 하나 (브라우저처럼 Origin · User-Agent 포함) → 응답 헤더까지 읽은 버퍼"""
+    headers = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1", "Origin: http://localhost:3000",
+               "User-Agent: Mozilla/5.0 (glitda-benchmark)", "Accept: */*"]
+    if body is not None:
+        body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+    sock.sendall(("\r\n".join(headers) + "\r\n\r\n").encode() + (body or b""))
+    buffer = b""
+    while b"\r\n\r\n" not in buffer:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        buffer += chunk
+    return buffer
+
+
+def _essay_edits(length, count, rng):
+    """length자 글과 편집 목록 [(pos, 지울 글자 수, 넣을 글)] — 대부분 글 끝에 이어 치기, 10번에 1번은 중간 수정"""
+    from fake_llm import DEFAULT_RESPONSE
+
+    source = (SAMPLE_INPUT + " " + DEFAULT_RESPONSE + "\n") * (length // len(DEFAULT_RESPONSE) + 2)
+    essay, typed, edits, size = source[:length], length, [], length
+    for i in range(count):
+        if i % 10 == 9:
+            pos = rng.randrange(size // 4, size * 3 // 4)
+            edits.append((pos, 1, source[pos + 7]))
+        else:
+            step = rng.randint(1, 3)
+            edits.append((size, 0, source[typed:typed + step]))
+            typed += step
+            size += step
+    return essay, edits
+
+
+def _start_asgi(args):
+    import subprocess
+    import sys
+
+    port = _free_port()
+    env = dict(os.environ, LLM_PROVIDER="fake", FAKE_LLM_TTFT=str(args.ttft),
+               FAKE_LLM_TOKEN_DELAY=str(args.token_delay), FAKE_LLM_ERROR_RATE=str(args.error_rate),
+               SHARED_CACHE_PATH="off")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            _counting_socket(port).close()
+            return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("asgi_app 시작 실패")
+
+
+def _update_report(flow, setup, sent, received, ttfts, totals):
+    return {
+        "flow": flow,
+        "updates": len(totals),
+        "setup_bytes": setup,
+        "bytes_sent_per_update": round(sum(sent) / len(sent)) if sent else None,
+        "bytes_received_per_update": round(sum(received) / len(received)) if received else None,
+        **{f"ttft_p{p}_ms": _ms(percentile(ttfts, p)) for p in (50, 95, 99)},
+        **{f"total_p{p}_ms": _ms(percentile(totals, p)) for p in (50, 95, 99)},
+    }
+
+
+def _old_update(port, text, tone):
+    """POST /stream(글 전체) → GET /stream-events를 [DONE]까지 (EventSource처럼 요청마다 새 연결)"""
+    started, ttft, sent, received = time.perf_counter(), None, 0, 0
+    sock = _counting_socket(port)
+    try:
+        head, _, body = _http(sock, "POST", "/stream", {"message": text, "tone": tone}).partition(b"\r\n\r\n")
+        length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                       if line.lower().startswith(b"content-length:")), 0)
+        while len(body) < length:
+            body += sock.recv(65536)
+        session_id = json.loads(body)["session_id"]
+    finally:
+        sent, received = sent + sock.sent, received + sock.received
+        sock.close()
+    sock = _counting_socket(port)
+    try:
+        buffer = _http(sock, "GET", f"/stream-events?session_id={session_id}")
+        while b"[DONE]" not in buffer:
+            if ttft is None and b"data: " in buffer.partition(b"\r\n\r\n")[2]:
+                ttft = time.perf_counter() - started
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buffer += chunk
+    finally:
+        sent, received = sent + sock.sent, received + sock.received
+        sock.close()
+    total = time.perf_counter() - started
+    return sent, received, ttft if ttft is not None else total, total
+
+
+def _ws_update(ws, sock, version, edit):
+    """편집 델타 하나를 보내고 그 버전의 예측이 끝날 때까지 받음"""
+    sent, received = sock.sent, sock.received
+    started, ttft = time.perf_counter(), None
+    pos, delete, insert = edit
+    ws.send(json.dumps({"op": "edit", "v": version, "pos": pos, "del": delete, "ins": insert}, ensure_ascii=False))
+    while True:
+        message = json.loads(ws.recv(timeout=30))
+        if message.get("error"):
+            raise RuntimeError(message["error"])
+        if message.get("v") != version:
+            continue
+        if ttft is None and "token" in message:
+            ttft = time.perf_counter() - started
+        if "done" in message:
+            break
+    total = time.perf_counter() - started
+    return sock.sent - sent, sock.received - received, ttft if ttft is not None else total, total
+
+
+def bench_ws(args):
+    """
+    같은 편집 목록을 두 흐름으로 보내 편집당 전송량과 갱신 지연(첫 토큰 / 예측 완료)을 비교
+    편집마다 예측 하나를 끝까지 받는 순차 시나리오. 서버(asgi_app)는 흐름마다 새로 띄워 완성 캐시를 공유하지 않는다.
+    """
+    from piece_table import PieceTable
+    from websockets.sync.client import connect
+
+    essay, edits = _essay_edits(args.essay_chars, args.requests, random.Random(0))
+    report = []
+    for flow in ("stream+events", "ws"):
+        server, port = _start_asgi(args)
+        sent, received, ttfts, totals = [], [], [], []
+        try:
+            if flow == "ws":
+                sock = _counting_socket(port)
+                with connect(f"ws://127.0.0.1:{port}/ws", sock=sock, max_size=None) as ws:
+                    ws.send(json.dumps({"op": "init", "text": essay, "tone": args.tone, "features": ["predict"]},
+                                       ensure_ascii=False))
+                    while "ready" not in json.loads(ws.recv(timeout=30)):
+                        pass
+                    time.sleep(args.ttft + 0.5)  # init이 시작한 예측은 측정에서 제외
+                    setup = sock.sent + sock.received
+                    for version, edit in enumerate(edits, start=1):
+                        for values, value in zip((sent, received, ttfts, totals), _ws_update(ws, sock, version, edit)):
+                            values.append(value)
+            else:
+                setup, doc = 0, PieceTable(essay)
+                for pos, delete, insert in edits:
+                    doc.apply(pos, delete, insert)
+                    # 기존 프런트엔드는 커서 위치와 무관하게 글 전체를 보낸다 → 이어 치기는 커서 = 글 끝
+                    update = _old_update(port, doc.text(), args.tone)
+                    for values, value in zip((sent, received, ttfts, totals), update):
+                        values.append(value)
+        finally:
+            server.terminate()
+            server.wait(timeout=15)
+        report.append(_update_report(flow, setup, sent, received, ttfts, totals))
+    return report
+
+
+# -----------------------------------------------------------
+# 🔟 스크립트 실행 점검 (python app.py — patch 순서 · 모듈 수준 락 회귀 확인)
+# -----------------------------------------------------------
+SMOKE_ROUTES = [
+    # (메서드, 경로, 본문, SSE 여부) — 경로의 {session}은 /stream이 발급한 id
+    ("POST", "/stream", {"message": SAMPLE_INPUT}, False),
+    ("GET", "/stream-events?session_id={session}", None, True),
+    ("POST", "/stream-events", {"message": SAMPLE_INPUT}, True),
+    ("POST", "/suggest", {"message": SAMPLE_INPUT}, False),
+    ("POST", "/suggest-stream", {"message": SAMPLE_INPUT}, True),
+    ("POST", "/suggest-streamed", {"message": SAMPLE_INPUT}, True),
+    ("POST", "/detect", {"message": SAMPLE_INPUT + "."}, False),
+    ("POST", "/detect-stream", {"message": SAMPLE_INPUT + "."}, True),
+    ("POST", "/assist", {"message": SAMPLE_INPUT}, True),
+    ("GET", "/stats", None, False),
+    ("GET", "/metrics", None, False),
+]
+
+
+def smoke_app(args):
+    """가짜 LLM으로 `python app.py`를 띄우고 라우트마다 한 번씩 호출 → [{route, status, ok, ms}]"""
+    import subprocess
+    import sys
+
+    port = _free_port()
+    env = dict(os.environ, LLM_PROVIDER="fake", FAKE_LLM_TTFT=str(args.ttft),
+               FAKE_LLM_TOKEN_DELAY=str(args.token_delay), SHARED_CACHE_PATH="off", PORT=str(port),
+               PYTHONUNBUFFERED="1")
+    server = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    report = []
+    try:
+        deadline = time.monotonic() + 60  # 모델 · 토크나이저 준비 후 serve_forever에서 듣기 시작
+        while True:
+            try:
+                _counting_socket(port).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    return [{"route": "python app.py", "status": None, "ok": False, "ms": None}]
+                time.sleep(0.2)
+        session = ""
+        for method, path, payload, streaming in SMOKE_ROUTES:
+            path = path.format(session=session)
+            started = time.perf_counter()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)  # 멈추면 실패로 셈
+            try:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload else None
+                conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                data = resp.read().decode("utf-8", "replace")
+                status = resp.status
+                ok = status == 200 and (not streaming or "[DONE]" in data)
+                if path == "/stream" and ok:
+                    session = json.loads(data)["session_id"]
+            except OSError:
+                status, ok = None, False
+            finally:
+                conn.close()
+            report.append({"route": f"{method} {path.split('?')[0]}", "status": status, "ok": ok,
+                           "ms": _ms(time.perf_counter() - started)})
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="글잇다 스트리밍 경로 오프라인 벤치마크")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="라우트별 요청 수")
+    parser.add_argument("--routes", nargs="*", default=[name for name, _, _ in ROUTES])
+    parser.add_argument("--ttft", type=float, default=0.3, help="가짜 LLM 첫 토큰 지연 (초)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="가짜 LLM 토큰 간 지연 (초)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tone", default="자동 감지")
+    parser.add_argument("--same-input", action="store_true", help="모든 요청에 같은 입력 사용")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    parser.add_argument("--passage-index", action="store_true", help="구절 색인 메모리·조회 지연만 측정")
+    parser.add_argument("--framing", choices=["compact", "legacy", "both"], default="compact",
+                        help="SSE 프레이밍 (both: 스트리밍 라우트를 두 방식으로 각각 측정)")
+    parser.add_argument("--scheduler", choices=["fifo", "priority", "both"],
+                        help="스케줄러 시나리오만 실행 (--concurrency = 작업 풀 크기)")
+    parser.add_argument("--users", type=int, default=8, help="[scheduler] 타이핑 사용자 수")
+    parser.add_argument("--background", type=int, default=8, help="[scheduler] 일괄 작업 폭주 스레드 수")
+    parser.add_argument("--duration", type=float, default=5.0, help="[scheduler] 시나리오 길이 (초)")
+    parser.add_argument("--keystroke-gap", type=float, default=0.1, help="[scheduler] 예측 요청 간격 (초)")
+    parser.add_argument("--rpm", type=float, default=0, help="[scheduler] 분당 요청 예산 (0: 무제한)")
+    parser.add_argument("--tpm", type=float, default=0, help="[scheduler] 분당 토큰 예산 (0: 무제한)")
+    parser.add_argument("--backends", action="store_true",
+                        help="AI Cursor 타이핑 시퀀스(--requests회)로 원격 모델과 CPU 로컬 모델 지연 비교")
+    parser.add_argument("--remote", choices=["fake", "openai"], default="fake",
+                        help="[backends] 원격 쪽 (fake: --ttft/--token-delay로 흉내, openai: 실제 API)")
+    parser.add_argument("--resilience", choices=["off", "on", "both"],
+                        help="느린 응답 주입 시나리오만 실행 (off: 헤지 없음, on: 헤지)")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="[resilience] 첫 토큰이 느린 호출 비율")
+    parser.add_argument("--slow-ttft", type=float, default=2.0, help="[resilience] 느린 호출의 첫 토큰 지연 (초)")
+    parser.add_argument("--serve-workers", type=int, nargs="+",
+                        help="serve.py를 워커 수별로 띄워 --routes 부하 측정 (예: 1 2 4)")
+    parser.add_argument("--ws", action="store_true",
+                        help="긴 글 편집 --requests회: /stream + /stream-events 전체 재전송 vs /ws 편집 델타")
+    parser.add_argument("--essay-chars", type=int, default=5000, help="[ws] 글 길이 (글자)")
+    parser.add_argument("--smoke", action="store_true",
+                        help="python app.py를 띄워 라우트마다 한 번씩 호출 (실패가 있으면 종료 코드 1)")
+    args = parser.parse_args(argv)
+
+    if args.smoke:
+        report = smoke_app(args)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for r in report:
+                print(f"[smoke] {r['route']:<24} status={r['status']} {'ok' if r['ok'] else 'FAIL'} ms={r['ms']}")
+        if not all(r["ok"] for r in report):
+            raise SystemExit(1)
+        return report
+
+    if args.passage_index:
+        return bench_passage_index(args)
+
+    if args.backends:
+        report = bench_backends(args)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for r in report:
+                if r.get("skipped"):
+                    print(f"[backend: {r['backend']}] 건너뜀 ({r['skipped']})")
+                    continue
+                print(f"[backend: {r['backend']} {r['model']}] keystrokes={r['keystrokes']} errors={r['errors']}")
+                print(f"  TTFT ms   p50={r['ttft_p50_ms']} p95={r['ttft_p95_ms']} p99={r['ttft_p99_ms']}")
+                print(f"  total ms  p50={r['total_p50_ms']} p95={r['total_p95_ms']} p99={r['total_p99_ms']}")
+                if "engine" in r:
+                    e = r["engine"]
+                    print(f"  KV reuse={e['kv_reuse_rate']} prefill tokens={e['prefill_tokens']}"
+                          f"/{e['prompt_tokens']} generated={e['generated_tokens']}")
+        return report
+
+    if args.serve_workers:
+        report = bench_workers(args)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for r in report:
+                if r.get("skipped"):
+                    print(f"[workers: {r['workers']}] 건너뜀 ({r['skipped']})")
+                    continue
+                print(f"[workers: {r['workers']}] ok={r['ok']} errors={r['errors']} "
+                      f"route avg rps={r['throughput_rps']}")
+                for route in r["routes"]:
+                    print(f"  {route['route']:<17} rps={route['throughput_rps']} "
+                          f"TTFT ms p50={route['ttft_ms']['p50']} p99={route['ttft_ms']['p99']} "
+                          f"total ms p50={route['total_ms']['p50']} p99={route['total_ms']['p99']}")
+        return report
+
+    if args.ws:
+        report = bench_ws(args)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for r in report:
+                print(f"[sync: {r['flow']}] essay={args.essay_chars}자 updates={r['updates']} "
+                      f"setup bytes={r['setup_bytes']}")
+                print(f"  bytes/update sent={r['bytes_sent_per_update']} received={r['bytes_received_per_update']}")
+                print(f"  TTFT ms   p50={r['ttft_p50_ms']} p95={r['ttft_p95_ms']} p99={r['ttft_p99_ms']}")
+                print(f"  total ms  p50={r['total_p50_ms']} p95={r['total_p95_ms']} p99={r['total_p99_ms']}")
+        return report
+
+    if args.resilience:
+        import llm_registry
+        llm_registry.use_provider(
+            "fake", ttft=args.ttft, inter_token_delay=args.token_delay, error_rate=args.error_rate,
+            slow_rate=args.slow_rate, slow_ttft=args.slow_ttft,
+        )
+        modes = ["off", "on"] if args.resilience == "both" else [args.resilience]
+        report = [bench_resilience(args, mode) for mode in modes]
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for r in report:
+                print(f"[resilience: {r['mode']}] slow_rate={args.slow_rate} slow_ttft={args.slow_ttft}s")
+                for feature in ("predict", "suggest"):
+                    f = r[feature]
+                    print(f"  {feature:<8} ok={f['ok']} errors={f['errors']} "
+                          f"TTFT ms p50={f['ttft_p50_ms']} p95={f['ttft_p95_ms']} p99={f['ttft_p99_ms']} "
+                          f"total ms p50={f['total_p50_ms']} p95={f['total_p95_ms']} p99={f['total_p99_ms']}")
+                    print(f"           hedged={f['hedged']} wins={f['hedge_wins']} denied={f['hedge_denied']} "
+                          f"timeouts ttft={f['ttft_timeouts']} total={f['total_timeouts']}")
+        return report
+
+    if args.scheduler:
+        import llm_registry
+        llm_registry.use_provider(
+            "fake", ttft=args.ttft, inter_token_delay=args.token_delay, error_rate=args.error_rate
+        )
+        modes = ["fifo", "priority"] if args.scheduler == "both" else [args.scheduler]
+        report = [bench_scheduler(args, mode) for mode in modes]
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for r in report:
+                i, b = r["interactive"], r["background"]
+                print(f"[scheduler: {r['mode']}] pool={r['pool']['workers']} peak_queued={r['pool']['peak_queued']}")
+                print(f"  interactive ok={i['completed']} rejected={i['rejected']} errors={i['errors']} "
+                      f"TTFT ms p50={i['ttft_p50_ms']} p95={i['ttft_p95_ms']} p99={i['ttft_p99_ms']} "
+                      f"fairness={i['fairness']}")
+                print(f"  background  ok={b['completed']} rejected={b['rejected']} errors={b['errors']} "
+                      f"latency ms p50={b['latency_p50_ms']} p95={b['latency_p95_ms']} p99={b['latency_p99_ms']}")
+                if r["scheduler"]:
+                    for name, c in r["scheduler"]["classes"].items():
+                        print(f"  {name:<11} dispatched={c['dispatched']} stale={c['dropped_stale']} "
+                              f"wait ms p50={c['queue_wait_ms_p50']} p95={c['queue_wait_ms_p95']} "
+                              f"p99={c['queue_wait_ms_p99']}")
+        return report
+
+    import llm_registry
+    llm_registry.use_provider(
+        "fake", ttft=args.ttft, inter_token_delay=args.token_delay, error_rate=args.error_rate
+    )
+    from app import app
+    import ai_handler
+
+    server = start_server(app)
+    port = server.server_port
+    report = []
+    try:
+        framings = ["compact", "legacy"] if args.framing == "both" else [args.framing]
+        runs = [
+            (name, path, streaming, framing if streaming else None)
+            for name, path, streaming in ROUTES
+            if name in args.routes
+            for framing in (framings if streaming else [None])
+        ]
+        for name, path, streaming, framing in runs:
+            ai_handler.completion_cache.clear()
+            sampler = ResourceSampler(busy=lambda: ai_handler.worker_pool.stats()["busy"])
+            baseline_rss = sampler.rss()
+            baseline_threads = threading.active_count()
+            sampler.start()
+            result = run_route(port, name, path, streaming, args, sampler, framing)
+            sampler.stop()
+
+            if streaming and psutil and sampler.peak_streams:
+                result["mem_per_stream_kb"] = round(
+                    (sampler.peak_rss - baseline_rss) / sampler.peak_streams / 1024, 1
+                )
+            result["peak_open_streams"] = sampler.peak_streams
+            result["peak_threads"] = sampler.peak_threads
+            result["extra_threads"] = sampler.peak_threads - baseline_threads
+            result["peak_upstream_threads"] = sampler.peak_upstream_threads
+            report.append(result)
+            if not args.json:
+                print_result(result)
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps({"config": vars(args), "results": report, "stats": ai_handler.get_stats()},
+                         ensure_ascii=False, indent=2))
+    return report
+
+
+def print_result(r):
+    print(f"[{r['route']}] n={r['requests']} errors={r['errors']} rps={r['throughput_rps']}")
+    print(f"  TTFT ms   p50={r['ttft_ms']['p50']} p95={r['ttft_ms']['p95']} p99={r['ttft_ms']['p99']}")
+    print(f"  total ms  p50={r['total_ms']['p50']} p95={r['total_ms']['p95']} p99={r['total_ms']['p99']}")
+    print(f"  tokens/s={r['tokens_per_sec']} mem/stream KB={r.get('mem_per_stream_kb', 'n/a')} "
+          f"open streams={r['peak_open_streams']} threads peak={r['peak_threads']} "
+          f"(+{r['extra_threads']}, upstream={r['peak_upstream_threads']})")
+    if r["frames_per_response"]:
+        print(f"  frames/response={r['frames_per_response']} bytes/response={r['bytes_per_response']}")
+
+
+if __name__ == "__main__":
+    main()
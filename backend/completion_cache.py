@@ -0,0 +1,156 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+"""
+완성 결과 캐시 (LRU + TTL)
+- 정확 일치: (정규화 입력, 문체, 엔드포인트) 키로 이전 결과 재사용
+- 접두 일치: 새 입력 = 이전 입력 + 이전 예측의 앞부분이면, 예측의 나머지를 바로 반환
+  (AI Cursor에서 사용자가 예측대로 타이핑하는 경우 LLM 호출 없이 응답)
+- shared(shared_cache.SharedStore)가 있으면 메모리(L1)에 없을 때 프로세스 간 공유 저장소(L2)를 보고,
+  저장은 두 곳에 함께 한다 (다른 워커 프로세스가 만든 결과 재사용).
+"""
+
+
+def normalize_input(text: str) -> str:
+    """NFC 정규화(한글 자모 조합 통일) + 앞뒤 공백 제거"""
+    return unicodedata.normalize("NFC", text or "").strip()
+
+
+def _continuation_after(typed: str, prediction: str):
+    """
+    typed가 prediction의 앞부분과 일치하면(공백 차이는 무시) 나머지 예측을 반환.
+    일치하지 않거나 남은 예측이 없으면 None.
+    """
+    i = j = 0
+    while i < len(typed):
+        if typed[i].isspace():
+            i += 1
+            continue
+        while j < len(prediction) and prediction[j].isspace():
+            j += 1
+        if j >= len(prediction) or prediction[j] != typed[i]:
+            return None
+        i += 1
+        j += 1
+    rest = prediction[j:]
+    return rest if rest.strip() else None
+
+
+def _shared_key(text, tone, endpoint):
+    return f"{endpoint}\x1f{tone}\x1f{text}"
+
+
+class CompletionCache:
+    """LRU + TTL 완성 캐시 (스레드 안전)"""
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 600.0, max_prefix_lookback: int = 64, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_prefix_lookback = max_prefix_lookback
+        self.shared = shared
+        self._entries = OrderedDict()  # (input, tone, endpoint) -> (expires_at, completion)
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "prefix_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def _get_locked(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, completion = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self._stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return completion
+
+    def get(self, user_input: str, tone: str, endpoint: str, prefix: bool = False):
+        """
+        캐시된 완성을 반환 (없으면 None).
+        prefix=True면 정확 일치 실패 시 접두 일치(이전 입력 + 예측 일부)도 시도한다.
+        """
+        text = normalize_input(user_input)
+        now = time.monotonic()
+        with self._lock:
+            completion = self._get_locked((text, tone, endpoint), now)
+            if completion is not None:
+                self._stats["hits"] += 1
+                return completion
+
+            # 최근 입력은 몇 글자씩만 늘어나므로 짧은 꼬리만 잘라 가며 이전 입력을 찾는다
+            cuts = []
+            if prefix:
+                for cut in range(1, min(self.max_prefix_lookback, len(text) - 1) + 1):
+                    if text[:-cut] == text[:-cut].rstrip():  # 저장 키는 항상 strip된 상태
+                        cuts.append(cut)
+                for cut in cuts:
+                    prediction = self._get_locked((text[:-cut], tone, endpoint), now)
+                    rest = _continuation_after(text[-cut:], prediction) if prediction is not None else None
+                    if rest is not None:
+                        self._stats["prefix_hits"] += 1
+                        return rest
+            if self.shared is None:
+                self._stats["misses"] += 1
+                return None
+
+        # L2: 정확 일치와 접두 후보를 쿼리 한 번으로 (락 밖에서 — 파일 잠금을 기다릴 수 있음)
+        bases = {_shared_key(text[:-cut], tone, endpoint): cut for cut in cuts}
+        found = self.shared.get_many("completion", [_shared_key(text, tone, endpoint), *bases])
+        completion = found.pop(_shared_key(text, tone, endpoint), None)
+        if completion is not None:
+            self._store(text, tone, endpoint, completion)
+            return self._count("shared_hits", completion)
+        for key, cut in bases.items():
+            prediction = found.get(key)
+            rest = _continuation_after(text[-cut:], prediction) if prediction is not None else None
+            if rest is not None:
+                self._store(text[:-cut], tone, endpoint, prediction)
+                return self._count("shared_hits", rest)
+        return self._count("misses", None)
+
+    def _count(self, name, result):
+        with self._lock:
+            self._stats[name] += 1
+        return result
+
+    def put(self, user_input: str, tone: str, endpoint: str, completion: str):
+        if not completion:
+            return
+        text = normalize_input(user_input)
+        self._store(text, tone, endpoint, completion)
+        if self.shared is not None:
+            self.shared.put("completion", _shared_key(text, tone, endpoint), completion, self.ttl)
+
+    def _store(self, text, tone, endpoint, completion):
+        key = (text, tone, endpoint)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, completion)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear("completion")
+
+    def stats(self):
+        """적중/실패/퇴출 카운터와 절약된 업스트림 호출 수"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        stats["upstream_calls_saved"] = stats["hits"] + stats["prefix_hits"] + stats["shared_hits"]
+        lookups = stats["upstream_calls_saved"] + stats["misses"]
+        stats["hit_rate"] = round(stats["upstream_calls_saved"] / lookups, 4) if lookups else 0.0
+        return stats
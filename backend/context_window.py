@@ -0,0 +1,229 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from incremental_detect import split_sentences
+from scheduler import estimate_tokens
+from worker_pool import parse_map
+
+"""
+긴 글의 프롬프트 문맥 관리
+예측·제안은 글의 마지막 몇 문장만 있으면 되는데, 지금까지는 키 입력마다 글 전체를 보냈다.
+기능별 토큰 예산을 넘으면 입력을
+  [앞부분 요약] 앞쪽 글에서 고른 핵심 문장 (추출 요약)
+  [이어지는 본문] …최근 문장들 + 작성 중인 조각 (원문 그대로)
+으로 바꾼다. 이어 쓰기 위치(글의 끝)는 항상 그대로 남는다.
+- 토큰 수: tiktoken이 있으면 모델 인코딩으로, 없거나 인코딩을 받을 수 없으면 글자 기반 추정
+- 요약은 문서별로 캐시하고, 창이 앞으로 밀려 요약 대상이 늘어나면 새 문장만 채점해 갱신한다.
+"""
+
+DEFAULT_BUDGETS = {
+    "predict": 400,
+    "suggest_stream": 600,
+    "suggest_streamed": 800,
+    "suggest": 1200,
+}
+
+_TERM_RE = re.compile(r"[0-9A-Za-z가-힣]{2,}")
+
+
+class TokenCounter:
+    """모델 토크나이저(tiktoken) 또는 글자 기반 추정"""
+
+    def __init__(self, model: str = None, encoding: str = None):
+        self.model = model
+        self.encoding_name = encoding
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.backend = "heuristic"
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                import tiktoken
+                if self.encoding_name:
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                else:
+                    try:
+                        self._encoding = tiktoken.encoding_for_model(self.model or "")
+                    except KeyError:
+                        self._encoding = tiktoken.get_encoding("o200k_base")
+                self.backend = f"tiktoken:{self._encoding.name}"
+            except Exception as e:  # 미설치 또는 인코딩 파일을 받을 수 없음(오프라인)
+                print(f"[경고] tiktoken을 사용할 수 없어 토큰 수를 추정합니다: {type(e).__name__}")
+            self._loaded = True
+
+    def count(self, text: str) -> int:
+        if not self._loaded:
+            self._load()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+
+def _terms(sentence: str):
+    # 조사·어미를 대충 떼기 위해 어절 앞 두 글자를 어간처럼 사용
+    return frozenset(word[:2] if "가" <= word[0] <= "힣" else word.lower() for word in _TERM_RE.findall(sentence))
+
+
+def _overlap(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class _Summary:
+    """문서 하나의 요약 상태 — 지금까지 요약한 앞부분과 문장별 용어"""
+
+    __slots__ = ("covered_len", "covered_hash", "sentences", "tf", "text", "budget")
+
+    def __init__(self):
+        self.covered_len = 0
+        self.covered_hash = None
+        self.sentences = []  # (문장, 용어 집합, 토큰 수)
+        self.tf = Counter()
+        self.text = None     # 마지막으로 만든 요약 (budget이 같으면 재사용)
+        self.budget = None
+
+
+class ContextBuilder:
+    """build(feature, text) → (프롬프트에 넣을 텍스트, 원래 토큰 수, 줄인 뒤 토큰 수)"""
+
+    def __init__(self, counter: TokenCounter = None, budgets=None, summary_share: float = 0.3,
+                 max_documents: int = 512):
+        self.counter = counter or TokenCounter()
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.summary_share = summary_share
+        self.max_documents = max_documents
+        self._summaries = OrderedDict()  # 문서 앞부분 해시 -> _Summary
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._summary_stats = {"built": 0, "reused": 0, "extended": 0, "rebuilt": 0}
+
+    @classmethod
+    def from_env(cls, model: str = None):
+        return cls(
+            counter=TokenCounter(model=model, encoding=os.getenv("CONTEXT_TOKENIZER") or None),
+            budgets=parse_map(os.getenv("CONTEXT_BUDGETS"), int),
+            summary_share=float(os.getenv("CONTEXT_SUMMARY_SHARE", "0.3")),
+        )
+
+    def warmup(self):
+        """토크나이저를 미리 불러옴 (인코딩 파일 다운로드를 첫 요청에서 하지 않도록)"""
+        self.counter.count("")
+
+    def build(self, feature: str, text: str):
+        budget = self.budgets.get(feature, 0)
+        before = self.counter.count(text)
+        if budget <= 0 or before <= budget:
+            return text, before, before
+
+        sentences = split_sentences(text)
+        if not sentences:
+            return text, before, before
+        window_budget = budget - int(budget * self.summary_share)
+
+        # 뒤에서부터 창에 들어가는 만큼 문장을 담는다 (마지막 조각은 항상 포함)
+        keep, used = len(sentences), 0
+        while keep > 0:
+            cost = self.counter.count(sentences[keep - 1][2]) + 1
+            if used + cost > window_budget and keep < len(sentences):
+                break
+            used += cost
+            keep -= 1
+        recent = text[sentences[keep][0]:]
+        while self.counter.count(recent) > window_budget and len(recent) > 1:
+            recent = recent[len(recent) // 4:]  # 문장 하나가 예산보다 긴 경우
+
+        # 요약 예산은 고정 → 글 끝에서 타이핑하는 동안에는 요약이 바뀌지 않고 캐시에서 재사용
+        earlier = text[:sentences[keep][0]] if keep else ""
+        summary = self._summary(earlier, budget - window_budget) if earlier.strip() else ""
+        if summary:
+            context = f"[앞부분 요약] {summary}\n[이어지는 본문] …{recent}"
+        else:
+            context = f"…{recent}"
+        return context, before, self.counter.count(context)
+
+    # -----------------------------------------------------------
+    # 앞부분 추출 요약 (문서별 캐시, 덧붙여진 문장만 새로 채점)
+    # -----------------------------------------------------------
+    def _summary(self, earlier: str, budget: int):
+        if budget <= 0:
+            return ""
+        doc_key = hashlib.blake2b(earlier[:200].encode("utf-8"), digest_size=8).hexdigest()
+        with self._lock:
+            state = self._summaries.get(doc_key)
+            if state is None:
+                state = self._summaries[doc_key] = _Summary()
+                self._summary_stats["built"] += 1
+            else:
+                covered = earlier[:state.covered_len]
+                if (len(earlier) < state.covered_len
+                        or hashlib.blake2b(covered.encode("utf-8"), digest_size=16).digest() != state.covered_hash):
+                    # 요약한 앞부분이 수정됨 → 처음부터
+                    self._summary_stats["rebuilt"] += 1
+                    state.sentences, state.tf, state.covered_len, state.text = [], Counter(), 0, None
+                elif len(earlier) == state.covered_len and state.budget == budget:
+                    self._summary_stats["reused"] += 1
+                    return state.text
+                else:
+                    self._summary_stats["extended"] += 1
+            self._summaries.move_to_end(doc_key)
+            while len(self._summaries) > self.max_documents:
+                self._summaries.popitem(last=False)
+
+            for _, _, sentence in split_sentences(earlier[state.covered_len:]):
+                terms = _terms(sentence)
+                state.sentences.append((sentence, terms, self.counter.count(sentence) + 1))
+                state.tf.update(terms)
+            state.covered_len = len(earlier)
+            state.covered_hash = hashlib.blake2b(earlier.encode("utf-8"), digest_size=16).digest()
+            state.text = self._select(state, budget)
+            state.budget = budget
+            return state.text
+
+    def _select(self, state, budget):
+        """글 전체에 자주 나오는 용어를 많이 담은 문장 순으로 예산만큼 골라 원래 순서로"""
+        def score(item):
+            index, (_, terms, _) = item
+            if not terms:
+                return 0.0
+            value = sum(state.tf[t] for t in terms) / math.sqrt(len(terms))
+            return value * (1.5 if index == 0 else 1.0)  # 첫 문장은 대개 주제문
+
+        chosen, used = [], 0
+        for index, (_, terms, cost) in sorted(enumerate(state.sentences), key=score, reverse=True):
+            if used + cost > budget or any(_overlap(terms, state.sentences[i][1]) > 0.6 for i in chosen):
+                continue  # 예산 초과 또는 이미 고른 문장과 거의 같은 내용
+            chosen.append(index)
+            used += cost
+        return " ".join(state.sentences[i][0] for i in sorted(chosen))
+
+    # -----------------------------------------------------------
+    # 통계
+    # -----------------------------------------------------------
+    def record(self, feature: str, input_before: int, input_after: int, prompt_after: int):
+        """줄이기 전후 입력·프롬프트 토큰 수 누적 (프롬프트 전 = 후 + 줄인 만큼)"""
+        with self._lock:
+            stats = self._stats.setdefault(feature, {
+                "calls": 0, "trimmed": 0, "input_tokens_before": 0, "input_tokens_after": 0,
+                "prompt_tokens_before": 0, "prompt_tokens_after": 0,
+            })
+            stats["calls"] += 1
+            stats["trimmed"] += input_after < input_before
+            stats["input_tokens_before"] += input_before
+            stats["input_tokens_after"] += input_after
+            stats["prompt_tokens_before"] += prompt_after + input_before - input_after
+            stats["prompt_tokens_after"] += prompt_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokenizer": self.counter.backend,
+                "budgets": dict(self.budgets),
+                "summaries": dict(self._summary_stats, documents=len(self._summaries)),
+                "features": {feature: dict(stats) for feature, stats in self._stats.items()},
+            }
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from ai_async import adetect_errors_stream, astream_generate_suggestions, astream_predict_text
+from piece_table import EditError, PieceTable
+from scheduler import current_user
+from session_store import DEFAULT_TONE
+
+"""
+WebSocket 문서 동기화 채널 (asgi_app /ws)
+서버 쪽 시제품이다 — uvicorn으로 asgi_app을 띄울 때만 열리고(serve.py의 Flask WSGI 앱에는 없음),
+프론트엔드(AI Cursor)는 아직 /stream + /stream-events를 쓴다.
+AI Cursor는 키 입력마다 글 전체를 /stream에 다시 POST하고 새 EventSource를 열었다 (글이 길수록 전송량 · 파싱 비용 증가,
+키 입력마다 HTTP 연결 비용). 여기서는 연결 하나를 유지하고 클라이언트가 작은 편집(위치, 지운 글자 수, 넣은 글)만 보낸다.
+서버는 연결마다 문서를 피스 테이블(piece_table)로 들고 있고, 편집이 오면
+- 진행 중인 예측을 취소(업스트림도 닫힘)하고 커서 앞 글로 새 예측을 바로 시작,
+- 제안 · 탐지는 입력이 analyze_idle초 멈추면 실행 (편집이 오면 취소),
+- 결과는 같은 소켓으로 보낸다. 연속된 토큰은 한 메시지로 묶고, 이전 버전의 결과는 버린다.
+
+메시지 (JSON 텍스트)
+ 클라이언트 → 서버
+  {"op": "init", "text": "...", "tone": "논리적", "features": ["predict", "suggest", "detect"], "cursor": 12}
+  {"op": "edit", "v": 5, "pos": 120, "del": 0, "ins": "다"}      v = 이 편집을 적용한 뒤의 문서 버전 (init = 0)
+  {"op": "edit", "v": 6, "edits": [[120, 1, ""], [119, 0, "가"]]} 여러 편집을 한 버전으로
+  {"op": "tone", "tone": "감성적"} / {"op": "analyze"} (제안 · 탐지를 바로 실행)
+ 서버 → 클라이언트
+  {"ready": 0}                                   init 적용 완료 (현재 버전)
+  {"channel": "predict", "v": 5, "token": "..."}  predict / suggest 토큰
+  {"channel": "detect", "v": 5, "item": {...}}   오류 객체 하나
+  {"channel": "predict", "v": 5, "done": "completed", "elapsed_ms": 83.1}  (+ detect는 "summary")
+  {"error": "...", "resync": true}               버전 · 범위가 어긋남 → 클라이언트는 init으로 전체를 다시 보냄
+"""
+
+CHANNELS = ("predict", "suggest", "detect")
+MAX_DOCUMENT_CHARS = int(os.getenv("WS_MAX_DOCUMENT_CHARS", "100000"))
+ANALYZE_IDLE = float(os.getenv("WS_ANALYZE_IDLE", "1.0"))
+
+_stats_lock = threading.Lock()
+_stats = {
+    "connections": 0, "open": 0, "edits": 0, "resyncs": 0,
+    "predictions_cancelled": 0, "messages_in": 0, "messages_out": 0, "bytes_in": 0, "bytes_out": 0,
+}
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, value in deltas.items():
+            _stats[name] += value
+
+
+def ws_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+# -----------------------------------------------------------
+# 1️⃣ 연결 하나의 문서 · 진행 중 작업
+# -----------------------------------------------------------
+class DocSession:
+    """handle(메시지)로 편집을 적용하고, 결과 메시지는 send(텍스트)로 보낸다"""
+
+    def __init__(self, send, user: str = None, analyze_idle: float = ANALYZE_IDLE):
+        self.send = send
+        self.user = user
+        self.analyze_idle = analyze_idle
+        self.doc = None
+        self.version = 0
+        self.cursor = 0
+        self.tone = DEFAULT_TONE
+        self.features = set(CHANNELS)
+        self._tasks = {}            # 채널 -> 진행 중인 asyncio.Task
+        self._analysis = None       # 제안 · 탐지 지연 실행 태스크
+        self._outbox = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write())
+        _count(connections=1, open=1)
+
+    async def handle(self, raw: str):
+        _count(messages_in=1, bytes_in=len(raw.encode("utf-8")))
+        try:
+            message = json.loads(raw)
+            op = message.get("op")
+        except (ValueError, AttributeError):
+            return self._error("JSON 객체가 아닙니다")
+        if op == "init":
+            text = message.get("text") or ""
+            if not isinstance(text, str) or len(text) > MAX_DOCUMENT_CHARS:
+                return self._error(f"문서는 {MAX_DOCUMENT_CHARS}자 이하의 문자열이어야 합니다")
+            try:
+                cursor = int(message.get("cursor", len(text)))
+            except (TypeError, ValueError):
+                return self._error("cursor는 정수여야 합니다", resync=True)
+            self.doc, self.version = PieceTable(text), 0
+            self.cursor = min(max(0, cursor), len(text))
+            self.tone = message.get("tone") or self.tone
+            features = message.get("features")
+            if isinstance(features, list):
+                self.features = {f for f in features if f in CHANNELS}
+            self._emit({"ready": self.version})
+            self._restart(analyze_now=True)
+        elif op == "edit":
+            self._edit(message)
+        elif op == "tone" and self.doc is not None:
+            self.tone = message.get("tone") or DEFAULT_TONE
+            self._restart(analyze_now=True)
+        elif op == "analyze" and self.doc is not None:
+            self._restart(predict=False, analyze_now=True)
+        else:
+            self._error(f"알 수 없는 요청: {op}", resync=self.doc is None)
+
+    def _edit(self, message):
+        if self.doc is None:
+            return self._error("init 전에 편집을 받았습니다", resync=True)
+        if message.get("v") != self.version + 1:
+            return self._error(f"버전 불일치: 서버 {self.version}, 편집 {message.get('v')}", resync=True)
+        edits = message.get("edits")
+        if edits is None:
+            edits = [[message.get("pos", 0), message.get("del", 0), message.get("ins", "")]]
+        try:
+            for pos, delete, insert in edits:
+                self.doc.apply(int(pos), int(delete), insert or "")
+                self.cursor = int(pos) + len(insert or "")
+                if len(self.doc) > MAX_DOCUMENT_CHARS:
+                    raise EditError(f"문서는 {MAX_DOCUMENT_CHARS}자 이하여야 합니다")
+        except (EditError, TypeError, ValueError) as e:
+            # 일부만 적용됐을 수 있으므로 문서를 버리고 전체를 다시 받는다
+            self.doc = None
+            return self._error(str(e), resync=True)
+        self.version += 1
+        _count(edits=1)
+        self._restart()
+
+    def _error(self, text, resync=False):
+        if resync:
+            _count(resyncs=1)
+        self._emit({"error": text, "resync": resync})
+
+    # -----------------------------------------------------------
+    # 작업 재시작 (편집마다)
+    # -----------------------------------------------------------
+    def _restart(self, predict=True, analyze_now=False):
+        if predict:
+            task = self._tasks.pop("predict", None)
+            if task and not task.done():
+                task.cancel()  # 태스크 취소 → ai_async 스트림이 닫히며 업스트림 생성도 중단
+                _count(predictions_cancelled=1)
+        for channel in ("suggest", "detect"):
+            task = self._tasks.pop(channel, None)
+            if task and not task.done():
+                task.cancel()
+        if self._analysis and not self._analysis.done():
+            self._analysis.cancel()
+
+        current_user.set(self.user)  # 새 태스크로 복사됨 (작업 풀 공정성 단위)
+        version = self.version
+        if predict and "predict" in self.features:
+            before_cursor = self.doc.slice(0, self.cursor)
+            if before_cursor.strip():
+                self._start("predict", version, self._tokens, astream_predict_text(before_cursor, self.tone))
+        if self.features & {"suggest", "detect"}:
+            self._analysis = asyncio.create_task(self._analyze(version, 0 if analyze_now else self.analyze_idle))
+
+    async def _analyze(self, version, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        text = self.doc.text()
+        if not text.strip():
+            return
+        if "suggest" in self.features:
+            self._start("suggest", version, self._tokens, astream_generate_suggestions(text, self.tone))
+        if "detect" in self.features:
+            self._start("detect", version, self._detect, text)
+
+    def _start(self, channel, version, run, *args):
+        # 코루틴은 태스크 안에서 만든다 (시작 전에 취소돼도 대기되지 않은 코루틴이 남지 않도록)
+        self._tasks[channel] = asyncio.create_task(self._finish(channel, version, run, args))
+
+    async def _finish(self, channel, version, run, args):
+        started = time.perf_counter()
+        status, summary = "completed", None
+        try:
+            summary = await run(channel, version, *args)
+        except asyncio.CancelledError:
+            raise  # 새 편집으로 취소 — 이전 버전이므로 알리지 않음
+        except Exception as e:
+            status, summary = "failed", {"error": str(e)}
+        done = {"channel": channel, "v": version, "done": status,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+        if summary:
+            done["summary"] = summary
+        self._emit(done)
+
+    async def _tokens(self, channel, version, tokens):
+        try:
+            async for token in tokens:
+                if token:
+                    self._emit({"channel": channel, "v": version, "token": token})
+        finally:
+            await tokens.aclose()
+
+    async def _detect(self, channel, version, text):
+        """탐지는 async 증분 탐지 스트림 (assist · /detect-stream과 같은 경로, 취소하면 업스트림도 닫힘)"""
+        summary = None
+        events = adetect_errors_stream(text, self.tone)
+        try:
+            async for kind, payload in events:
+                if kind == "summary":
+                    summary = payload
+                else:
+                    self._emit({"channel": channel, "v": version, "item": payload})
+        finally:
+            await events.aclose()
+        return summary
+
+    # -----------------------------------------------------------
+    # 전송 (토큰 묶기 · 이전 버전 결과 버리기)
+    # -----------------------------------------------------------
+    def _emit(self, message):
+        self._outbox.put_nowait(message)
+
+    async def _write(self):
+        while True:
+            message = await self._outbox.get()
+            # 쌓여 있는 같은 채널 · 버전의 토큰은 한 메시지로
+            while "token" in message and not self._outbox.empty():
+                following = self._outbox._queue[0]
+                if following.get("channel") != message["channel"] or following.get("v") != message["v"] \
+                        or "token" not in following:
+                    break
+                message = dict(message, token=message["token"] + self._outbox.get_nowait()["token"])
+            if message.get("v", self.version) != self.version:
+                continue  # 그 사이 편집됨
+            text = json.dumps(message, ensure_ascii=False)
+            _count(messages_out=1, bytes_out=len(text.encode("utf-8")))
+            await self.send(text)
+
+    async def close(self):
+        tasks = [*self._tasks.values(), self._analysis, self._writer]
+        for task in tasks:
+            if task and not task.done():
+                task.cancel()
+        await asyncio.gather(*(t for t in tasks if t), return_exceptions=True)
+        _count(open=-1)
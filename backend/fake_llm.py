@@ -0,0 +1,131 @@
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+from pydantic import PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+"""
+오프라인용 가짜 채팅 모델
+네트워크·API 키 없이 스트리밍 경로를 재현한다.
+첫 토큰 지연(TTFT), 토큰 간 지연, 오류율을 설정할 수 있다.
+slow_rate를 주면 그 비율의 호출만 첫 토큰이 slow_ttft초 걸린다 (꼬리 지연 재현 — 헤지·마감 측정용).
+
+사용: LLM_PROVIDER=fake (llm_registry가 ChatOpenAI 대신 이 모델을 반환)
+"""
+
+DEFAULT_RESPONSE = (
+    " 큰 영향을 미치며, 불필요한 노이즈를 제거하는 과정이다.\n"
+    "이러한 전처리 덕분에 모델은 복잡한 문제에서도 안정적으로 학습할 수 있다.\n"
+    "데이터 분포에 맞는 전처리 기법을 선택하는 것이 중요하다."
+)
+
+DEFAULT_DETECT_RESPONSE = (
+    '{"errors": [{"original": "불벼함", "corrected": "불변함", "type": "오타", '
+    '"reason": "\'불변함\'이 올바른 표현입니다"}], "summary": "오타 1건이 발견되었습니다."}'
+)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """설정 가능한 지연·오류율로 토큰을 흘려보내는 가짜 채팅 모델"""
+
+    response: str = DEFAULT_RESPONSE
+    detect_response: str = DEFAULT_DETECT_RESPONSE
+    ttft: float = 0.3               # 첫 토큰까지 지연 (초)
+    inter_token_delay: float = 0.02  # 토큰 간 지연 (초)
+    error_rate: float = 0.0          # 첫 토큰 전에 실패할 확률
+    slow_rate: float = 0.0           # 첫 토큰이 slow_ttft만큼 늦어질 확률
+    slow_ttft: float = 5.0
+    chars_per_token: int = 2         # 한국어 토큰 1개 ≈ 1~2글자
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+
+    @classmethod
+    def from_env(cls, **overrides):
+        options = {
+            "ttft": float(os.getenv("FAKE_LLM_TTFT", "0.3")),
+            "inter_token_delay": float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.02")),
+            "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            "slow_rate": float(os.getenv("FAKE_LLM_SLOW_RATE", "0")),
+            "slow_ttft": float(os.getenv("FAKE_LLM_SLOW_TTFT", "5")),
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    # -----------------------------------------------------------
+    # 응답 구성
+    # -----------------------------------------------------------
+    def _pick_response(self, messages):
+        # 탐지 프롬프트는 JSON 응답을 요구하므로 JSON 형태로 돌려준다
+        prompt = messages[-1].content if messages else ""
+        return self.detect_response if "JSON" in prompt else self.response
+
+    def _split_tokens(self, text: str):
+        size = max(1, self.chars_per_token)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _first_delay(self):
+        if self.slow_rate and self._rng.random() < self.slow_rate:
+            return self.slow_ttft
+        return self.ttft
+
+    def _maybe_fail(self):
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise RuntimeError("fake upstream error (injected)")
+
+    # -----------------------------------------------------------
+    # 동기 경로
+    # -----------------------------------------------------------
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._pick_response(messages)
+        tokens = self._split_tokens(text)
+        time.sleep(self._first_delay())
+        self._maybe_fail()
+        time.sleep(self.inter_token_delay * max(0, len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._split_tokens(self._pick_response(messages))
+        time.sleep(self._first_delay())
+        self._maybe_fail()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.inter_token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    # -----------------------------------------------------------
+    # 비동기 경로 (ai_async)
+    # -----------------------------------------------------------
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._pick_response(messages)
+        tokens = self._split_tokens(text)
+        await asyncio.sleep(self._first_delay())
+        self._maybe_fail()
+        await asyncio.sleep(self.inter_token_delay * max(0, len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._split_tokens(self._pick_response(messages))
+        await asyncio.sleep(self._first_delay())
+        self._maybe_fail()
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.inter_token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,365 @@
+import asyncio
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+"""
+문장 단위 증분 오타·문법 탐지
+문서를 문장으로 나누고 (문장 해시, 문체)별 결과를 캐시한다.
+새로 쓰였거나 수정된 문장만 묶어서 업스트림에 보내고,
+결과는 문서 기준 오프셋(start, end)을 붙여 기존 {"errors": [...], "summary": ...} 형태로 합친다.
+
+탐지 모드
+- llm    : 모든 새 문장을 업스트림으로
+- hybrid : 로컬 사전 검사(prefilter)에서 의심 구간이 나온 문장만 업스트림으로 (힌트 포함, 요청 시에만 —
+           로컬 검사를 통과한 문장의 문법 · 조사 · 문맥 오류는 놓친다)
+- local  : 로컬 검사 결과만 사용 (업스트림 호출 없음)
+"""
+
+NO_ERRORS_SUMMARY = "오류가 발견되지 않았습니다."
+
+DETECT_MODES = ("llm", "hybrid", "local")
+
+# 문장 끝: 종결 부호(.!?。…, 닫는 따옴표 포함) 뒤 공백, 또는 줄바꿈 — "3.14" 같은 소수점은 유지
+_SENTENCE_RE = re.compile(r"[^\n]*?(?:[.!?。…]+[\"'”’)]*(?=\s|$)|\n|$)")
+
+
+class DetectionFailed(Exception):
+    """업스트림 검사 실패 — result를 그대로 응답으로 돌려준다 (캐시하지 않음)"""
+
+    def __init__(self, result):
+        super().__init__(result.get("error") or result.get("summary"))
+        self.result = result
+
+
+def split_sentences(text: str):
+    """[(start, end, sentence)] — 앞뒤 공백을 제외한 문장과 원문 기준 오프셋"""
+    sentences = []
+    for match in _SENTENCE_RE.finditer(text):
+        raw = match.group()
+        stripped = raw.strip()
+        if not stripped:
+            continue
+        start = match.start() + (len(raw) - len(raw.lstrip()))
+        sentences.append((start, start + len(stripped), stripped))
+    return sentences
+
+
+def sentence_hash(sentence: str) -> str:
+    return hashlib.blake2b(unicodedata.normalize("NFC", sentence).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SentenceResultCache:
+    """(문장 해시, 문체) → 문장 내 오류 목록 LRU 캐시"""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            errors = self._entries.get(key)
+            if errors is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return errors
+
+    def put(self, key, errors):
+        with self._lock:
+            self._entries[key] = errors
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
+
+
+class IncrementalDetector:
+    """
+    check_batch(sentences: list[str], tone, hints) → list[list[error]] (입력과 같은 길이)
+    를 받아 캐시에 없는 문장만 검사한다. 실패 시 DetectionFailed를 던져야 한다.
+    hints는 문장별 로컬 의심 구간 목록(hybrid 모드) 또는 None.
+    prefilter(sentences) → list[list[error]]는 로컬 사전 검사기 (없으면 항상 llm 모드로 동작).
+    """
+
+    def __init__(self, check_batch, cache=None, max_batch_chars: int = 1500, prefilter=None):
+        self.check_batch = check_batch
+        self.cache = cache or SentenceResultCache()
+        self.max_batch_chars = max_batch_chars
+        self.prefilter = prefilter
+        self._lock = threading.Lock()
+        self._stats = {
+            "documents": 0, "sentences": 0, "checked_sentences": 0, "upstream_batches": 0,
+            "local_checked": 0, "local_clean": 0, "upstream_sentences_avoided": 0,
+            "upstream_calls_avoided": 0,
+        }
+
+    def _batches(self, sentences):
+        batch, size = [], 0
+        for sentence in sentences:
+            if batch and size + len(sentence) > self.max_batch_chars:
+                yield batch
+                batch, size = [], 0
+            batch.append(sentence)
+            size += len(sentence)
+        if batch:
+            yield batch
+
+    def _prefilter(self, pending, mode, results):
+        """
+        로컬 검사 → 업스트림에 보낼 {key: sentence}, {sentence: flags}
+        hybrid에서 로컬 검사를 통과한 문장은 이번 응답에서만 깨끗한 것으로 보고 캐시하지 않는다
+        (형태소 분석으로는 조사 · 문법 · 문맥 오류를 볼 수 없으므로 LLM이 확인한 결과처럼 남기지 않음).
+        """
+        upstream, hints = {}, {}
+        for (key, sentence), flags in zip(pending.items(), self.prefilter(list(pending.values()))):
+            if mode == "local" or not flags:
+                errors = [{k: v for k, v in flag.items() if k not in ("start", "end")} for flag in flags]
+                if mode == "local":
+                    self.cache.put(key, errors)
+                results[key] = errors
+            else:
+                upstream[key] = sentence
+                hints[sentence] = flags
+        return upstream, hints
+
+    def _plan(self, text, tone, mode):
+        """문장 분할 + 캐시 조회 + 로컬 검사 → 업스트림에 보낼 문장만 남긴다"""
+        if mode not in DETECT_MODES or self.prefilter is None:
+            mode = "llm"
+        sentences = split_sentences(text)
+        # 모드별로 결과가 다르므로(local은 정밀도가 낮음) 캐시 키에 모드를 포함
+        keys = [(sentence_hash(s), tone, mode) for _, _, s in sentences]
+
+        results = {}
+        pending = {}  # key -> sentence (같은 문장이 여러 번 나오면 한 번만 검사)
+        for key, (_, _, sentence) in zip(keys, sentences):
+            if key in results or key in pending:
+                continue
+            errors = self.cache.get(key)
+            if errors is None:
+                pending[key] = sentence
+            else:
+                results[key] = errors
+
+        upstream, hints = pending, {}
+        if mode != "llm":
+            upstream, hints = self._prefilter(pending, mode, results)
+        return mode, sentences, keys, results, pending, upstream, hints
+
+    def _record(self, mode, sentences, results, pending, upstream, batches):
+        with self._lock:
+            self._stats["documents"] += 1
+            self._stats["sentences"] += len(sentences)
+            self._stats["checked_sentences"] += len(pending)
+            self._stats["upstream_batches"] += batches
+            if mode != "llm":
+                self._stats["local_checked"] += len(pending)
+                self._stats["local_clean"] += sum(1 for key in pending if key in results and not results[key])
+                self._stats["upstream_sentences_avoided"] += len(pending) - len(upstream)
+                # 이 문서에서 줄어든 업스트림 호출 수 = llm 모드였다면 보냈을 묶음 수 - 실제 묶음 수
+                self._stats["upstream_calls_avoided"] += (
+                    sum(1 for _ in self._batches(list(pending.values()))) - batches
+                )
+
+    def detect(self, text: str, tone: str, mode: str = "llm"):
+        mode, sentences, keys, results, pending, upstream, hints = self._plan(text, tone, mode)
+
+        batches = 0
+        for batch in self._batches(list(upstream.values())):
+            checked = self.check_batch(batch, tone, [hints.get(s) for s in batch] if hints else None)
+            batches += 1
+            self._store(batch, checked, tone, mode, results)
+
+        self._record(mode, sentences, results, pending, upstream, batches)
+        return self._merge(sentences, keys, results, checked=len(pending), mode=mode, upstream=len(upstream))
+
+    async def adetect(self, text: str, tone: str, check_batch, mode: str = "llm"):
+        """
+        detect의 asyncio 버전 — check_batch는 같은 계약의 코루틴 함수.
+        문장 분할 · 캐시 조회 · 로컬 검사(CPU)는 스레드에서 실행해 이벤트 루프를 막지 않는다.
+        """
+        mode, sentences, keys, results, pending, upstream, hints = await asyncio.to_thread(self._plan, text, tone, mode)
+
+        batches = 0
+        for batch in self._batches(list(upstream.values())):
+            checked = await check_batch(batch, tone, [hints.get(s) for s in batch] if hints else None)
+            batches += 1
+            self._store(batch, checked, tone, mode, results)
+
+        self._record(mode, sentences, results, pending, upstream, batches)
+        return self._merge(sentences, keys, results, checked=len(pending), mode=mode, upstream=len(upstream))
+
+    def _store(self, batch, checked, tone, mode, results):
+        for sentence, errors in zip(batch, checked):
+            key = (sentence_hash(sentence), tone, mode)
+            self.cache.put(key, errors)
+            results[key] = errors
+
+    def detect_stream(self, text: str, tone: str, stream_batch, mode: str = "llm"):
+        """
+        결과가 준비되는 대로 ("item", error) → 마지막에 ("summary", 요약)을 내보낸다.
+        캐시·로컬 검사 결과를 먼저, 이어서 업스트림 결과를 객체 단위로 보낸다.
+        stream_batch(sentences, tone, hints)는 (문장 위치, error)를 내보내는 제너레이터이며
+        응답을 끝까지 받았으면 True를 반환해야 한다 (그때만 캐시에 저장).
+        stream_batch가 None(유휴)을 내보내면 ("tick", None)으로 그대로 전달한다.
+        """
+        mode, sentences, keys, results, pending, upstream, hints = self._plan(text, tone, mode)
+        occurrences = {}
+        for key, span in zip(keys, sentences):
+            occurrences.setdefault(key, []).append(span)
+
+        count = 0
+        for key, (start, end, sentence) in zip(keys, sentences):
+            for error in results.get(key, []):
+                count += 1
+                yield "item", _locate(error, start, end, sentence)
+
+        batches = 0
+        partial = False
+        for batch in self._batches(list(upstream.values())):
+            batch_keys = [(sentence_hash(s), tone, mode) for s in batch]
+            per_sentence = [[] for _ in batch]
+            items = stream_batch(batch, tone, [hints.get(s) for s in batch] if hints else None)
+            batches += 1
+            try:
+                while True:
+                    try:
+                        item = next(items)
+                    except StopIteration as stop:
+                        completed = bool(stop.value)
+                        break
+                    if item is None:
+                        yield "tick", None
+                        continue
+                    index, error = item
+                    per_sentence[index].append(error)
+                    for start, end, sentence in occurrences[batch_keys[index]]:
+                        count += 1
+                        yield "item", _locate(error, start, end, sentence)
+            finally:
+                items.close()
+            if not completed:
+                partial = True  # 잘린 응답은 캐시하지 않고 남은 묶음도 보내지 않음
+                break
+            self._store(batch, per_sentence, tone, mode, results)
+
+        self._record(mode, sentences, results, pending, upstream, batches)
+        yield "summary", _stream_summary(sentences, pending, mode, upstream, count, partial)
+
+    async def adetect_stream(self, text: str, tone: str, stream_batch, mode: str = "llm"):
+        """
+        detect_stream의 asyncio 버전 — stream_batch는 (문장 위치, error)를 내보내고
+        마지막에 (None, 응답을 끝까지 받았는지)를 내보내는 async 제너레이터.
+        """
+        mode, sentences, keys, results, pending, upstream, hints = await asyncio.to_thread(self._plan, text, tone, mode)
+        occurrences = {}
+        for key, span in zip(keys, sentences):
+            occurrences.setdefault(key, []).append(span)
+
+        count = 0
+        for key, (start, end, sentence) in zip(keys, sentences):
+            for error in results.get(key, []):
+                count += 1
+                yield "item", _locate(error, start, end, sentence)
+
+        batches = 0
+        partial = False
+        for batch in self._batches(list(upstream.values())):
+            batch_keys = [(sentence_hash(s), tone, mode) for s in batch]
+            per_sentence = [[] for _ in batch]
+            items = stream_batch(batch, tone, [hints.get(s) for s in batch] if hints else None)
+            batches += 1
+            completed = False
+            try:
+                async for index, error in items:
+                    if index is None:
+                        completed = bool(error)
+                        break
+                    per_sentence[index].append(error)
+                    for start, end, sentence in occurrences[batch_keys[index]]:
+                        count += 1
+                        yield "item", _locate(error, start, end, sentence)
+            finally:
+                await items.aclose()
+            if not completed:
+                partial = True
+                break
+            self._store(batch, per_sentence, tone, mode, results)
+
+        self._record(mode, sentences, results, pending, upstream, batches)
+        yield "summary", _stream_summary(sentences, pending, mode, upstream, count, partial)
+
+    @staticmethod
+    def _merge(sentences, keys, results, checked, mode="llm", upstream=None):
+        merged = []
+        for key, (start, end, sentence) in zip(keys, sentences):
+            for error in results.get(key, []):
+                merged.append(_locate(error, start, end, sentence))
+
+        if merged:
+            summary = f"문장 {len(sentences)}개에서 오류 {len(merged)}건이 발견되었습니다."
+        else:
+            summary = NO_ERRORS_SUMMARY
+        return {
+            "error": None,
+            "errors": merged,
+            "summary": summary,
+            "incremental": _incremental_info(sentences, checked, mode, upstream),
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cache"] = self.cache.stats()
+        return stats
+
+
+def _locate(error, start, end, sentence):
+    """문장 내 오류에 문서 기준 오프셋(start, end)을 붙인다 (원문을 못 찾으면 문장 전체)"""
+    item = dict(error)
+    original = item.get("original") or ""
+    pos = sentence.find(original) if original else -1
+    if pos >= 0:
+        item["start"] = start + pos
+        item["end"] = start + pos + len(original)
+    else:
+        item["start"], item["end"] = start, end
+    return item
+
+
+def _stream_summary(sentences, pending, mode, upstream, count, partial):
+    if partial:
+        summary = f"응답이 중간에 끊겨 일부 결과만 표시합니다 (오류 {count}건)."
+    elif count:
+        summary = f"문장 {len(sentences)}개에서 오류 {count}건이 발견되었습니다."
+    else:
+        summary = NO_ERRORS_SUMMARY
+    return {
+        "error": None,
+        "summary": summary,
+        "count": count,
+        "partial": partial,
+        "incremental": _incremental_info(sentences, len(pending), mode, len(upstream)),
+    }
+
+
+def _incremental_info(sentences, checked, mode, upstream=None):
+    return {
+        "sentences": len(sentences),
+        "checked": checked,
+        "cached": len(sentences) - checked,
+        "upstream": checked if upstream is None else upstream,
+        "mode": mode,
+    }
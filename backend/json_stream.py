@@ -0,0 +1,138 @@
+import json
+
+"""
+탐지 응답 JSON 증분 파서
+{"errors": [{...}, {...}], "summary": "..."} 형태의 응답을 청크 단위로 받아
+errors 배열의 각 객체가 닫히는 즉시 dict로 돌려준다.
+- 현재 읽는 객체 하나와 summary 값만 보관하므로 오류 목록 길이와 무관하게 메모리가 일정하다.
+- 응답이 중간에 끊겨도 이미 닫힌 객체는 그대로 남는다.
+- 앞뒤의 코드 펜스(```json) 등 루트 객체 밖의 텍스트는 무시한다.
+"""
+
+
+class ErrorObjectStream:
+    """feed(chunk) → 새로 완성된 오류 객체 목록"""
+
+    def __init__(self, array_key: str = "errors", max_object_chars: int = 8192, max_value_chars: int = 2000):
+        self.array_key = array_key
+        self.max_object_chars = max_object_chars
+        self.max_value_chars = max_value_chars
+        self.summary = None
+        self.complete = False    # 루트 객체가 닫혔는지
+        self.objects = 0
+        self.malformed = 0
+
+        self._stack = []         # 열린 괄호 ('{' 또는 '[')
+        self._in_string = False
+        self._escape = False
+        self._string = []        # 루트 수준 문자열(키·값) 버퍼
+        self._key = None         # 루트 수준 마지막 키
+        self._expect_value = False
+        self._array_key = None   # 현재 열린 루트 배열의 키
+        self._item = None        # 수집 중인 객체 텍스트 조각
+        self._item_size = 0
+        self._item_overflow = False
+
+    def feed(self, chunk: str):
+        done = []
+        for ch in chunk:
+            if self.complete:
+                break
+            item = self._step(ch)
+            if item is not None:
+                done.append(item)
+        return done
+
+    def _collect(self, ch):
+        if self._item is None:
+            return
+        self._item_size += 1
+        if self._item_size > self.max_object_chars:
+            self._item_overflow = True  # 너무 긴 객체는 버리고 닫힐 때까지 건너뜀
+            self._item.clear()
+        elif not self._item_overflow:
+            self._item.append(ch)
+
+    def _step(self, ch):
+        stack = self._stack
+        if not stack:
+            if ch == "{":
+                stack.append("{")
+            return None
+
+        self._collect(ch)
+        top_level = len(stack) == 1
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if top_level:
+                    self._end_top_string()
+                return None
+            if top_level and len(self._string) < self.max_value_chars * 2:
+                self._string.append(ch)
+            return None
+
+        if ch == '"':
+            self._in_string = True
+            self._string = [] if top_level else self._string
+        elif ch in "{[":
+            if ch == "{" and stack == ["{", "["] and self._array_key == self.array_key:
+                self._item = ["{"]
+                self._item_size = 1
+                self._item_overflow = False
+            if ch == "[" and top_level:
+                self._array_key = self._key
+            stack.append(ch)
+        elif ch in "}]":
+            stack.pop()
+            if not stack:
+                self.complete = True
+            elif ch == "}" and stack == ["{", "["] and self._item is not None:
+                return self._finish_item()
+            elif ch == "]" and len(stack) == 1:
+                self._array_key = None
+        elif top_level:
+            if ch == ":":
+                self._expect_value = True
+            elif ch == ",":
+                self._expect_value = False
+        return None
+
+    def _end_top_string(self):
+        text = "".join(self._string)
+        self._string = []
+        if not self._expect_value:
+            self._key = self._decode(text)
+            return
+        self._expect_value = False
+        if self._key == "summary":
+            self.summary = self._decode(text)[:self.max_value_chars]
+
+    @staticmethod
+    def _decode(raw: str):
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
+
+    def _finish_item(self):
+        text, overflow = "".join(self._item), self._item_overflow
+        self._item = None
+        if overflow:
+            self.malformed += 1
+            return None
+        try:
+            item = json.loads(text)
+        except ValueError:
+            self.malformed += 1
+            return None
+        if not isinstance(item, dict):
+            self.malformed += 1
+            return None
+        self.objects += 1
+        return item
@@ -0,0 +1,177 @@
+import os
+import threading
+import httpx
+from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from prompts import PROMPT_TEMPLATES
+from worker_pool import parse_map
+
+"""
+LLM 클라이언트 · 프롬프트 레지스트리
+- 프롬프트 템플릿은 모듈 로드 시 한 번만 컴파일한다.
+- ChatOpenAI 클라이언트는 (model, temperature, streaming)별로 하나만 만들어 재사용하고,
+  모든 클라이언트가 커넥션 풀을 가진 httpx 클라이언트 하나를 공유한다 (TLS 핸드셰이크 재사용).
+- 기능별 경로(MODEL_ROUTES): 예측·제안 함수는 get_llm(feature=...)으로 클라이언트를 받고,
+  기능마다 원격(OpenAI)과 CPU 로컬 모델(local_llm) 중 하나로 보낼 수 있다.
+"""
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# "openai" | "fake" (fake_llm.FakeStreamingChatModel — 네트워크 없이 벤치마크·테스트) | "local"
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+_fake_options = {}
+
+# 기능(프롬프트 이름)별 "제공자[:모델]" — 예: "predict=local,suggest_stream=local,detect=openai:gpt-4o"
+# 지정하지 않은 기능은 LLM_PROVIDER, openai 경로는 LLM_PROVIDER=fake일 때 fake로 대체
+MODEL_ROUTES = {name: route for name, route in parse_map(os.getenv("MODEL_ROUTES"), str).items() if route}
+
+# 로컬 모델의 기능별 최대 생성 토큰 (예측은 짧게, 탐지 JSON은 길게)
+LOCAL_MAX_TOKENS = dict({
+    "predict": 32,
+    "suggest_stream": 64,
+    "suggest_streamed": 160,
+    "suggest": 200,
+    "detect": 400,
+    "detect_batch": 400,
+}, **parse_map(os.getenv("LOCAL_LLM_MAX_TOKENS"), int))
+
+# -----------------------------------------------------------
+# 1️⃣ 프롬프트 레지스트리 (시작 시 1회 컴파일)
+# -----------------------------------------------------------
+PROMPTS = {
+    name: ChatPromptTemplate.from_template(template)
+    for name, template in PROMPT_TEMPLATES.items()
+}
+
+
+def get_prompt(name: str):
+    return PROMPTS[name]
+
+
+# -----------------------------------------------------------
+# 2️⃣ 공유 HTTP 커넥션 풀
+# -----------------------------------------------------------
+_HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=60.0,
+)
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+_lock = threading.Lock()
+_http_client = None
+_async_http_client = None
+_clients = {}  # (제공자, model, temperature, streaming, 최대 토큰) -> 채팅 모델
+
+
+def _shared_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+    return _http_client
+
+
+def _shared_async_http_client():
+    """asyncio 경로(ai_async)용 커넥션 풀 — 이벤트 루프 하나에서만 사용"""
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+    return _async_http_client
+
+
+# -----------------------------------------------------------
+# 3️⃣ 장수명 LLM 클라이언트 (기능별 경로)
+# -----------------------------------------------------------
+def resolve_route(feature: str = None, model: str = DEFAULT_MODEL):
+    """기능 → (제공자, 모델)"""
+    provider, _, routed_model = MODEL_ROUTES.get(feature, "").partition(":") if feature else ("", "", "")
+    provider = provider or LLM_PROVIDER
+    if provider == "openai" and LLM_PROVIDER == "fake":
+        provider = "fake"
+    if provider == "local":
+        return provider, routed_model or None
+    return provider, routed_model or model
+
+
+def get_llm(temperature: float, streaming: bool = False, model: str = DEFAULT_MODEL, feature: str = None):
+    """
+    기능 경로에 맞는 공유 클라이언트를 반환 ((제공자, model, temperature, streaming)별 하나).
+    요청마다 다른 콜백은 llm.stream(..., config={"callbacks": [...]})로 붙인다.
+    """
+    provider, model = resolve_route(feature, model)
+    max_tokens = LOCAL_MAX_TOKENS.get(feature, 128) if provider == "local" else None
+    key = (provider, model, temperature, streaming, max_tokens)
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = _build_client(provider, model, temperature, streaming, max_tokens)
+            _clients[key] = llm
+    return llm
+
+
+def _build_client(provider, model, temperature, streaming, max_tokens=None):
+    if provider == "local":
+        from local_llm import LocalCausalLM, LocalEngine
+        if LocalEngine.available():
+            return LocalCausalLM.from_env(temperature, model=model, max_new_tokens=max_tokens)
+        print("[경고] transformers/torch가 없어 로컬 모델 경로 대신 원격 모델을 사용합니다.")
+        provider, model = ("fake" if LLM_PROVIDER == "fake" else "openai"), DEFAULT_MODEL
+    if provider == "fake":
+        from fake_llm import FakeStreamingChatModel
+        return FakeStreamingChatModel.from_env(**_fake_options)
+    return ChatOpenAI(
+        model_name=model,
+        temperature=temperature,
+        streaming=streaming,
+        http_client=_shared_http_client(),
+        http_async_client=_shared_async_http_client(),
+    )
+
+
+def use_provider(provider: str, routes=None, **fake_options):
+    """
+    LLM 제공자(와 기능별 경로)를 교체하고 기존 클라이언트를 비운다 (벤치마크·오프라인 실행용).
+    fake_options는 FakeStreamingChatModel 필드 (ttft, inter_token_delay, error_rate 등).
+    """
+    global LLM_PROVIDER, MODEL_ROUTES, _fake_options
+    with _lock:
+        LLM_PROVIDER = provider
+        if routes is not None:
+            MODEL_ROUTES = dict(routes)
+        _fake_options = dict(fake_options)
+        _clients.clear()
+
+
+def route_stats():
+    """기능별 경로와 로컬 엔진 통계 (/stats)"""
+    routes = {feature: resolve_route(feature) for feature in LOCAL_MAX_TOKENS}
+    stats = {"routes": {feature: ":".join(filter(None, route)) for feature, route in routes.items()}}
+    if any(provider == "local" for provider, _ in routes.values()):
+        from local_llm import LocalEngine, engine_stats
+        stats["local"] = engine_stats() if LocalEngine.available() else {"available": False}
+    return stats
+
+
+# 기능별로 실제 사용하는 클라이언트 설정 (warmup 대상)
+CLIENT_CONFIGS = [
+    ("suggest", 0.7, False),            # generate_suggestions
+    ("detect_batch", 0.5, False),       # detect_errors / ai_async.adetect_errors (문장 단위 일괄 탐지)
+    ("predict", 0.6, True),             # stream_predict_text
+    ("suggest_stream", 0.7, True),      # stream_generate_suggestions
+    ("suggest_streamed", 0.65, True),   # generate_suggestions_streamed
+    ("detect_batch", 0.5, True),        # detect_errors_stream
+]
+
+
+def warmup():
+    """서버 시작 시 클라이언트를 미리 생성하고 로컬 모델을 로드, 프롬프트를 한 번씩 포맷 (첫 요청 지연 제거)"""
+    for prompt in PROMPTS.values():
+        prompt.format_messages(**{name: "" for name in prompt.input_variables})
+    for feature, temperature, streaming in CLIENT_CONFIGS:
+        llm = get_llm(temperature=temperature, streaming=streaming, feature=feature)
+        engine = getattr(llm, "engine", None)
+        if engine is not None:
+            engine.warmup()
@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+import warnings
+
+try:
+    from kiwipiepy import Kiwi
+except ImportError:  # 형태소 분석기가 없으면 로컬 검사 없이 LLM 탐지만 사용
+    Kiwi = None
+
+"""
+로컬 형태소 분석 기반 오타 사전 검사 (kiwipiepy)
+LLM에 보내기 전에 문장을 빠르게 훑어 의심 구간을 찾는다.
+- 사전에 없는 단어(미등록 명사, 낮은 형태소 점수)
+- 오타 교정 후보(kiwi 오타 모델)와 완성되지 않은 자모("하ㄴ다")
+- 띄어쓰기 이상(kiwi.space 결과와 다른 어절)
+반환 형식은 탐지 결과와 같은 {"original", "corrected", "type", "reason", "start", "end"}.
+"""
+
+_JAMO_RE = re.compile(r"[ㄱ-ㆎ]+")
+_WORD_RE = re.compile(r"\S+")
+_OOV_TAGS = {"NNG", "NNP", "UN"}
+
+
+def _flag(sentence, start, end, corrected, kind, reason):
+    return {
+        "original": sentence[start:end],
+        "corrected": corrected,
+        "type": kind,
+        "reason": reason,
+        "start": start,
+        "end": end,
+        "source": "local",
+    }
+
+
+class LocalChecker:
+    """kiwipiepy 기반 문장 단위 의심 구간 검사기 (분석기는 첫 사용 시 로드)"""
+
+    def __init__(self, oov_score: float = -20.0, typo_cost_threshold: float = 2.5,
+                 check_spacing: bool = True, user_dictionary: str = None):
+        self.oov_score = oov_score
+        self.typo_cost_threshold = typo_cost_threshold
+        self.check_spacing = check_spacing
+        self.user_dictionary = user_dictionary
+        self._kiwi = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            oov_score=float(os.getenv("LOCAL_CHECK_OOV_SCORE", "-20")),
+            check_spacing=os.getenv("LOCAL_CHECK_SPACING", "1") == "1",
+            user_dictionary=os.getenv("LOCAL_CHECK_USER_DICT") or None,
+        )
+
+    @staticmethod
+    def available():
+        return Kiwi is not None
+
+    def _analyzer(self):
+        if self._kiwi is None:
+            with self._lock:
+                if self._kiwi is None:
+                    kiwi = Kiwi()
+                    if self.user_dictionary:
+                        # 과목 용어(활성함수, 정규화 등)를 등록해 미등록어 오탐을 줄인다
+                        kiwi.load_user_dictionary(self.user_dictionary)
+                    self._kiwi = kiwi
+        return self._kiwi
+
+    def warmup(self):
+        """모델 로드(수 초)를 첫 요청 전에 끝낸다"""
+        self.check("글잇다 준비 완료.")
+
+    def _tokens(self, kiwi, sentence):
+        try:
+            result = kiwi.analyze(sentence, top_n=1, typos="basic",
+                                  typo_cost_threshold=self.typo_cost_threshold)
+        except TypeError:
+            # kiwipiepy < 0.23은 오타 모델을 분석기 생성 시에만 지정할 수 있다
+            result = kiwi.analyze(sentence, top_n=1)
+        return result[0][0] if result else []
+
+    def check_many(self, sentences):
+        """문장별 의심 구간 목록 (CPU 작업 — gevent 환경에서는 worker_pool.offload로 호출)"""
+        return [self.check(sentence) for sentence in sentences]
+
+    def check(self, sentence: str):
+        """문장 내 의심 구간 목록 (오프셋은 문장 기준)"""
+        kiwi = self._analyzer()
+        flags = []
+        flagged = set()
+
+        def add(start, end, corrected, kind, reason):
+            if (start, end) not in flagged:
+                flagged.add((start, end))
+                flags.append(_flag(sentence, start, end, corrected, kind, reason))
+
+        for match in _JAMO_RE.finditer(sentence):
+            add(match.start(), match.end(), "", "오타", "완성되지 않은 자모가 포함되어 있습니다.")
+
+        words = [(m.start(), m.end()) for m in _WORD_RE.finditer(sentence)]
+
+        def word_span(pos):
+            for start, end in words:
+                if start <= pos < end:
+                    return start, end
+            return pos, pos + 1
+
+        tokens = self._tokens(kiwi, sentence)
+        for token in tokens:
+            if getattr(token, "typo_cost", 0) > 0:
+                start, end = word_span(token.start)
+                add(start, end, "", "오타", f"'{token.form}'의 오타일 수 있습니다.")
+            elif token.tag in _OOV_TAGS and token.score < self.oov_score:
+                start, end = word_span(token.start)
+                add(start, end, "", "오타", f"'{token.form}'은(는) 사전에 없는 단어입니다 (오타 의심).")
+
+        if self.check_spacing:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                spaced = kiwi.space(sentence, reset_whitespace=False)
+            # 명사+명사 합성어("우리나라")는 붙여 써도 되므로 조사·어미 뒤에 붙은 경우만 본다
+            boundaries = {t.start + t.len for t in tokens if t.tag[:1] in ("J", "E")}
+            for start, end, corrected in _spacing_diffs(sentence, spaced, words, boundaries):
+                add(start, end, corrected, "맞춤법", "띄어쓰기가 어색할 수 있습니다.")
+
+        flags.sort(key=lambda f: f["start"])
+        return flags
+
+
+def _spacing_diffs(original, spaced, words, boundaries):
+    """kiwi.space가 boundaries(조사·어미 끝) 위치에 공백을 넣은 어절 → (start, end, 교정된 어절)"""
+    inserted = []
+    i = j = 0
+    while i < len(original) and j < len(spaced):
+        if original[i] == spaced[j]:
+            i += 1
+            j += 1
+        elif spaced[j].isspace():
+            if i in boundaries:
+                inserted.append(i)
+            j += 1
+        else:
+            i += 1  # 공백 제거 등 다른 변경은 무시
+    diffs = []
+    for start, end in words:
+        cuts = [p - start for p in inserted if start < p < end]
+        if not cuts:
+            continue
+        word = original[start:end]
+        pieces, prev = [], 0
+        for cut in cuts:
+            pieces.append(word[prev:cut])
+            prev = cut
+        pieces.append(word[prev:])
+        diffs.append((start, end, " ".join(pieces)))
+    return diffs
@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from typing import Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from worker_pool import offload
+
+try:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+except ImportError:  # transformers/torch가 없으면 로컬 경로 없이 원격 모델만 사용
+    torch = None
+
+"""
+CPU 로컬 추론 채팅 모델 (transformers 소형 causal LM)
+AI Cursor처럼 키 입력마다 호출되는 기능을 WAN 왕복 없이, 네트워크가 끊겨도 동작하게 한다.
+- 모델은 모델 이름별로 한 번만 로드하고 모든 온도 설정이 공유한다 (LocalEngine).
+- KV 캐시 재사용: 최근 프롬프트의 KV 캐시를 몇 개(slot) 보관하고, 새 프롬프트와 토큰 앞부분이
+  가장 길게 겹치는 캐시를 그 길이로 자른 뒤 나머지 토큰만 prefill한다.
+  프롬프트 템플릿(시스템 지시문)과 직전 키 입력까지의 본문은 다시 계산하지 않는다.
+- 생성은 엔진 하나에 한 번에 하나 (CPU 연산은 torch 스레드가 나눠 씀).
+  gevent 환경에서는 모델 연산을 허브 스레드풀(실제 OS 스레드)에서 실행해 다른 요청이 멈추지 않게 한다.
+
+사용: MODEL_ROUTES="predict=local,suggest_stream=local" (llm_registry가 기능별로 이 모델을 반환)
+"""
+
+DEFAULT_LOCAL_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+class _Slot:
+    """KV 캐시 하나 — 캐시에 들어 있는 토큰 id와 함께 보관"""
+
+    __slots__ = ("ids", "cache", "used_at")
+
+    def __init__(self):
+        self.ids = []
+        self.cache = None
+        self.used_at = 0.0
+
+
+def _common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class LocalEngine:
+    """모델 · 토크나이저 · KV 캐시 슬롯 (모델 이름별 하나, 첫 사용 시 로드)"""
+
+    def __init__(self, model_name: str = DEFAULT_LOCAL_MODEL, threads: int = 0, cache_slots: int = 4):
+        self.model_name = model_name
+        self.threads = threads
+        self._slots = [_Slot() for _ in range(max(1, cache_slots))]
+        self._model = None
+        self._tokenizer = None
+        self._eos = set()
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()         # 생성은 한 번에 하나
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "generations": 0, "prompt_tokens": 0, "reused_tokens": 0, "prefill_tokens": 0,
+            "generated_tokens": 0, "prefill_ms_total": 0.0, "decode_ms_total": 0.0,
+        }
+
+    @staticmethod
+    def available():
+        return torch is not None
+
+    def _load(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    if self.threads:
+                        torch.set_num_threads(self.threads)
+                    tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                    model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch.float32)
+                    model.eval()
+                    eos = model.generation_config.eos_token_id
+                    self._eos = set(eos if isinstance(eos, (list, tuple)) else [eos]) - {None}
+                    if tokenizer.eos_token_id is not None:
+                        self._eos.add(tokenizer.eos_token_id)
+                    self._tokenizer = tokenizer
+                    self._model = model
+
+    def warmup(self):
+        """모델 로드(수 초~수십 초)를 첫 요청 전에 끝낸다"""
+        offload(self._load)
+
+    def prompt_ids(self, messages):
+        """LangChain 메시지 → 채팅 템플릿을 적용한 토큰 id 목록"""
+        self._load()
+        turns = [{"role": _ROLES.get(m.type, "user"), "content": str(m.content)} for m in messages]
+        if self._tokenizer.chat_template:
+            return list(self._tokenizer.apply_chat_template(turns, add_generation_prompt=True, tokenize=True))
+        return self._tokenizer.encode("\n\n".join(t["content"] for t in turns))
+
+    # -----------------------------------------------------------
+    # KV 캐시 슬롯
+    # -----------------------------------------------------------
+    def _take_slot(self, ids):
+        """앞부분이 가장 길게 겹치는 슬롯 (같으면 가장 오래 안 쓴 슬롯) → (슬롯, 재사용할 토큰 수)"""
+        best, reuse = None, -1
+        for slot in sorted(self._slots, key=lambda s: s.used_at):
+            shared = _common_prefix(slot.ids, ids) if slot.cache is not None else 0
+            if shared > reuse:
+                best, reuse = slot, shared
+        reuse = min(reuse, len(ids) - 1)  # 마지막 토큰은 다시 넣어야 다음 토큰 logits가 나온다
+        if reuse <= 0:
+            best.cache, best.ids = DynamicCache(), []
+            reuse = 0
+        elif reuse < len(best.ids):
+            best.cache.crop(reuse)
+            best.ids = best.ids[:reuse]
+        best.used_at = time.monotonic()
+        return best, reuse
+
+    def _forward(self, slot, ids):
+        with torch.inference_mode():
+            out = self._model(input_ids=torch.tensor([ids]), past_key_values=slot.cache, use_cache=True)
+        slot.cache = out.past_key_values
+        slot.ids.extend(ids)
+        return out.logits[0, -1]
+
+    def _next_token(self, logits, temperature):
+        if temperature <= 0:
+            return int(torch.argmax(logits))
+        top = torch.topk(logits / temperature, k=min(50, logits.shape[-1]))
+        choice = torch.multinomial(torch.softmax(top.values, dim=-1), 1)
+        return int(top.indices[choice])
+
+    # -----------------------------------------------------------
+    # 생성 (토큰 조각 제너레이터 — 닫으면 그 자리에서 멈춤)
+    # -----------------------------------------------------------
+    def generate(self, messages, temperature: float = 0.7, max_new_tokens: int = 64, stop=None):
+        self._load()
+        ids = self.prompt_ids(messages)
+        with self._lock:
+            slot, reuse = self._take_slot(ids)
+            generated, emitted = [], ""
+            started = prefilled = time.perf_counter()
+            try:
+                logits = offload(self._forward, slot, ids[reuse:])
+                prefilled = time.perf_counter()
+                for _ in range(max_new_tokens):
+                    token = self._next_token(logits, temperature)
+                    if token in self._eos:
+                        break
+                    generated.append(token)
+                    text = self._tokenizer.decode(generated, skip_special_tokens=True)
+                    if stop:
+                        cut = min((text.find(s) for s in stop if s in text), default=-1)
+                        if cut >= 0:
+                            if cut > len(emitted):
+                                yield text[len(emitted):cut]
+                            break
+                    # 한글 음절이 여러 토큰으로 나뉘면 완성될 때까지 보류
+                    if not text.endswith("�") and len(text) > len(emitted):
+                        yield text[len(emitted):]
+                        emitted = text
+                    logits = offload(self._forward, slot, [token])
+            except Exception:
+                slot.cache, slot.ids = None, []  # 캐시가 어디까지 갱신됐는지 알 수 없음
+                raise
+            finally:
+                with self._stats_lock:
+                    self._record(len(ids), reuse, len(generated), prefilled - started,
+                                 time.perf_counter() - prefilled)
+
+    def _record(self, prompt, reuse, generated, prefill, decode):
+        stats = self._stats
+        stats["generations"] += 1
+        stats["prompt_tokens"] += prompt
+        stats["reused_tokens"] += reuse
+        stats["prefill_tokens"] += prompt - reuse
+        stats["generated_tokens"] += generated
+        stats["prefill_ms_total"] += prefill * 1000
+        stats["decode_ms_total"] += decode * 1000
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {k: round(v, 1) if isinstance(v, float) else v for k, v in self._stats.items()}
+        stats["model"] = self.model_name
+        stats["loaded"] = self._model is not None
+        stats["kv_reuse_rate"] = round(stats["reused_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0
+        return stats
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_name: str = None) -> LocalEngine:
+    """모델 이름별 공유 엔진"""
+    model_name = model_name or os.getenv("LOCAL_LLM_MODEL", DEFAULT_LOCAL_MODEL)
+    with _engines_lock:
+        engine = _engines.get(model_name)
+        if engine is None:
+            engine = _engines[model_name] = LocalEngine(
+                model_name,
+                threads=int(os.getenv("LOCAL_LLM_THREADS", "0")),
+                cache_slots=int(os.getenv("LOCAL_LLM_CACHE_SLOTS", "4")),
+            )
+    return engine
+
+
+def engine_stats():
+    with _engines_lock:
+        engines = list(_engines.values())
+    return {engine.model_name: engine.stats() for engine in engines}
+
+
+class LocalCausalLM(BaseChatModel):
+    """LocalEngine을 LangChain 채팅 모델로 감싼 것 (stream/invoke/astream/ainvoke 모두 지원)"""
+
+    model_name: str = DEFAULT_LOCAL_MODEL
+    temperature: float = 0.7
+    max_new_tokens: int = 64
+
+    @classmethod
+    def from_env(cls, temperature: float, model: Optional[str] = None, max_new_tokens: int = 64):
+        return cls(model_name=model or os.getenv("LOCAL_LLM_MODEL", DEFAULT_LOCAL_MODEL),
+                   temperature=temperature, max_new_tokens=max_new_tokens)
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-causal-lm"
+
+    @property
+    def engine(self) -> LocalEngine:
+        return get_engine(self.model_name)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = "".join(self.engine.generate(messages, self.temperature, self.max_new_tokens, stop))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        pieces = self.engine.generate(messages, self.temperature, self.max_new_tokens, stop)
+        try:
+            for piece in pieces:
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+                if run_manager:
+                    run_manager.on_llm_new_token(piece, chunk=chunk)
+                yield chunk
+        finally:
+            pieces.close()  # 소비자가 멈추면 디코딩도 멈추고 엔진 락을 놓는다
+
+    # 비동기 경로는 BaseChatModel 기본 구현(_stream/_generate를 실행기 스레드에서)을 사용
@@ -0,0 +1,133 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+"""
+요청 단위 지연 계측 + Prometheus /metrics
+엔드포인트·문체별로 워커 대기, 프롬프트 포맷, 업스트림 첫 토큰, 토큰 간 간격,
+토큰 수, 타임아웃, 탐지 JSON 파싱 실패를 기록한다.
+"""
+
+REGISTRY = CollectorRegistry()
+
+KNOWN_TONES = {"감성적", "논리적", "설명적", "서사적", "자동 감지"}
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30, 60)
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+_GAP_BUCKETS = (0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1, 2.5)
+
+
+def tone_label(tone: str) -> str:
+    """라벨 카디널리티 제한: 알려진 문체 외에는 'other'"""
+    return tone if tone in KNOWN_TONES else "other"
+
+
+# -----------------------------------------------------------
+# 1️⃣ 지표 정의
+# -----------------------------------------------------------
+REQUEST_SECONDS = Histogram(
+    "glitda_request_seconds", "요청 전체 처리 시간 (스트리밍은 마지막 토큰까지)",
+    ["endpoint", "tone"], buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+WORKER_WAIT_SECONDS = Histogram(
+    "glitda_worker_wait_seconds", "요청 접수부터 업스트림 작업 스레드 시작까지 대기 시간",
+    ["endpoint", "tone"], buckets=_FAST_BUCKETS, registry=REGISTRY,
+)
+PROMPT_FORMAT_SECONDS = Histogram(
+    "glitda_prompt_format_seconds", "프롬프트 포맷 시간",
+    ["endpoint"], buckets=_FAST_BUCKETS, registry=REGISTRY,
+)
+UPSTREAM_TTFT_SECONDS = Histogram(
+    "glitda_upstream_ttft_seconds", "업스트림 호출부터 첫 토큰(일괄 응답은 응답 전체)까지 시간",
+    ["endpoint", "tone"], buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+INTER_TOKEN_SECONDS = Histogram(
+    "glitda_inter_token_gap_seconds", "업스트림 토큰 간 간격",
+    ["endpoint"], buckets=_GAP_BUCKETS, registry=REGISTRY,
+)
+TOKENS_TOTAL = Counter(
+    "glitda_tokens", "업스트림에서 받은 토큰(청크) 수",
+    ["endpoint", "tone"], registry=REGISTRY,
+)
+TIMEOUTS_TOTAL = Counter(
+    "glitda_upstream_timeouts", "업스트림 응답 시간 초과 횟수",
+    ["endpoint"], registry=REGISTRY,
+)
+SEMANTIC_LOOKUP_SECONDS = Histogram(
+    "glitda_semantic_cache_lookup_seconds", "의미 캐시 조회 시간 (입력 임베딩 + 색인 검색)",
+    ["endpoint", "result"], buckets=_FAST_BUCKETS, registry=REGISTRY,
+)
+JSON_PARSE_FAILURES_TOTAL = Counter(
+    "glitda_detect_json_parse_failures", "오타·문법 탐지 응답 JSON 파싱 실패 횟수",
+    registry=REGISTRY,
+)
+
+
+# -----------------------------------------------------------
+# 2️⃣ 계측 도우미
+# -----------------------------------------------------------
+@contextmanager
+def observe_request(endpoint: str, tone: str):
+    """with 블록(스트리밍은 제너레이터 종료까지) 전체 시간을 기록"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REQUEST_SECONDS.labels(endpoint, tone_label(tone)).observe(time.perf_counter() - started)
+
+
+class TokenTimer:
+    """업스트림 스트림 하나의 첫 토큰 시간 · 토큰 간 간격 · 토큰 수 기록"""
+
+    def __init__(self, endpoint: str, tone: str):
+        self.endpoint = endpoint
+        self.tone = tone_label(tone)
+        self.started = time.perf_counter()
+        self.last = None
+        self.tokens = 0
+
+    def token(self):
+        now = time.perf_counter()
+        if self.last is None:
+            UPSTREAM_TTFT_SECONDS.labels(self.endpoint, self.tone).observe(now - self.started)
+        else:
+            INTER_TOKEN_SECONDS.labels(self.endpoint).observe(now - self.last)
+        self.last = now
+        self.tokens += 1
+
+    def finish(self):
+        if self.tokens:
+            TOKENS_TOTAL.labels(self.endpoint, self.tone).inc(self.tokens)
+
+
+class _StatsCollector:
+    """get_stats() 스냅샷(캐시, 요청 병합 등)의 숫자 값을 게이지로 내보낸다"""
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def collect(self):
+        family = GaugeMetricFamily("glitda_stat", "운영 통계 스냅샷 (/stats와 동일)", labels=["name"])
+        for name, value in _flatten(self.provider()):
+            family.add_metric([name], value)
+        yield family
+
+
+def _flatten(data, prefix=""):
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, float(value)
+
+
+def register_stats_provider(provider):
+    """/stats 스냅샷 함수를 /metrics에도 노출"""
+    REGISTRY.register(_StatsCollector(provider))
+
+
+def render_latest():
+    """(본문, Content-Type) — /metrics 응답용"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
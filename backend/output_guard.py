@@ -0,0 +1,225 @@
+import os
+import re
+import threading
+
+"""
+제안 스트림 출력 계약 감시 (조기 종료 + 위반 제거)
+- suggest_stream   : 완성된 문장 하나 (번호·설명·줄바꿈 없음) → SentenceGuard
+- suggest_streamed : 2~3줄 제안 → LineGuard(max_lines=3)
+토큰을 흘려보내면서 계약이 채워지면(문장 종결, N줄 완료, 번호·설명 패턴 감지) stop=True를 돌려주고,
+생성 스레드는 그 자리에서 업스트림 스트림을 닫는다.
+줄 앞의 번호·글머리표·"제안:" 같은 머리말은 클라이언트로 가기 전에 지운다.
+"""
+
+# 줄 머리의 번호 · 글머리표 · 라벨
+_LEAD_RE = re.compile(
+    r"^(?:(?:\d{1,2}|[①-⑩])\s*[.)．]\s*|[-*•·]\s+|[①-⑩]\s*"
+    r"|(?:제안|추천|완성(?:된)?\s*문장|예시|답변|문장)\s*\d*\s*[:：]\s*)+"
+)
+# 제안 뒤에 붙는 설명 줄
+_EXPLAIN_RE = re.compile(
+    r"^(?:[(（\[]?\s*(?:설명|참고|해설|이유|주의|추가)\s*[:：)]|※|\*\*|이 문장|위 문장|위의 문장|위 제안"
+    r"|이 제안|이러한 제안|이렇게|note\b)",
+    re.IGNORECASE,
+)
+# 제안 앞에 붙는 안내 문구 ("다음과 같은 문장을 제안합니다:")
+_PREAMBLE_RE = re.compile(r"^(?:다음(?:과|은|의)|아래(?:와|는|의)|제안(?:드립|합)니다)")
+
+# 이 글자로 시작하면 머리말일 수 있으므로 몇 글자 더 보고 판단
+_AMBIGUOUS_START = set("0123456789-*•·①②③④⑤⑥⑦⑧⑨⑩(（[※제추완예답문설참해이위다아n")
+
+_TERMINATORS = ".!?。…"
+_CLOSERS = "\"'”’)」』"
+
+
+def _decisive(text: str, hold: int) -> bool:
+    return len(text) >= hold or (bool(text) and text[0] not in _AMBIGUOUS_START)
+
+
+class SentenceGuard:
+    """완성된 문장 하나 — 종결 부호 뒤 공백·줄바꿈이 오면 종료"""
+
+    def __init__(self, hold: int = 8):
+        self.hold = hold
+        self.done = False
+        self.stripped_chars = 0
+        self.dropped_chars = 0
+        self._buf = ""
+        self._started = False
+
+    def feed(self, token: str):
+        """(클라이언트로 보낼 텍스트, 업스트림 중단 여부)"""
+        if self.done:
+            self.dropped_chars += len(token)
+            return "", True
+        self._buf += token
+        if not self._started:
+            text = self._buf.lstrip()
+            if not _decisive(text, self.hold) and "\n" not in text:
+                return "", False
+            match = _LEAD_RE.match(text)
+            if match:
+                self.stripped_chars += match.end()
+                text = text[match.end():]
+            self._buf = text
+            self._started = bool(text)
+            if not text:
+                return "", False
+        return self._scan()
+
+    def _scan(self):
+        buf = self._buf
+        for i, ch in enumerate(buf):
+            if ch == "\n":
+                return self._end(buf[:i], buf[i:])
+            if ch in _TERMINATORS:
+                j = i + 1
+                while j < len(buf) and buf[j] in _TERMINATORS + _CLOSERS:
+                    j += 1
+                if j == len(buf):
+                    # 다음 토큰을 봐야 문장 끝인지("다." + 공백) 소수점인지("3.14") 알 수 있다
+                    self._buf = buf[i:]
+                    return buf[:i], False
+                if buf[j].isspace():
+                    return self._end(buf[:j], buf[j:])
+        self._buf = ""
+        return buf, False
+
+    def _end(self, text, rest):
+        self.done = True
+        self.dropped_chars += len(rest)
+        self._buf = ""
+        return text, True
+
+    def finish(self):
+        """스트림이 자연 종료됐을 때 남은 텍스트"""
+        text, self._buf = ("" if self.done else self._buf), ""
+        return text
+
+
+class LineGuard:
+    """최대 max_lines줄 — 줄마다 번호를 지우고, 설명 줄이 나오거나 N줄을 채우면 종료"""
+
+    def __init__(self, max_lines: int = 3, hold: int = 6):
+        self.max_lines = max_lines
+        self.hold = hold
+        self.done = False
+        self.lines = 0
+        self.stripped_chars = 0
+        self.dropped_chars = 0
+        self._line = ""         # 아직 판단하지 않은 줄 머리
+        self._decided = False
+        self._skip = False      # 안내 문구 줄은 통째로 버림
+        self._in_line = False   # 현재 줄에서 무언가 내보냈는지
+
+    def feed(self, token: str):
+        out = []
+        for ch in token:
+            if self.done:
+                self.dropped_chars += 1
+            elif ch == "\n":
+                self._newline(out)
+            elif self._decided:
+                if self._skip:
+                    self.dropped_chars += 1
+                else:
+                    out.append(ch)
+            else:
+                self._line += ch
+                if _decisive(self._line.lstrip(), self.hold):
+                    self._decide(out)
+        return "".join(out), self.done
+
+    def _decide(self, out):
+        self._decided = True
+        text = self._line.lstrip()
+        self._line = ""
+        if _EXPLAIN_RE.match(text) and self.lines:
+            self.done = True
+            self.dropped_chars += len(text)
+            return
+        if _PREAMBLE_RE.match(text) and not self.lines:
+            self._skip = True
+            self.dropped_chars += len(text)
+            return
+        match = _LEAD_RE.match(text)
+        if match:
+            self.stripped_chars += match.end()
+            text = text[match.end():]
+        if text:
+            out.append(text)
+            self._in_line = True
+
+    def _newline(self, out):
+        if not self._decided and self._line.strip():
+            self._decide(out)
+        if self._in_line and not self.done:
+            out.append("\n")
+            self.lines += 1
+            if self.lines >= self.max_lines:
+                self.done = True
+        self._line, self._decided, self._skip, self._in_line = "", False, False, False
+
+    def finish(self):
+        out = []
+        if not self.done and not self._decided and self._line.strip():
+            self._decide(out)
+        return "".join(out)
+
+
+GUARDS = {
+    "suggest_stream": SentenceGuard,
+    "suggest_streamed": lambda: LineGuard(max_lines=int(os.getenv("SUGGEST_STREAMED_MAX_LINES", "3"))),
+}
+
+GUARD_ENABLED = os.getenv("OUTPUT_GUARD", "1") == "1"
+
+
+def make_guard(endpoint: str):
+    """엔드포인트별 새 감시기 (해당 계약이 없거나 꺼져 있으면 None)"""
+    factory = GUARDS.get(endpoint) if GUARD_ENABLED else None
+    return factory() if factory else None
+
+
+# -----------------------------------------------------------
+# 통계 — 조기 종료로 아낀 토큰 추정
+# -----------------------------------------------------------
+class GuardStats:
+    """
+    조기 종료하지 않은 스트림의 평균 토큰 수를 '원래 길이'로 보고,
+    조기 종료한 스트림은 (평균 - 실제 받은 토큰 수)만큼 아낀 것으로 추정한다.
+    """
+
+    def __init__(self, default_tokens: int = 80):
+        self.default_tokens = default_tokens
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, feature: str, guard, tokens: int):
+        with self._lock:
+            stats = self._stats.setdefault(feature, {
+                "streams": 0, "early_stops": 0, "tokens_received": 0, "chars_stripped": 0,
+                "chars_suppressed": 0, "estimated_tokens_saved": 0, "_natural_tokens": 0, "_natural_streams": 0,
+            })
+            stats["streams"] += 1
+            stats["tokens_received"] += tokens
+            stats["chars_stripped"] += guard.stripped_chars
+            stats["chars_suppressed"] += guard.dropped_chars
+            if guard.done:
+                stats["early_stops"] += 1
+                natural = (stats["_natural_tokens"] / stats["_natural_streams"]
+                           if stats["_natural_streams"] else self.default_tokens)
+                stats["estimated_tokens_saved"] += max(0, round(natural) - tokens)
+            else:
+                stats["_natural_tokens"] += tokens
+                stats["_natural_streams"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                feature: {k: v for k, v in stats.items() if not k.startswith("_")}
+                for feature, stats in self._stats.items()
+            }
+
+
+guard_stats = GuardStats(default_tokens=int(os.getenv("OUTPUT_GUARD_EST_TOKENS", "80")))
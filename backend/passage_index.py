@@ -0,0 +1,221 @@
+import sys
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_right
+from collections import Counter
+
+"""
+유명 구절 색인 (애국가, 시, 노래, 속담 등)
+코퍼스 파일을 시작 시 한 번 읽어 작품별로 정규화(공백·문장부호 제거)한 문자열의
+글자 3-gram → 위치 역색인을 만든다.
+입력 끝부분의 3-gram들이 같은 "끝 위치"에 투표하는 방식이라 띄어쓰기 차이나
+한두 글자 오타가 있어도 위치를 찾고, "다음에 올 말 / 관련 구절"을 수 μs 안에 돌려준다.
+"""
+
+DEFAULT_CORPUS = "data/passages.txt"
+
+
+def normalize_passage(text: str):
+    """비교용 정규화: NFC + 소문자 + 글자·숫자만 남김"""
+    return "".join(ch for ch in unicodedata.normalize("NFC", text).lower() if ch.isalnum())
+
+
+class PassageMatch:
+    """색인 조회 결과 — 작품의 line_no번째 줄 offset 위치까지 입력과 일치"""
+
+    __slots__ = ("title", "lines", "line_no", "offset", "score", "strong", "collection")
+
+    def __init__(self, title, lines, line_no, offset, score, strong, collection):
+        self.title = title
+        self.lines = lines
+        self.line_no = line_no
+        self.offset = offset
+        self.score = score
+        self.strong = strong
+        self.collection = collection
+
+    @property
+    def rest(self):
+        """현재 줄의 남은 부분"""
+        return self.lines[self.line_no][self.offset:]
+
+    def continuation(self, user_input: str = ""):
+        """바로 이어질 조각: 현재 줄의 나머지, 줄 끝이면 다음 줄"""
+        rest = self.rest
+        if not normalize_passage(rest):
+            if self.collection or self.line_no + 1 >= len(self.lines):
+                return ""
+            rest = " " + self.lines[self.line_no + 1]
+        if user_input[-1:].isspace():
+            rest = rest.lstrip()
+        return rest
+
+    def related(self, limit: int = 3):
+        """관련 구절: 작성 중인 줄 전체, 이어지는 줄들 (반복 구절은 한 번만)"""
+        if self.collection:
+            return [self.lines[self.line_no]] if normalize_passage(self.rest) else []
+        related = []
+        if normalize_passage(self.rest):
+            related.append(self.lines[self.line_no])
+        count = len(self.lines)
+        for step in range(1, count):
+            line = self.lines[(self.line_no + step) % count]
+            if line not in related:
+                related.append(line)
+            if len(related) >= limit:
+                break
+        return related[:limit]
+
+    def reference(self, limit: int = 4):
+        """프롬프트에 넣을 근거 텍스트"""
+        lines = self.related(limit) or [self.lines[self.line_no]]
+        return f"「{self.title}」\n" + "\n".join(lines)
+
+
+class PassageIndex:
+    """글자 n-gram 역색인 (작품 경계를 넘는 일치는 만들지 않음)"""
+
+    def __init__(self, n: int = 3, max_query_chars: int = 24, min_score: float = 0.5,
+                 strong_score: float = 0.75, strong_min_chars: int = 6):
+        self.n = n
+        self.max_query_chars = max_query_chars
+        self.min_score = min_score
+        self.strong_score = strong_score
+        self.strong_min_chars = strong_min_chars
+
+        self._works = []          # (title, lines, collection)
+        self._work_starts = []    # 작품별 정규화 문자열 시작 위치
+        self._work_ends = []
+        self._line_ids = []       # 전역 줄 번호 → (작품 번호, 작품 내 줄 번호)
+        self._char_line = array("i")    # 정규화 글자 → 전역 줄 번호
+        self._char_offset = array("i")  # 정규화 글자 → 원문 줄에서 이 글자 다음 위치
+        self._text = []
+        self._grams = {}
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "strong_hits": 0}
+
+    # -----------------------------------------------------------
+    # 색인 구성
+    # -----------------------------------------------------------
+    @classmethod
+    def load(cls, path: str, **options):
+        index = cls(**options)
+        with open(path, encoding="utf-8") as f:
+            index.add_corpus(f.read())
+        return index
+
+    def add_corpus(self, text: str):
+        """'# 제목' 단위 작품 파싱 — 제목이 '(모음)'으로 끝나면 줄마다 독립 구절"""
+        title, lines = None, []
+
+        def flush():
+            if title is None or not lines:
+                return
+            if title.endswith("(모음)"):
+                name = title[:-len("(모음)")].strip()
+                for line in lines:
+                    self.add_work(name, [line], collection=True)
+            else:
+                self.add_work(title, list(lines))
+
+        for raw in text.splitlines():
+            line = raw.strip()
+            if line.startswith(";"):
+                continue
+            if line.startswith("#"):
+                flush()
+                title, lines = line.lstrip("#").strip(), []
+            elif line:
+                lines.append(line)
+        flush()
+
+    def add_work(self, title: str, lines, collection: bool = False):
+        work_id = len(self._works)
+        self._works.append((title, lines, collection))
+        start = len(self._text)
+        self._work_starts.append(start)
+        for line_no, line in enumerate(lines):
+            line_id = len(self._line_ids)
+            self._line_ids.append((work_id, line_no))
+            for offset, ch in enumerate(line):
+                norm = normalize_passage(ch)
+                for c in norm:
+                    self._text.append(c)
+                    self._char_line.append(line_id)
+                    self._char_offset.append(offset + 1)
+        end = len(self._text)
+        self._work_ends.append(end)
+        for pos in range(start, end - self.n + 1):
+            gram = "".join(self._text[pos:pos + self.n])
+            self._grams.setdefault(gram, array("i")).append(pos)
+
+    def passages(self):
+        """색인된 모든 구절 줄 (벤치마크용)"""
+        return [line for _, lines, _ in self._works for line in lines]
+
+    # -----------------------------------------------------------
+    # 조회
+    # -----------------------------------------------------------
+    def lookup(self, query: str):
+        """입력 끝부분과 일치하는 구절 위치 (없으면 None)"""
+        q = normalize_passage(query)[-self.max_query_chars:]
+        result = self._lookup(q) if len(q) >= self.n else None
+        with self._lock:
+            self._stats["lookups"] += 1
+            if result:
+                self._stats["hits"] += 1
+                if result.strong:
+                    self._stats["strong_hits"] += 1
+        return result
+
+    def _lookup(self, q):
+        n = self.n
+        total = len(q) - n + 1
+        votes = Counter()
+        for i in range(total):
+            for pos in self._grams.get(q[i:i + n], ()):
+                end = pos + len(q) - i  # 이 gram 기준으로 정렬한 입력 끝 위치
+                work = bisect_right(self._work_starts, pos) - 1
+                if end <= self._work_ends[work]:
+                    votes[end] += 1
+        if not votes:
+            return None
+
+        # 삽입·삭제 오타는 정렬을 한 칸 밀므로 이웃 위치의 표도 합산
+        def score(end):
+            return min(1.0, (votes[end] + votes.get(end - 1, 0) + votes.get(end + 1, 0)) / total)
+
+        best = max(votes, key=lambda end: (score(end), votes[end]))
+        matched = score(best)
+        if matched < self.min_score:
+            return None
+
+        line_id = self._char_line[best - 1]
+        work_id, line_no = self._line_ids[line_id]
+        title, lines, collection = self._works[work_id]
+        strong = matched >= self.strong_score and len(q) >= self.strong_min_chars
+        return PassageMatch(title, lines, line_no, self._char_offset[best - 1],
+                            round(matched, 3), strong, collection)
+
+    # -----------------------------------------------------------
+    # 통계
+    # -----------------------------------------------------------
+    def memory_bytes(self):
+        """색인 자료구조의 대략적인 메모리 사용량"""
+        size = sys.getsizeof(self._grams) + sys.getsizeof(self._text)
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self._grams.items())
+        size += sys.getsizeof(self._char_line) + sys.getsizeof(self._char_offset)
+        size += sys.getsizeof(self._line_ids) + 64 * len(self._line_ids)
+        return size
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "works": len(self._works),
+            "lines": len(self._line_ids),
+            "grams": len(self._grams),
+            "memory_kb": round(self.memory_bytes() / 1024, 1),
+        })
+        return stats
@@ -0,0 +1,100 @@
+"""
+피스 테이블 문서 (WebSocket 문서 동기화용)
+처음 받은 글은 복사하지 않고 그대로 두고, 편집은 조각 목록만 바꾼다.
+조각 = (원본 문자열, 시작, 길이) — 이어 붙이면 현재 문서.
+- 삽입: 위치의 조각을 둘로 나누고 새 조각을 끼움. 방금 삽입한 조각 바로 뒤에 이어 치면 그 조각을 늘린다
+  (글자마다 조각이 생기지 않도록).
+- 삭제: 범위 양 끝에서 조각을 나누고 사이 조각을 뺀다.
+- 조각이 compact_after개를 넘으면 현재 글 하나로 다시 합친다.
+- text()는 다음 편집 전까지 캐시한다.
+"""
+
+
+class EditError(ValueError):
+    """문서 범위를 벗어난 편집 — 클라이언트와 문서가 어긋났다는 뜻 (전체 재전송 필요)"""
+
+
+class PieceTable:
+    def __init__(self, text: str = "", compact_after: int = 256):
+        self.compact_after = compact_after
+        self._pieces = [[text, 0, len(text)]] if text else []
+        self._length = len(text)
+        self._text = text
+        self._typing = None  # 방금 삽입한 조각 (이어 치면 늘림)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def pieces(self) -> int:
+        return len(self._pieces)
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(source[start:start + length] for source, start, length in self._pieces)
+        return self._text
+
+    def slice(self, start: int, end: int = None) -> str:
+        end = self._length if end is None else min(end, self._length)
+        if self._text is not None:
+            return self._text[start:end]
+        out, offset = [], 0
+        for source, begin, length in self._pieces:
+            if offset >= end:
+                break
+            if offset + length > start:
+                lo, hi = max(start - offset, 0), min(end - offset, length)
+                out.append(source[begin + lo:begin + hi])
+            offset += length
+        return "".join(out)
+
+    # -----------------------------------------------------------
+    # 편집
+    # -----------------------------------------------------------
+    def apply(self, pos: int, delete: int = 0, insert: str = ""):
+        """pos 위치에서 delete글자를 지우고 insert를 넣음 (범위를 벗어나면 EditError)"""
+        if not (0 <= pos <= self._length and 0 <= delete <= self._length - pos):
+            raise EditError(f"편집 범위 오류: pos={pos} delete={delete} length={self._length}")
+        if delete:
+            self._delete(pos, delete)
+        if insert:
+            self._insert(pos, insert)
+        if len(self._pieces) > self.compact_after:
+            text = self.text()
+            self._pieces = [[text, 0, len(text)]]
+            self._typing = None
+
+    def _split(self, pos: int) -> int:
+        """pos가 조각 경계가 되도록 나눔 → pos에서 시작하는 조각의 번호"""
+        offset = 0
+        for index, piece in enumerate(self._pieces):
+            source, start, length = piece
+            if pos == offset:
+                return index
+            if pos < offset + length:
+                cut = pos - offset
+                piece[2] = cut
+                self._pieces.insert(index + 1, [source, start + cut, length - cut])
+                return index + 1
+            offset += length
+        return len(self._pieces)
+
+    def _insert(self, pos: int, text: str):
+        index = self._split(pos)
+        before = self._pieces[index - 1] if index else None
+        if before is not None and before is self._typing and before[1] + before[2] == len(before[0]):
+            # 이어 치기: 조각이 자기 문자열 끝까지 가리키면 문자열만 늘림 (나뉜 뒤쪽 조각은 옛 문자열을 계속 가리킴)
+            before[0] += text
+            before[2] += len(text)
+        else:
+            self._typing = [text, 0, len(text)]
+            self._pieces.insert(index, self._typing)
+        self._length += len(text)
+        self._text = None
+
+    def _delete(self, pos: int, count: int):
+        first = self._split(pos)
+        last = self._split(pos + count)
+        del self._pieces[first:last]
+        self._length -= count
+        self._text = None
@@ -0,0 +1,413 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+from worker_pool import PoolOverloaded, parse_map
+
+"""
+업스트림 호출 복원력 (마감 시간 + 헤지 요청 + 회로 차단기)
+느린 업스트림 응답 하나가 그 사용자의 요청 전체를 붙잡고 있었다 (일괄 응답 20초, 스트림은 무한정).
+- 기능별 마감: 첫 토큰(TTFT)까지 / 응답 전체까지. 넘기면 시간 초과로 끝낸다.
+- 헤지: 첫 토큰이 최근 TTFT의 p백분위(기본 p95)까지 오지 않으면 같은 요청을 한 번 더 보내고
+  먼저 토큰을 받은 쪽을 쓴다 (늦은 쪽은 다음 청크에서 닫힘). 추가 호출은 요청 수의 hedge_budget 비율까지.
+- 회로 차단기: 업스트림 경로(제공자:모델)별로 최근 window초 동안 실패(오류·마감 초과) 비율이 높으면
+  cooldown초 동안 호출하지 않고 바로 PoolOverloaded(circuit_open, 503)로 거절하고,
+  그 뒤 시험 호출 하나가 성공하면 다시 연다.
+"""
+
+DEFAULT_TTFT_DEADLINES = {
+    "predict": 3.0,
+    "suggest_stream": 5.0,
+    "suggest_streamed": 8.0,
+    "detect_stream": 10.0,
+}
+DEFAULT_TOTAL_DEADLINES = {
+    "predict": 8.0,
+    "suggest_stream": 15.0,
+    "suggest_streamed": 30.0,
+    "detect_stream": 30.0,
+    "suggest": 20.0,
+    "detect_batch": 20.0,
+}
+DEFAULT_HEDGE_FEATURES = ("predict", "suggest_stream", "suggest_streamed", "suggest", "detect_batch")
+
+
+# -----------------------------------------------------------
+# 1️⃣ 공유 타이머 (요청마다 threading.Timer 스레드를 만들지 않음)
+# -----------------------------------------------------------
+class _Timer:
+    __slots__ = ("fn", "cancelled")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _TimerThread:
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = None
+        self._thread = None
+
+    def schedule(self, delay: float, fn) -> _Timer:
+        timer = _Timer(fn)
+        if self._cond is None:
+            # 조건 변수와 스레드 모두 첫 사용 시 만든다 — 임포트 시점에 만들면 monkey patch 이전의 OS 락을
+            # greenlet이 나눠 쓰게 된다 (yield 없이 확인 · 대입하므로 greenlet 사이에서는 한 번만 생성)
+            self._cond = threading.Condition()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="resilience-timer", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), timer))
+            self._cond.notify()
+        return timer
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            try:
+                timer.fn()
+            except Exception as e:
+                print(f"[경고] 복원력 타이머 처리 실패: {e}")
+
+
+_timers = _TimerThread()
+
+
+# -----------------------------------------------------------
+# 2️⃣ 회로 차단기
+# -----------------------------------------------------------
+class CircuitBreaker:
+    """closed → (실패 비율 초과) open → (cooldown 후) half_open 시험 호출 1개 → closed / open"""
+
+    def __init__(self, window: float = 30.0, min_calls: int = 10, failure_ratio: float = 0.5,
+                 cooldown: float = 15.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._events = deque()  # (시각, 성공 여부)
+        self._opened_at = 0.0
+        self._probe_at = None
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self, now: float) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if now - self._opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self._probe_at = None
+            if self.state == "half_open":
+                # 시험 호출 결과가 오지 않으면(연결 종료 등) cooldown 뒤 다른 요청으로 다시 시험
+                if self._probe_at is not None and now - self._probe_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self._probe_at = now
+            return True
+
+    def record(self, ok, now: float):
+        """ok: True 성공 / False 실패 / None 판단 불가 (사용자 취소 — 시험 호출 자리만 비움)"""
+        with self._lock:
+            if self.state == "half_open":
+                if ok is None:
+                    self._probe_at = None
+                elif ok:
+                    self.state = "closed"
+                    self._events.clear()
+                else:
+                    self._open(now)
+                return
+            if ok is None:
+                return
+            self._events.append((now, ok))
+            while self._events and now - self._events[0][0] > self.window:
+                self._events.popleft()
+            failures = sum(1 for _, success in self._events if not success)
+            if (self.state == "closed" and len(self._events) >= self.min_calls
+                    and failures >= self.failure_ratio * len(self._events)):
+                self._open(now)
+
+    def _open(self, now):
+        self.state = "open"
+        self._opened_at = now
+        self._probe_at = None
+        self.opened += 1
+
+    def retry_after(self, now: float) -> int:
+        return max(1, math.ceil(self.cooldown - (now - self._opened_at)))
+
+    def stats(self):
+        with self._lock:
+            failures = sum(1 for _, success in self._events if not success)
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected,
+                    "recent_calls": len(self._events), "recent_failures": failures}
+
+
+# -----------------------------------------------------------
+# 3️⃣ 정책 (마감 · 헤지 지연 · 회로 차단기 · 통계)
+# -----------------------------------------------------------
+class Resilience:
+    def __init__(self, ttft_deadlines=None, total_deadlines=None, hedge_percentile: float = 95.0,
+                 hedge_features=DEFAULT_HEDGE_FEATURES, hedge_budget: float = 0.1, hedge_min_delay: float = 0.05,
+                 hedge_median_factor: float = 1.5,
+                 min_samples: int = 20, breaker_options=None, route_of=None, history: int = 500):
+        self.ttft_deadlines = dict(DEFAULT_TTFT_DEADLINES, **(ttft_deadlines or {}))
+        self.total_deadlines = dict(DEFAULT_TOTAL_DEADLINES, **(total_deadlines or {}))
+        self.hedge_percentile = hedge_percentile
+        self.hedge_features = set(hedge_features)
+        self.hedge_budget = hedge_budget
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_median_factor = hedge_median_factor
+        self.min_samples = min_samples
+        self.breaker_options = breaker_options or {}
+        self.route_of = route_of or (lambda feature: feature)
+        self.history = history
+        self._ttft = {}      # feature -> deque[초]
+        self._breakers = {}  # 경로 -> CircuitBreaker
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, route_of=None):
+        return cls(
+            ttft_deadlines=parse_map(os.getenv("TTFT_DEADLINES")),
+            total_deadlines=parse_map(os.getenv("TOTAL_DEADLINES")),
+            hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+            hedge_features=[f.strip() for f in os.getenv("HEDGE_FEATURES", ",".join(DEFAULT_HEDGE_FEATURES)).split(",")
+                            if f.strip()],
+            hedge_budget=float(os.getenv("HEDGE_BUDGET", "0.1")),
+            breaker_options={
+                "window": float(os.getenv("BREAKER_WINDOW", "30")),
+                "min_calls": int(os.getenv("BREAKER_MIN_CALLS", "10")),
+                "failure_ratio": float(os.getenv("BREAKER_FAILURE_RATIO", "0.5")),
+                "cooldown": float(os.getenv("BREAKER_COOLDOWN", "15")),
+            },
+            route_of=route_of,
+        )
+
+    def ttft_deadline(self, feature: str):
+        return self.ttft_deadlines.get(feature)
+
+    def total_deadline(self, feature: str) -> float:
+        return self.total_deadlines.get(feature, 20.0)
+
+    def _feature_stats(self, feature):
+        return self._stats.setdefault(feature, {
+            "requests": 0, "hedged": 0, "hedge_wins": 0, "hedge_denied": 0,
+            "ttft_timeouts": 0, "total_timeouts": 0, "failures": 0, "circuit_rejected": 0,
+        })
+
+    def count(self, feature: str, name: str):
+        with self._lock:
+            self._feature_stats(feature)[name] += 1
+
+    def _breaker(self, feature):
+        route = self.route_of(feature)
+        with self._lock:
+            breaker = self._breakers.get(route)
+            if breaker is None:
+                breaker = self._breakers[route] = CircuitBreaker(**self.breaker_options)
+            return breaker
+
+    def admit(self, feature: str):
+        """업스트림 호출 전 — 회로가 열려 있으면 PoolOverloaded(circuit_open)"""
+        breaker = self._breaker(feature)
+        now = time.monotonic()
+        if not breaker.allow(now):
+            self.count(feature, "circuit_rejected")
+            raise PoolOverloaded(feature, "circuit_open", breaker.retry_after(now))
+        self.count(feature, "requests")
+
+    def record(self, feature: str, ok, ttft: float = None):
+        """호출 하나의 결과 (admit 한 번에 한 번) — 성공한 호출의 TTFT는 헤지 지연 계산에 사용"""
+        if ttft is not None and ok is not False:
+            with self._lock:
+                self._ttft.setdefault(feature, deque(maxlen=self.history)).append(ttft)
+        if ok is False:
+            self.count(feature, "failures")
+        self._breaker(feature).record(ok, time.monotonic())
+
+    def hedge_delay(self, feature: str):
+        """헤지를 보낼 시점 (업스트림 호출 시작 기준 초) — 헤지 대상이 아니거나 표본이 부족하면 None"""
+        if feature not in self.hedge_features:
+            return None
+        with self._lock:
+            samples = sorted(self._ttft.get(feature, ()))
+        if len(samples) < self.min_samples:
+            return None
+        delay = samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+        # 응답 시간이 고른 업스트림에서는 p백분위가 중앙값과 거의 같다 → 정상 호출까지 헤지하지 않도록 하한
+        delay = max(delay, samples[len(samples) // 2] * self.hedge_median_factor)
+        deadline = self.ttft_deadline(feature) or self.total_deadline(feature)
+        return min(max(self.hedge_min_delay, delay), deadline)
+
+    def try_hedge(self, feature: str) -> bool:
+        """헤지 예산(요청 수 × hedge_budget) 안이면 헤지 1회를 기록하고 True"""
+        with self._lock:
+            stats = self._feature_stats(feature)
+            if stats["hedged"] + 1 > self.hedge_budget * stats["requests"]:
+                stats["hedge_denied"] += 1
+                return False
+            stats["hedged"] += 1
+            return True
+
+    def schedule(self, delay: float, fn) -> _Timer:
+        return _timers.schedule(delay, fn)
+
+    def stats(self):
+        with self._lock:
+            features = {}
+            for feature, stats in self._stats.items():
+                samples = sorted(self._ttft.get(feature, ()))
+                features[feature] = dict(
+                    stats,
+                    ttft_ms_p50=_percentile_ms(samples, 50),
+                    ttft_ms_p99=_percentile_ms(samples, 99),
+                )
+            breakers = dict(self._breakers)
+        for feature, stats in features.items():
+            delay = self.hedge_delay(feature)
+            stats["hedge_delay_ms"] = round(delay * 1000, 1) if delay is not None else None
+        return {
+            "features": features,
+            "breakers": {route: breaker.stats() for route, breaker in breakers.items()},
+        }
+
+
+def _percentile_ms(ordered, pct):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+
+# -----------------------------------------------------------
+# 4️⃣ 스트리밍 생성 하나의 시도 경쟁 (원 요청 + 헤지)
+# -----------------------------------------------------------
+class StreamRace:
+    """
+    첫 토큰을 먼저 받은 시도(claim)만 토큰을 게시한다. 진 시도는 다음 청크에서 업스트림을 닫는다.
+    마감을 넘기면 on_expire(사유)를 한 번 호출하고("ttft" / "total"), 남은 시도도 다음 청크에서 멈춘다.
+    결과(settle / 마지막 시도의 leave / 마감 초과)는 회로 차단기에 한 번만 기록된다.
+    """
+
+    def __init__(self, policy: Resilience, feature: str, launch_hedge, on_expire):
+        self.policy = policy
+        self.feature = feature
+        self.launch_hedge = launch_hedge
+        self.on_expire = on_expire
+        self.winner = None
+        self.closed = False
+        self.ttft = None
+        self._attempts = 0
+        self._active = 0
+        self._starts = {}              # 시도 번호 -> 시작 시각
+        self._first_token_timers = []  # 헤지 · TTFT 마감 (첫 토큰이 오면 취소)
+        self._total_timer = None
+        self._lock = threading.Lock()
+
+    def begin(self) -> int:
+        """시도 시작 (작업 스레드에서 업스트림 호출 직전) → 시도 번호 (0: 원 요청)"""
+        with self._lock:
+            attempt = self._attempts
+            self._attempts += 1
+            self._active += 1
+            self._starts[attempt] = time.monotonic()
+            if attempt == 0:
+                self._arm()
+            return attempt
+
+    def _arm(self):
+        policy, feature = self.policy, self.feature
+        hedge_delay = policy.hedge_delay(feature)
+        if hedge_delay is not None:
+            self._first_token_timers.append(policy.schedule(hedge_delay, self._hedge))
+        ttft_deadline = policy.ttft_deadline(feature)
+        if ttft_deadline:
+            self._first_token_timers.append(policy.schedule(ttft_deadline, lambda: self._expire("ttft")))
+        self._total_timer = policy.schedule(policy.total_deadline(feature), lambda: self._expire("total"))
+
+    def _disarm(self):
+        for timer in self._first_token_timers:
+            timer.cancel()
+        if self._total_timer:
+            self._total_timer.cancel()
+
+    def pending(self) -> bool:
+        """아직 어느 시도도 첫 토큰을 받지 않았고 끝나지도 않음 (늦게 시작한 헤지가 계속할지)"""
+        with self._lock:
+            return not self.closed and self.winner is None
+
+    def _hedge(self):
+        with self._lock:
+            if self.closed or self.winner is not None:
+                return
+        if self.policy.try_hedge(self.feature):
+            try:
+                self.launch_hedge()
+            except PoolOverloaded:
+                pass  # 풀이 가득 차 있으면 원 요청만 기다린다
+
+    def claim(self, attempt: int) -> bool:
+        """토큰을 받을 때마다 — 이 시도가 출력을 가지면 True"""
+        with self._lock:
+            if self.closed:
+                return False
+            if self.winner is None:
+                self.winner = attempt
+                # 헤지 지연은 업스트림 한 번의 TTFT 분포로 정하므로 이긴 시도 자신의 시작부터 잰다
+                self.ttft = time.monotonic() - self._starts[attempt]
+                for timer in self._first_token_timers:
+                    timer.cancel()
+                if attempt:
+                    self.policy.count(self.feature, "hedge_wins")
+            return self.winner == attempt
+
+    def settle(self, ok) -> bool:
+        """이긴 시도가 끝남 (ok: True 완료 / False 실패 / None 사용자 취소) → 마감 초과로 이미 닫혔으면 False"""
+        with self._lock:
+            self._active -= 1
+            if self.closed:
+                return False
+            self.closed = True
+            self._disarm()
+        self.policy.record(self.feature, ok, self.ttft)
+        return True
+
+    def leave(self, attempt: int, ok) -> bool:
+        """토큰을 게시하지 않고 끝난 시도 → 마지막 남은 시도였으면 True (호출 측이 스트림을 닫음)"""
+        with self._lock:
+            self._active -= 1
+            if self.closed or self.winner is not None or self._active > 0:
+                return False
+            self.closed = True
+            self._disarm()
+        self.policy.record(self.feature, ok)
+        return True
+
+    def _expire(self, reason):
+        with self._lock:
+            if self.closed or (reason == "ttft" and self.winner is not None):
+                return
+            self.closed = True
+            self._disarm()
+        self.policy.count(self.feature, f"{reason}_timeouts")
+        self.policy.record(self.feature, False)
+        self.on_expire(reason)
@@ -0,0 +1,319 @@
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+"""
+업스트림 호출 우선순위 스케줄러 + 분당 요청/토큰 예산 (worker_pool의 대기열 정책)
+모든 기능이 OpenAI 할당량 하나를 나눠 쓰지만 필요한 지연은 다르다.
+- interactive: 키 입력마다 나가는 AI Cursor(predict), 실시간 제안(suggest_stream)
+- standard   : 사용자가 기다리는 스트리밍 제안·탐지 (suggest_streamed, detect_stream)
+- background : 일괄 /suggest, /detect (1~2초 늦어도 됨)
+높은 등급부터 꺼내고, 같은 등급 안에서는 사용자별로 돌아가며(round-robin) 꺼낸다.
+RPM/TPM 토큰 버킷에 여유가 부족하면 interactive만 남은 예산(reserve)을 쓸 수 있고,
+예산이 바닥난 동안 stale_after초 넘게 기다린 background 작업은 실행하지 않고 버린다.
+"""
+
+PRIORITY_CLASSES = ("interactive", "standard", "background")
+
+FEATURE_CLASSES = {
+    "predict": "interactive",
+    "suggest_stream": "interactive",
+    "suggest_streamed": "standard",
+    "detect_stream": "standard",
+    "suggest": "background",
+    "detect_batch": "background",
+}
+
+# 요청 사용자 (라우트가 세션 키로 설정, 작업 풀 submit이 읽음)
+current_user = contextvars.ContextVar("current_user", default="anonymous")
+# 지금 실행 중인 작업 (작업 스레드 · asyncio 태스크마다) → record_output이 어느 작업의 사용량인지 안다
+_running_task = contextvars.ContextVar("scheduler_running_task", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """대략적인 토큰 수: 한글 등 비ASCII는 글자당 1, ASCII는 4글자당 1"""
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+class TokenBucket:
+    """분당 한도(per_minute)를 초 단위로 채우는 버킷 — per_minute가 0이면 무제한"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self):
+        return self.per_minute <= 0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def available(self, now):
+        if self.unlimited:
+            return math.inf
+        with self._lock:
+            self._refill(now)
+            return self.level
+
+    def take(self, amount, now):
+        if not self.unlimited:
+            with self._lock:
+                self._refill(now)
+                self.level -= amount
+
+    def give(self, amount, now):
+        """예상보다 적게 쓴 만큼 돌려받음 (음수면 추가 차감)"""
+        if not self.unlimited:
+            with self._lock:
+                self._refill(now)
+                self.level = min(self.capacity, self.level + amount)
+
+    def time_until(self, amount, now):
+        """amount만큼 찰 때까지 걸리는 시간 (초)"""
+        if self.unlimited:
+            return 0.0
+        missing = amount - self.available(now)
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def fraction(self, now):
+        return 1.0 if self.unlimited else max(0.0, self.available(now) / self.capacity)
+
+
+class _ClassQueue:
+    """등급 하나의 사용자별 대기열 (사용자 순서대로 한 건씩)"""
+
+    def __init__(self):
+        self.users = OrderedDict()  # user -> deque[task]
+        self.size = 0
+
+    def push(self, task):
+        self.users.setdefault(task.user, deque()).append(task)
+        self.size += 1
+
+    def remove(self, task):
+        tasks = self.users[task.user]
+        tasks.remove(task)
+        if not tasks:
+            del self.users[task.user]
+        self.size -= 1
+
+    def tasks(self):
+        for tasks in self.users.values():
+            yield from tasks
+
+    def candidates(self):
+        """사용자 순서대로, 각 사용자의 대기 작업을 앞에서부터"""
+        for user, tasks in self.users.items():
+            for task in tasks:
+                yield user, task
+
+    def rotate(self, user):
+        """방금 꺼낸 사용자를 맨 뒤로 → 다음에는 다른 사용자가 먼저"""
+        if user in self.users:
+            self.users.move_to_end(user)
+
+
+class PriorityScheduler:
+    """
+    worker_pool.WorkerPool(queue=...) · AsyncWorkerPool(queue=...)에 넣는 대기열 정책.
+    push/pop/expire/wait_hint/done/stats는 풀의 락 안에서만 호출된다.
+    start는 작업을 실행하는 스레드 · 태스크에서 락 밖에서 호출된다.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, reserve: float = 0.2, stale_after: float = 3.0,
+                 expected_output: int = 120, feature_classes=None, history: int = 2000,
+                 max_users: int = 10000, user_ttl: float = 600):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.reserve = reserve
+        self.stale_after = stale_after
+        self.feature_classes = dict(FEATURE_CLASSES, **(feature_classes or {}))
+        self._queues = {name: _ClassQueue() for name in PRIORITY_CLASSES}
+        self._expected_output = {}  # feature -> 평균 출력 토큰 수
+        self._default_output = expected_output
+        self._waits = {name: deque(maxlen=history) for name in PRIORITY_CLASSES}
+        self._class_stats = {name: {"dispatched": 0, "dropped_stale": 0, "deferred": 0}
+                             for name in PRIORITY_CLASSES}
+        self._users = OrderedDict()  # user -> {"submitted", "dispatched", "seen"} (최근 제출 순)
+        self.max_users = max_users
+        self.user_ttl = user_ttl
+        self._usage_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        # 분당 예산은 API 계정 단위 → 프로세스 여러 개(serve.py가 WEB_WORKERS 설정)가 똑같이 나눠 씀
+        processes = max(1, int(os.getenv("WEB_WORKERS", "1")))
+        return cls(
+            rpm=float(os.getenv("SCHED_RPM", "0")) / processes,
+            tpm=float(os.getenv("SCHED_TPM", "0")) / processes,
+            reserve=float(os.getenv("SCHED_RESERVE", "0.2")),
+            stale_after=float(os.getenv("SCHED_STALE_SECONDS", "3")),
+            max_users=int(os.getenv("SCHED_MAX_USERS", "10000")),
+            user_ttl=float(os.getenv("SCHED_USER_TTL", "600")),
+        )
+
+    def priority(self, feature):
+        return self.feature_classes.get(feature, "standard")
+
+    def expected_output(self, feature):
+        return self._expected_output.get(feature, self._default_output)
+
+    def estimate(self, feature, prompt_tokens):
+        """예산에서 미리 뺄 토큰 수 = 프롬프트 + 기능별 평균 출력"""
+        return prompt_tokens + self.expected_output(feature)
+
+    # -----------------------------------------------------------
+    # 대기열 (worker_pool 인터페이스)
+    # -----------------------------------------------------------
+    def __len__(self):
+        return sum(queue.size for queue in self._queues.values())
+
+    def push(self, task):
+        task.priority = self.priority(task.feature)
+        task.user = task.user or current_user.get()
+        self._queues[task.priority].push(task)
+        usage = self._users.setdefault(task.user, {"submitted": 0, "dispatched": 0, "seen": 0.0})
+        usage["submitted"] += 1
+        usage["seen"] = task.enqueued
+        self._users.move_to_end(task.user)
+        self._prune_users(task.enqueued)
+
+    def _prune_users(self, now):
+        """오래 제출하지 않은 사용자(최대 max_users명 유지)를 공정성 통계에서 뺀다 — 대기 작업이 남은 사용자는 유지"""
+        for user, usage in list(self._users.items()):
+            if len(self._users) <= self.max_users and now - usage["seen"] <= self.user_ttl:
+                break
+            if not any(user in queue.users for queue in self._queues.values()):
+                del self._users[user]
+
+    def expire(self, now):
+        expired = []
+        low = self._low_budget(now)
+        for name, queue in self._queues.items():
+            for task in list(queue.tasks()):
+                if task.deadline < now or task.future.cancelled():
+                    expired.append((task, "queue_timeout"))
+                elif low and name == "background" and now - task.enqueued > self.stale_after:
+                    expired.append((task, "stale"))
+                    self._class_stats[name]["dropped_stale"] += 1
+                else:
+                    continue
+                queue.remove(task)
+        return expired
+
+    def pop(self, runnable):
+        now = time.monotonic()
+        low = self._low_budget(now)
+        for name in PRIORITY_CLASSES:
+            queue = self._queues[name]
+            for user, task in queue.candidates():
+                if not runnable(task.feature):
+                    continue
+                if not self._affordable(task, name, now):
+                    # 상위 등급이 예산을 기다리는 동안 하위 등급이 예산을 먼저 쓰지 않도록 멈춤
+                    self._class_stats[name]["deferred"] += 1
+                    return None
+                queue.remove(task)
+                queue.rotate(user)
+                self.rpm.take(1, now)
+                self.tpm.take(task.cost, now)
+                self._waits[name].append(now - task.enqueued)
+                self._class_stats[name]["dispatched"] += 1
+                self._users[task.user]["dispatched"] += 1
+                return task
+            if low and name == "interactive" and queue.size:
+                return None
+        return None
+
+    def _affordable(self, task, name, now):
+        # interactive가 아니면 예비분(reserve)을 남겨 둔다
+        keep = 0.0 if name == "interactive" else self.reserve
+        return (self.rpm.available(now) - 1 >= keep * self.rpm.capacity
+                and self.tpm.available(now) - task.cost >= keep * self.tpm.capacity)
+
+    def _low_budget(self, now):
+        return min(self.rpm.fraction(now), self.tpm.fraction(now)) < self.reserve
+
+    def wait_hint(self):
+        """맨 앞 작업에 필요한 예산이 찰 때까지 (예산 제한이 없으면 None)"""
+        if self.rpm.unlimited and self.tpm.unlimited:
+            return None
+        now = time.monotonic()
+        for name in PRIORITY_CLASSES:
+            for _, task in self._queues[name].candidates():
+                keep = 0.0 if name == "interactive" else self.reserve
+                return max(self.rpm.time_until(1 + keep * self.rpm.capacity, now),
+                           self.tpm.time_until(task.cost + keep * self.tpm.capacity, now), 0.005)
+        return None
+
+    def start(self, task):
+        _running_task.set(task)
+
+    def done(self, task, elapsed):
+        """출력이 기록되지 않은 작업(취소 · 호출 생략 · 실패)은 미리 뺀 예산을 모두 돌려준다"""
+        now = time.monotonic()
+        if task.future.cancelled():
+            self.rpm.give(1, now)  # 실행되지 않음 → 요청도 나가지 않았다
+        if not task.recorded:
+            self.tpm.give(task.cost, now)
+
+    # -----------------------------------------------------------
+    # 실제 사용량 반영 (생성이 끝난 뒤 ai_handler가 호출)
+    # -----------------------------------------------------------
+    def record_output(self, feature, tokens):
+        """실제 출력 토큰 수로 기능별 평균을 갱신하고, 예상과의 차이를 예산에 반영"""
+        with self._usage_lock:
+            expected = self.expected_output(feature)
+            self._expected_output[feature] = expected * 0.8 + tokens * 0.2
+            self.tpm.give(expected - tokens, time.monotonic())
+        task = _running_task.get()
+        if task is not None:
+            task.recorded = True
+
+    # -----------------------------------------------------------
+    # 통계
+    # -----------------------------------------------------------
+    def stats(self):
+        now = time.monotonic()
+        classes = {}
+        for name in PRIORITY_CLASSES:
+            waits = sorted(self._waits[name])
+            classes[name] = dict(
+                self._class_stats[name],
+                queued=self._queues[name].size,
+                **{f"queue_wait_ms_p{p}": _percentile_ms(waits, p) for p in (50, 95, 99)},
+            )
+        return {
+            "classes": classes,
+            "budget": {
+                "rpm": None if self.rpm.unlimited else round(self.rpm.available(now), 1),
+                "tpm": None if self.tpm.unlimited else round(self.tpm.available(now), 1),
+                "low": self._low_budget(now),
+            },
+            "users": len(self._users),
+            "fairness": _jain_index(
+                [u["dispatched"] / u["submitted"] for u in self._users.values() if u["submitted"]]
+            ),
+        }
+
+
+def _percentile_ms(ordered, pct):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+
+def _jain_index(values):
+    """Jain 공정성 지수 (1.0 = 모든 사용자가 같은 비율로 처리됨)"""
+    if not values or not any(values):
+        return None
+    return round(sum(values) ** 2 / (len(values) * sum(v * v for v in values)), 4)
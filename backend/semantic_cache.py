@@ -0,0 +1,296 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from completion_cache import normalize_input
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # 임베딩 모델이 없으면 의미 캐시 없이 정확 일치 캐시만 사용
+    SentenceTransformer = None
+
+try:
+    import hnswlib  # hnswlib 또는 chroma-hnswlib (같은 모듈 이름)
+except ImportError:  # ANN 색인이 없으면 numpy 전수 비교 (크기가 작으면 충분히 빠름)
+    hnswlib = None
+
+"""
+의미 기반 응답 캐시 (문장 임베딩 + 근사 최근접 이웃 색인)
+학생들은 같은 과제 질문을 조금씩 다르게 입력한다 ("활성함수의 역할은" / "활성 함수가 하는 역할은").
+정확 일치 캐시(completion_cache)가 놓친 입력을 로컬 문장 임베딩 모델로 벡터화하고,
+프로세스 안의 HNSW 색인에서 가장 가까운 이전 입력을 찾아 유사도가 threshold 이상이면 그 제안을 재사용한다.
+- 같은 (문체, 엔드포인트)의 결과만 재사용
+- 크기 제한: 가득 차면 가장 오래 쓰지 않은 항목을 색인에서 지우고(mark_deleted) 그 자리를 재사용
+- TTL이 지난 항목은 조회 중 만나면 지움
+- 너무 짧은 입력("그래서")은 뜻이 모호하므로 조회하지 않음
+"""
+
+DEFAULT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class SentenceEmbedder:
+    """sentence-transformers 모델 (첫 사용 시 로드, 정규화된 float32 벡터)"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = None):
+        self.model_name = model_name
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return SentenceTransformer is not None
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def encode(self, text: str):
+        vector = self._load().encode([text], normalize_embeddings=True, convert_to_numpy=True)[0]
+        return vector.astype(np.float32, copy=False)
+
+
+# -----------------------------------------------------------
+# 1️⃣ 벡터 색인 — add / remove / query(벡터, k) → [(라벨, 코사인 유사도)]
+# -----------------------------------------------------------
+class _HnswIndex:
+    def __init__(self, dim: int, capacity: int, ef: int = 64, m: int = 16):
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        self._index.init_index(max_elements=capacity, ef_construction=max(ef, 100), M=m,
+                               allow_replace_deleted=True)
+        self._index.set_ef(ef)
+        self.ef = ef
+
+    def add(self, label, vector):
+        self._index.add_items(vector[None, :], [label], replace_deleted=True)
+
+    def remove(self, label):
+        self._index.mark_deleted(label)
+
+    def query(self, vector, k):
+        try:
+            labels, distances = self._index.knn_query(vector[None, :], k=min(k, self.ef))
+        except RuntimeError:
+            # 지운 항목이 많아 k개를 못 채움 → 하나만
+            labels, distances = self._index.knn_query(vector[None, :], k=1)
+        return [(int(label), 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+
+class _FlatIndex:
+    """hnswlib가 없을 때 — 미리 잡은 행렬에 대한 내적 전수 비교"""
+
+    def __init__(self, dim: int, capacity: int):
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._live = np.zeros(capacity, dtype=bool)
+
+    def add(self, label, vector):
+        self._vectors[label] = vector
+        self._live[label] = True
+
+    def remove(self, label):
+        self._live[label] = False
+
+    def query(self, vector, k):
+        scores = self._vectors @ vector
+        scores[~self._live] = -np.inf
+        k = min(k, int(self._live.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(int(label), float(scores[label])) for label in top[np.argsort(-scores[top])]]
+
+
+class _Entry:
+    __slots__ = ("namespace", "text", "completion", "expires_at")
+
+    def __init__(self, namespace, text, completion, expires_at):
+        self.namespace = namespace
+        self.text = text
+        self.completion = completion
+        self.expires_at = expires_at
+
+
+class SemanticMatch:
+    """조회 결과 — 실패해도 임베딩 벡터를 돌려줘 put에서 다시 계산하지 않게 한다"""
+
+    __slots__ = ("completion", "similarity", "vector")
+
+    def __init__(self, completion=None, similarity=None, vector=None):
+        self.completion = completion
+        self.similarity = similarity
+        self.vector = vector
+
+
+# -----------------------------------------------------------
+# 2️⃣ 의미 캐시
+# -----------------------------------------------------------
+class SemanticCache:
+    """lookup(입력, 문체, 엔드포인트) → SemanticMatch, put(...)으로 저장 (스레드 안전)"""
+
+    def __init__(self, embedder, threshold: float = 0.92, max_entries: int = 5000, ttl: float = 3600.0,
+                 min_chars: int = 8, neighbours: int = 8, history: int = 2000, dim: int = None, offload=None):
+        self.embedder = embedder
+        # 임베딩 계산(수~수십 ms CPU)을 실행할 함수 — ai_handler는 worker_pool.offload를 넘겨 gevent 허브를 막지 않는다
+        self.offload = offload
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_chars = min_chars
+        self.neighbours = neighbours
+        self.dim = dim
+        self._index = None
+        self._entries = OrderedDict()  # 라벨 -> _Entry (LRU 순서)
+        self._free = []                # 지운 항목의 라벨 (색인 자리 재사용)
+        self._next_label = 0
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=history)
+        self._similarity_total = 0.0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "skipped": 0,
+            "puts": 0,
+            "updates": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    @classmethod
+    def from_env(cls, offload=None):
+        """SEMANTIC_CACHE=1이고 임베딩 모델을 쓸 수 있을 때만 생성 (아니면 None)"""
+        if os.getenv("SEMANTIC_CACHE", "0") != "1":
+            return None
+        if not SentenceEmbedder.available():
+            print("[경고] sentence-transformers가 없어 의미 캐시를 사용하지 않습니다.")
+            return None
+        return cls(
+            SentenceEmbedder(os.getenv("SEMANTIC_CACHE_MODEL", DEFAULT_MODEL),
+                             device=os.getenv("SEMANTIC_CACHE_DEVICE") or None),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+            min_chars=int(os.getenv("SEMANTIC_CACHE_MIN_CHARS", "8")),
+            offload=offload,
+        )
+
+    @property
+    def backend(self):
+        return "hnswlib" if hnswlib is not None else "flat"
+
+    def warmup(self):
+        """임베딩 모델 로드(수 초)와 색인 생성을 첫 요청 전에 끝낸다"""
+        self._ensure_index(self.embedder.encode("글잇다 준비 완료."))
+
+    def _ensure_index(self, vector):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    dim = self.dim or len(vector)
+                    self._index = (_HnswIndex(dim, self.max_entries) if hnswlib is not None
+                                   else _FlatIndex(dim, self.max_entries))
+
+    def _encode(self, text):
+        if self.offload is None:
+            return self.embedder.encode(text)
+        self.embedder.dim  # 모델 로드(락 사용)는 호출한 쪽에서 — 보통 warmup에서 이미 끝나 있음
+        return self.offload(self.embedder.encode, text)
+
+    # -----------------------------------------------------------
+    # 조회 / 저장
+    # -----------------------------------------------------------
+    def lookup(self, user_input: str, tone: str, endpoint: str) -> SemanticMatch:
+        text = normalize_input(user_input)
+        if len(text) < self.min_chars:
+            with self._lock:
+                self._stats["skipped"] += 1
+            return SemanticMatch()
+        started = time.perf_counter()
+        vector = self._encode(text)
+        self._ensure_index(vector)
+        namespace = (tone, endpoint)
+        now = time.monotonic()
+        match = SemanticMatch(vector=vector)
+        with self._lock:
+            neighbours = self._index.query(vector, self.neighbours) if self._entries else []
+            for label, similarity in neighbours:
+                entry = self._entries.get(label)
+                if entry is None or entry.namespace != namespace:
+                    continue
+                if entry.expires_at <= now:
+                    self._remove_locked(label)
+                    self._stats["expirations"] += 1
+                    continue
+                if similarity >= self.threshold:
+                    self._entries.move_to_end(label)
+                    match.completion, match.similarity = entry.completion, similarity
+                break  # 유사도 순이므로 같은 이름공간의 첫 후보만 보면 된다
+            if match.completion is not None:
+                self._stats["hits"] += 1
+                self._similarity_total += match.similarity
+            else:
+                self._stats["misses"] += 1
+            self._latencies.append(time.perf_counter() - started)
+        return match
+
+    def put(self, user_input: str, tone: str, endpoint: str, completion: str, vector=None):
+        """vector: 같은 입력으로 lookup할 때 받은 SemanticMatch.vector (없으면 새로 계산)"""
+        text = normalize_input(user_input)
+        if not completion or len(text) < self.min_chars:
+            return
+        if vector is None:
+            vector = self._encode(text)
+        self._ensure_index(vector)
+        namespace = (tone, endpoint)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for label, similarity in (self._index.query(vector, 1) if self._entries else []):
+                entry = self._entries.get(label)
+                if entry is not None and entry.namespace == namespace and entry.text == text:
+                    # 같은 입력 → 색인은 그대로 두고 결과만 교체
+                    entry.completion, entry.expires_at = completion, expires_at
+                    self._entries.move_to_end(label)
+                    self._stats["updates"] += 1
+                    return
+            while len(self._entries) >= self.max_entries:
+                label = next(iter(self._entries))
+                self._remove_locked(label)
+                self._stats["evictions"] += 1
+            if self._free:
+                label = self._free.pop()
+            else:
+                label, self._next_label = self._next_label, self._next_label + 1
+            self._index.add(label, vector)
+            self._entries[label] = _Entry(namespace, text, completion, expires_at)
+            self._stats["puts"] += 1
+
+    def _remove_locked(self, label):
+        del self._entries[label]
+        self._index.remove(label)
+        self._free.append(label)
+
+    # -----------------------------------------------------------
+    # 통계
+    # -----------------------------------------------------------
+    def stats(self):
+        """적중률, 조회 지연(임베딩 + 색인 검색) 분위수, 퇴출 수"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            latencies = sorted(self._latencies)
+            similarity_total = self._similarity_total
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["hit_similarity_avg"] = round(similarity_total / stats["hits"], 4) if stats["hits"] else None
+        for p in (50, 95, 99):
+            stats[f"lookup_ms_p{p}"] = (round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+                                        * 1000, 2) if latencies else None)
+        stats.update(index=self.backend, threshold=self.threshold, max_entries=self.max_entries)
+        return stats
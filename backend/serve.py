@@ -0,0 +1,274 @@
+import argparse
+import os
+import select
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+"""
+운영용 실행기 — 워커 프로세스 N개를 미리 띄워(pre-fork) 같은 리슨 소켓을 나눠 쓴다.
+app.py의 __main__은 gevent WSGIServer 프로세스 하나라서 SSE 프레임 작성 · JSON 처리 · 프롬프트 포맷을
+CPU 코어 하나가 모두 맡는다. 여기서는
+- 마스터가 소켓을 열고 fork → 각 워커가 gevent patch 후 app을 불러오고(클라이언트 · 토크나이저 ·
+  프롬프트 준비) 준비가 끝난 뒤에야 accept를 시작한다. 커널이 연결을 준비된 워커들에 나눠 준다.
+- 워커가 비정상 종료하면 마스터가 다시 띄운다.
+- SIGHUP: 무중단 재시작 — 새 워커 N개가 준비되면 기존 워커에 SIGTERM.
+- SIGTERM / SIGINT: 워커가 리슨 소켓을 닫고 열린 SSE 스트림이 끝나기를 GRACEFUL_TIMEOUT초까지 기다린다.
+- 워커 간 캐시 · 세션은 SHARED_CACHE_PATH의 SQLite 파일(shared_cache)로 공유한다.
+  지정하지 않으면 임시 디렉터리에 포트별 파일을 만든다.
+/stats와 /metrics는 요청을 받은 워커 한 곳의 값이다 (응답의 shared_store.pid).
+작업 풀 크기 · 기능별 한도(WORKER_*)는 워커마다 적용되고, 분당 예산(SCHED_RPM/TPM)은 워커 수로 나눈다.
+
+사용: python serve.py --workers 4 --port 5000
+      kill -HUP <마스터 pid>   # 코드 · 설정 다시 불러오기
+"""
+
+_signals = []         # 마스터가 받은 신호 (처리는 메인 루프에서)
+_wakeup_read = None   # 신호가 오면 select를 깨우는 파이프
+_wakeup = None
+
+
+def _on_signal(signum, frame):
+    _signals.append(signum)
+    try:
+        os.write(_wakeup, b"!")
+    except OSError:
+        pass
+
+
+def listen_socket(host: str, port: int, backlog: int = 2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# -----------------------------------------------------------
+# 1️⃣ 워커 프로세스
+# -----------------------------------------------------------
+def run_worker(listen_fd: int, ready_fd: int, graceful_timeout: float):
+    """fork된 자식에서 실행 — 준비가 끝나면 ready_fd에 한 바이트를 쓰고 SIGTERM까지 요청을 처리"""
+    for signum in (signal.SIGHUP, signal.SIGINT):
+        signal.signal(signum, signal.SIG_IGN)  # 터미널 Ctrl+C는 마스터가 받아 SIGTERM으로 전달
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from gevent.monkey import patch_all
+    patch_all()
+    import gevent
+    from gevent import pywsgi
+    from gevent.pool import Pool
+
+    from app import app  # 임포트하면서 LLM 클라이언트 · 프롬프트 · 토크나이저 · 형태소 분석기를 준비
+
+    listener = socket.socket(fileno=listen_fd)  # patch 이후 → gevent 소켓
+    connections = Pool()  # stop()이 열린 연결을 기다리려면 풀이 있어야 한다
+    server = pywsgi.WSGIServer(listener, app, spawn=connections)
+    server.stop_timeout = graceful_timeout
+
+    def drain():
+        # 리슨 소켓을 닫아 새 연결은 다른 워커로 가게 하고, 열린 스트림은 stop_timeout까지 기다림
+        print(f"[serve] 워커 {os.getpid()} 종료 중 — 열린 연결 {len(connections)}개 정리", flush=True)
+        server.stop()
+
+    gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(drain))
+    server.start()
+    os.write(ready_fd, b"1")
+    os.close(ready_fd)
+    server.serve_forever()
+
+
+# -----------------------------------------------------------
+# 2️⃣ 마스터 프로세스
+# -----------------------------------------------------------
+class Master:
+    def __init__(self, sock, workers: int, graceful_timeout: float = 30.0, warmup_timeout: float = 120.0):
+        self.sock = sock
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.warmup_timeout = warmup_timeout
+        self.generation = 0
+        self._children = {}  # pid -> 세대
+        self._stopping = False
+        self._starting = {}  # 다시 띄운 워커의 준비 알림 fd -> (pid, 준비 마감 시각)
+        self._missing = 0    # 아직 다시 띄우지 않은 워커 수
+        self._respawn_at = 0.0  # 시작하자마자 죽는 경우 fork를 반복하지 않도록 다음 fork 가능 시각
+
+    def spawn(self):
+        """워커 하나를 fork → (pid, 준비 알림을 읽을 fd)"""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            os.close(_wakeup_read)
+            os.close(_wakeup)
+            code = 0
+            try:
+                run_worker(self.sock.fileno(), write_fd, self.graceful_timeout)
+            except BaseException as e:
+                print(f"[serve] 워커 {os.getpid()} 오류: {e!r}", file=sys.stderr, flush=True)
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        self._children[pid] = self.generation
+        return pid, read_fd
+
+    def spawn_generation(self):
+        """새 세대 워커 N개를 띄우고 모두 준비될 때까지 기다림 → 준비된 pid 목록"""
+        self.generation += 1
+        pending = {}  # 준비 알림 fd -> pid
+        for _ in range(self.workers):
+            pid, read_fd = self.spawn()
+            pending[read_fd] = pid
+        ready = []
+        deadline = time.monotonic() + self.warmup_timeout
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending), [], [], max(0.0, deadline - time.monotonic()))
+            for fd in readable:
+                pid = pending.pop(fd)
+                if os.read(fd, 1):
+                    ready.append(pid)
+                os.close(fd)
+        for fd, pid in pending.items():  # 시간 안에 준비되지 않음
+            os.close(fd)
+            self._kill(pid, signal.SIGKILL)
+        return ready
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        """끝난 자식 정리 → 현재 세대에서 예기치 않게 끝난 워커 수"""
+        lost = 0
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return lost
+            if pid == 0:
+                return lost
+            generation = self._children.pop(pid, None)
+            if generation == self.generation and not self._stopping:
+                print(f"[serve] 워커 {pid}가 종료됨 (status={status}) — 다시 시작", flush=True)
+                lost += 1
+
+    def reload(self):
+        old = [pid for pid, generation in self._children.items() if generation == self.generation]
+        ready = self.spawn_generation()
+        if len(ready) < self.workers:
+            print(f"[serve] 재시작 실패: 새 워커 {len(ready)}/{self.workers}개만 준비됨 — 기존 워커 유지", flush=True)
+            for pid in ready:
+                self._children[pid] = 0  # 폐기 — 끝나도 다시 띄우지 않음
+                self._kill(pid, signal.SIGTERM)
+            return
+        for pid in old:
+            self._kill(pid, signal.SIGTERM)  # 기존 워커는 열린 스트림을 마무리하고 끝남
+        self._missing = 0  # 새 세대가 모두 준비됨 → 이전 세대의 빈자리는 채우지 않는다
+        print(f"[serve] 재시작 완료 (세대 {self.generation}, 워커 {len(ready)}개)", flush=True)
+
+    def stop(self):
+        self._stopping = True
+        for pid in list(self._children):
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._children):
+            self._kill(pid, signal.SIGKILL)
+
+    def run(self):
+        ready = self.spawn_generation()
+        if not ready:
+            print("[serve] 준비된 워커가 없습니다.", file=sys.stderr, flush=True)
+            self.stop()
+            return 1
+        host, port = self.sock.getsockname()[:2]
+        print(f"✅ {len(ready)} workers on http://{host}:{port} (master pid {os.getpid()})", flush=True)
+        while True:
+            readable, _, _ = select.select([_wakeup_read, *self._starting], [], [], self._wait_timeout())
+            if _wakeup_read in readable:
+                try:
+                    os.read(_wakeup_read, 512)
+                except BlockingIOError:
+                    pass
+            self._check_starting([fd for fd in readable if fd != _wakeup_read])
+            while _signals:
+                signum = _signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                elif signum in (signal.SIGTERM, signal.SIGINT):
+                    print("[serve] 종료 — 열린 스트림 정리 중", flush=True)
+                    self.stop()
+                    return 0
+            self._missing += self._reap()
+            if self._missing and time.monotonic() >= self._respawn_at:
+                for _ in range(self._missing):
+                    self.spawn_replacement()
+                self._missing = 0
+
+    def spawn_replacement(self):
+        """잃은 워커 하나를 다시 띄움 — 준비는 메인 루프의 select가 기다린다 (그동안에도 신호 처리)"""
+        pid, read_fd = self.spawn()
+        self._starting[read_fd] = (pid, time.monotonic() + self.warmup_timeout)
+
+    def _check_starting(self, readable):
+        now = time.monotonic()
+        for fd, (pid, deadline) in list(self._starting.items()):
+            if fd in readable:
+                ready = os.read(fd, 1)
+            elif now >= deadline:
+                ready = False
+                self._kill(pid, signal.SIGKILL)  # 끝나면 _reap이 잃은 워커로 세어 다시 띄움
+            else:
+                continue
+            del self._starting[fd]
+            os.close(fd)
+            if not ready:
+                self._respawn_at = now + 1.0
+
+    def _wait_timeout(self):
+        now = time.monotonic()
+        timeout = 1.0
+        for _, deadline in self._starting.values():
+            timeout = min(timeout, deadline - now)
+        if self._missing:
+            timeout = min(timeout, self._respawn_at - now)
+        return max(0.0, timeout)
+
+
+def main(argv=None):
+    global _wakeup_read, _wakeup
+    parser = argparse.ArgumentParser(description="글잇다 다중 프로세스 서버")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="종료 · 재시작 시 열린 SSE 스트림을 기다리는 시간 (초)")
+    parser.add_argument("--warmup-timeout", type=float, default=float(os.getenv("WARMUP_TIMEOUT", "120")),
+                        help="워커 준비(모델 · 토크나이저 로드) 최대 대기 시간 (초)")
+    args = parser.parse_args(argv)
+
+    # fork 전에 정함 → 모든 워커가 같은 파일을 열고, 분당 예산(scheduler)을 워커 수로 나눈다
+    os.environ.setdefault("SHARED_CACHE_PATH",
+                          os.path.join(tempfile.gettempdir(), f"glitda-shared-{args.port}.sqlite3"))
+    os.environ["WEB_WORKERS"] = str(max(1, args.workers))
+
+    sock = listen_socket(args.host, args.port)
+    _wakeup_read, _wakeup = os.pipe()
+    os.set_blocking(_wakeup_read, False)
+    os.set_blocking(_wakeup, False)
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, _on_signal)
+    return Master(sock, max(1, args.workers), args.graceful_timeout, args.warmup_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
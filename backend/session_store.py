@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+"""
+세션 단위 입력 저장소
+사용자마다 입력을 분리해 저장하고, 일정 시간이 지나면 자동으로 만료시킨다.
+shared(shared_cache.SharedStore)가 있으면 함께 저장 → 다른 워커 프로세스로 간 GET 요청도 입력을 읽는다.
+"""
+
+DEFAULT_TONE = "자동 감지"
+
+
+class InputStore:
+    """세션 토큰을 키로 하는 입력 저장소 (TTL 만료 + 최대 세션 수 제한)"""
+
+    def __init__(self, ttl: float = 300.0, max_sessions: int = 10000, shared=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.shared = shared
+        self._entries = OrderedDict()  # session_id -> (expires_at, {"message", "tone"})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    def put(self, session_id, message: str, tone: str = DEFAULT_TONE):
+        """입력을 저장하고 사용된 세션 토큰을 반환"""
+        session_id = session_id or self.new_session_id()
+        now = time.monotonic()
+        with self._lock:
+            self._entries[session_id] = (now + self.ttl, {"message": message, "tone": tone})
+            # 가장 최근에 갱신된 세션이 뒤로 가도록 유지 → 만료 정리는 앞에서부터
+            self._entries.move_to_end(session_id)
+            self._purge_locked(now)
+        if self.shared is not None:
+            self.shared.put("session", session_id, json.dumps({"message": message, "tone": tone}), self.ttl)
+        return session_id
+
+    def get(self, session_id):
+        """저장된 입력을 반환 (없거나 만료되었으면 None)"""
+        if not session_id:
+            return None
+        if self.shared is not None:
+            # 다른 워커가 더 최근 입력을 저장했을 수 있으므로 공유 저장소가 우선
+            stored = self.shared.get("session", session_id)
+            if stored is not None:
+                return json.loads(stored)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= now:
+                del self._entries[session_id]
+                return None
+            return dict(data)
+
+    def discard(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+        if self.shared is not None:
+            self.shared.delete("session", session_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _purge_locked(self, now):
+        while self._entries:
+            session_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_sessions:
+                break
+            del self._entries[session_id]
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import threading
+import time
+
+"""
+프로세스 간 공유 저장소 (SQLite WAL 파일 하나)
+serve.py가 워커 프로세스 여러 개를 띄우면 프로세스마다 메모리 캐시가 따로 생긴다.
+한 워커가 만든 제안을 다른 워커가 다시 요청하지 않도록, 그리고 POST로 저장한 입력(세션)을
+다른 워커로 간 EventSource 요청이 읽을 수 있도록 같은 파일을 2단계(L2) 저장소로 연다.
+- WAL 모드: 읽기는 쓰기를 기다리지 않고, 쓰기는 파일 잠금으로 직렬화된다 (busy_timeout만큼 재시도).
+- 이름공간(completion / session)별 키 → 문자열 값 + 만료 시각(벽시계, 프로세스 간 공통)
+- 일정 횟수의 쓰기마다 만료 항목을 지우고, max_entries를 넘으면 먼저 만료될 항목부터 지운다.
+- 저장소 오류는 요청을 실패시키지 않는다 (읽기 실패 = 없음, 쓰기 실패 = 무시, errors로 집계).
+
+사용: SHARED_CACHE_PATH=/var/run/glitda/cache.sqlite3 (serve.py는 지정하지 않으면 임시 디렉터리에 만든다)
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at);
+"""
+
+
+class SharedStore:
+    """get/get_many/put/delete (스레드 안전 — 프로세스마다 연결 하나를 잠금으로 공유)"""
+
+    def __init__(self, path: str, max_entries: int = 50000, purge_every: int = 256, busy_timeout: float = 2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self.busy_timeout = busy_timeout
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "purged": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls):
+        """SHARED_CACHE_PATH가 있을 때만 생성 (없거나 off면 None — 프로세스 하나면 필요 없음)"""
+        path = os.getenv("SHARED_CACHE_PATH", "")
+        if path in ("", "0", "off"):
+            return None
+        return cls(
+            path,
+            max_entries=int(os.getenv("SHARED_CACHE_SIZE", "50000")),
+        )
+
+    def _connection(self):
+        # fork 이전에 연 연결은 자식 프로세스에서 쓰지 않는다 → 프로세스마다 새로 연다
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # 캐시이므로 전원 장애 시 최근 쓰기 손실 허용
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    # -----------------------------------------------------------
+    # 조회 / 저장
+    # -----------------------------------------------------------
+    def get(self, namespace: str, key: str):
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace: str, keys):
+        """만료되지 않은 항목만 {키: 값} (쿼리 한 번)"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            try:
+                rows = self._connection().execute(
+                    f"SELECT key, value FROM entries WHERE namespace = ? AND key IN ({marks}) AND expires_at > ?",
+                    [namespace, *keys, time.time()],
+                ).fetchall()
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+                return {}
+            self._stats["hits" if rows else "misses"] += 1
+        return dict(rows)
+
+    def put(self, namespace: str, key: str, value: str, ttl: float):
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, value, time.time() + ttl),
+                )
+                self._stats["puts"] += 1
+                self._writes += 1
+                if self._writes % self.purge_every == 0:
+                    self._purge_locked(conn)
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            try:
+                self._connection().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+
+    def _purge_locked(self, conn):
+        purged = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            purged += conn.execute(
+                "DELETE FROM entries WHERE (namespace, key) IN "
+                "(SELECT namespace, key FROM entries ORDER BY expires_at LIMIT ?)", (excess,)
+            ).rowcount
+        self._stats["purged"] += purged
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            try:
+                if namespace is None:
+                    self._connection().execute("DELETE FROM entries")
+                else:
+                    self._connection().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+
+    # -----------------------------------------------------------
+    # 통계
+    # -----------------------------------------------------------
+    def stats(self):
+        """이 프로세스의 조회·저장 수와 파일 전체 항목 수"""
+        with self._lock:
+            stats = dict(self._stats)
+            try:
+                stats["size"] = self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            except sqlite3.Error:
+                stats["size"] = None
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["path"] = self.path
+        return stats
@@ -0,0 +1,313 @@
+import asyncio
+import threading
+
+"""
+single-flight 요청 병합
+같은 (입력, 문체, 기능) 요청이 동시에 들어오면 업스트림 호출을 한 번만 수행한다.
+- SingleFlight: 일괄 응답 함수 — 먼저 온 요청(리더)의 결과를 나머지가 공유
+- StreamFlight: 스트리밍 함수 — 하나의 생성 결과를 모든 구독자에게 팬아웃,
+  늦게 합류한 구독자에게는 이미 생성된 토큰을 먼저 재생한다.
+- AsyncSingleFlight / AsyncStreamFlight: asyncio 엔진(ai_async)용 같은 동작 — 이벤트 루프 스레드에서만 호출.
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _FlightStats:
+    def __init__(self):
+        self.requests = 0
+        self.coalesced = 0
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.requests - self.coalesced,
+            "coalesce_rate": round(self.coalesced / self.requests, 4) if self.requests else 0.0,
+        }
+
+
+class SingleFlight:
+    """동일 키의 동시 호출을 한 번의 실행으로 합친다 (일괄 응답용)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = _FlightStats()
+
+    def do(self, key, fn):
+        with self._lock:
+            self._stats.requests += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self._stats.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return self._stats.snapshot()
+
+
+class Broadcast:
+    """
+    생산자 한 명 → 구독자 여럿.
+    생성된 토큰을 모두 보관하므로 늦게 합류한 구독자도 처음부터 재생할 수 있다.
+    """
+
+    def __init__(self):
+        self._tokens = []
+        self._done = False
+        self._cond = threading.Condition()
+        self.cancel = threading.Event()  # 구독자가 모두 떠나면 설정됨
+        self.subscribers = 0
+        self.error = None  # 생성을 시작하지 못한 경우 (예: 작업 풀 거절) → 재생 끝에 다시 던짐
+        self._on_finish = None
+
+    def publish(self, token: str) -> bool:
+        """토큰 게시 (구독자가 모두 떠났으면 False → 생산 중단 신호)"""
+        if self.cancel.is_set():
+            return False
+        with self._cond:
+            self._tokens.append(token)
+            self._cond.notify_all()
+        return True
+
+    def finish(self):
+        if self._on_finish:
+            self._on_finish()
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def fail(self, error: Exception):
+        self.error = error
+        self.finish()
+
+    def __iter__(self):
+        return self.iter()
+
+    def iter(self, idle: float = None):
+        """토큰 재생 — idle초 동안 새 토큰이 없으면 빈 문자열(유휴 틱)을 내보낸다"""
+        i = 0
+        while True:
+            with self._cond:
+                if i >= len(self._tokens) and not self._done:
+                    self._cond.wait(idle)
+                batch = self._tokens[i:]
+                done = self._done
+            i += len(batch)
+            if batch:
+                yield from batch
+            elif done:
+                if self.error is not None:
+                    raise self.error
+                return
+            elif idle is not None:
+                yield ""
+
+
+class StreamFlight:
+    """동일 키의 동시 스트림을 하나의 업스트림 생성으로 합친다"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = _FlightStats()
+
+    def stream(self, key, start, idle: float = None):
+        """
+        key에 해당하는 진행 중 생성이 있으면 합류하고, 없으면 start(broadcast)로 새로 시작.
+        start는 백그라운드에서 broadcast.publish()/finish()를 호출해야 한다.
+        구독자가 모두 떠나면 broadcast.cancel이 설정되어 생산자가 멈춘다.
+        idle을 주면 토큰이 없는 동안 유휴 틱("")을 내보낸다 (SSE 프레임 모으기용).
+        합류·시작 직후에도 유휴 틱을 한 번 내보낸다 — 호출 측은 첫 항목을 당겨 start()의
+        거절(작업 풀 과부하)을 응답을 시작하기 전에 확인할 수 있다 (worker_pool.admit_eagerly).
+        """
+        with self._lock:
+            self._stats.requests += 1
+            broadcast = self._flights.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = Broadcast()
+                broadcast._on_finish = lambda: self._remove(key, broadcast)
+                self._flights[key] = broadcast
+            else:
+                self._stats.coalesced += 1
+            broadcast.subscribers += 1
+
+        try:
+            if leader:
+                try:
+                    start(broadcast)
+                except Exception as e:
+                    broadcast.fail(e)  # 이미 합류한 구독자에게도 같은 오류
+                    raise
+            yield ""
+            yield from broadcast.iter(idle)
+        finally:
+            self._unsubscribe(key, broadcast)
+
+    def _remove(self, key, broadcast):
+        with self._lock:
+            if self._flights.get(key) is broadcast:
+                del self._flights[key]
+
+    def _unsubscribe(self, key, broadcast):
+        with self._lock:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers > 0:
+                return
+            # 마지막 구독자가 떠남 → 새 요청이 취소된 생성에 합류하지 않도록 즉시 등록 해제
+            if self._flights.get(key) is broadcast:
+                del self._flights[key]
+        broadcast.cancel.set()
+
+    def stats(self):
+        with self._lock:
+            stats = self._stats.snapshot()
+            stats["in_flight"] = len(self._flights)
+            return stats
+
+
+# -----------------------------------------------------------
+# asyncio 버전 (ai_async)
+# -----------------------------------------------------------
+class AsyncSingleFlight:
+    """동일 키의 동시 호출을 코루틴 하나의 실행으로 합친다 (일괄 응답용)"""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = _FlightStats()
+
+    async def do(self, key, fn):
+        """fn() 코루틴을 리더 요청의 컨텍스트에서 태스크로 실행 — 한 요청이 끊겨도 나머지는 결과를 받는다"""
+        self._stats.requests += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is task else None)
+        else:
+            self._stats.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return self._stats.snapshot()
+
+
+class _AsyncBroadcast:
+    """생산 태스크 하나 → 구독자 여럿 (Broadcast의 asyncio 버전, 토큰을 모두 보관)"""
+
+    def __init__(self):
+        self._tokens = []
+        self._done = False
+        self._changed = asyncio.Event()
+        self.subscribers = 0
+        self.error = None
+        self.task = None
+
+    def publish(self, token):
+        self._tokens.append(token)
+        self._wake()
+
+    def finish(self, error=None):
+        self.error = error
+        self._done = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def __aiter__(self):
+        i = 0
+        while True:
+            if i < len(self._tokens):
+                batch = self._tokens[i:]
+                i += len(batch)
+                for token in batch:
+                    yield token
+            elif self._done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class AsyncStreamFlight:
+    """동일 키의 동시 스트림을 업스트림 생성 하나로 합친다 (StreamFlight의 asyncio 버전)"""
+
+    def __init__(self):
+        self._flights = {}
+        self._stats = _FlightStats()
+
+    async def stream(self, key, start):
+        """
+        key에 해당하는 진행 중 생성이 있으면 합류하고, 없으면 start()가 돌려준 async 토큰 이터레이터를
+        생산 태스크에서 끝까지 읽어 모든 구독자에게 보낸다. 생성 중 오류(작업 풀 거절 등)는 구독자 모두에게 다시 던진다.
+        구독자가 모두 떠나면 생산 태스크를 취소한다 (업스트림 스트림도 닫힘).
+        """
+        self._stats.requests += 1
+        broadcast = self._flights.get(key)
+        if broadcast is None:
+            broadcast = self._flights[key] = _AsyncBroadcast()
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, start()))
+        else:
+            self._stats.coalesced += 1
+        broadcast.subscribers += 1
+        try:
+            async for token in broadcast:
+                yield token
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                # 마지막 구독자가 떠남 → 새 요청이 취소된 생성에 합류하지 않도록 즉시 등록 해제
+                self._remove(key, broadcast)
+                broadcast.task.cancel()
+
+    async def _produce(self, key, broadcast, tokens):
+        error = None
+        try:
+            async for token in tokens:
+                broadcast.publish(token)
+        except Exception as e:
+            error = e
+        finally:
+            self._remove(key, broadcast)
+            broadcast.finish(error)
+            await tokens.aclose()
+
+    def _remove(self, key, broadcast):
+        if self._flights.get(key) is broadcast:
+            del self._flights[key]
+
+    def stats(self):
+        stats = self._stats.snapshot()
+        stats["in_flight"] = len(self._flights)
+        return stats
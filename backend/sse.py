@@ -0,0 +1,363 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+"""
+SSE 프레임 작성기
+- compact: 토큰을 최대 max_delay(기본 15ms) · max_bytes 단위로 모아 프레임 하나로 보낸다.
+  여러 줄 토큰은 줄마다 "data:" 줄로 나눠 인코딩하고(EventSource가 \\n으로 다시 결합),
+  프레임마다 "id: <스트림>:<누적 글자 수>"를 붙여 재연결 시 Last-Event-ID로 이어받을 수 있다.
+- legacy: 기존 방식 그대로 토큰 하나 = "data: 토큰\\n\\n" 프레임 하나 (비교·호환용)
+
+유휴 틱: 토큰 이터레이터가 빈 문자열("")을 내보내면 새 토큰 없이 시간만 흐른 것으로 보고
+모아 둔 토큰을 max_delay에 맞춰 내보낸다 (ai_handler 스트림 함수의 idle_tick 인자).
+"""
+
+DONE = "[DONE]"
+
+
+def encode_event(data: str = None, event: str = None, event_id: str = None) -> str:
+    """SSE 이벤트 하나 — data의 줄바꿈은 data: 줄을 나눠 표현"""
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    if event_id:
+        lines.append(f"id: {event_id}")
+    if data is not None:
+        lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value):
+    """'<스트림>:<글자 수>' → (스트림, 글자 수), 형식이 다르면 None"""
+    if not value or ":" not in value:
+        return None
+    stream_id, _, offset = value.rpartition(":")
+    try:
+        return stream_id, int(offset)
+    except ValueError:
+        return None
+
+
+class ResumeBuffer:
+    """최근 스트림의 전송 텍스트 보관 (재연결 시 놓친 부분 재전송)"""
+
+    def __init__(self, max_streams: int = 2000, ttl: float = 120, max_chars: int = 20000):
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self.max_chars = max_chars
+        # stream_id -> [텍스트 조각 목록 (max_chars를 넘으면 None = 이어받기 불가), 완료 여부, 갱신 시각, 글자 수]
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def append(self, stream_id, text, done=False):
+        with self._lock:
+            entry = self._streams.get(stream_id)
+            if entry is None:
+                entry = self._streams[stream_id] = [[], False, 0.0, 0]
+            if text and entry[0] is not None:
+                entry[3] += len(text)
+                if entry[3] <= self.max_chars:
+                    entry[0].append(text)
+                else:
+                    # 일부만 보관하면 재연결 때 잘린 텍스트 + [DONE]이 가므로 이 스트림은 이어받지 않는다
+                    entry[0] = None
+            entry[1] = entry[1] or done
+            entry[2] = time.monotonic()
+            self._streams.move_to_end(stream_id)
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+
+    def reset(self, stream_id, text):
+        """보낸 텍스트를 새 텍스트로 교체 (event: reset)"""
+        with self._lock:
+            self._streams.pop(stream_id, None)
+        self.append(stream_id, text)
+
+    def get(self, stream_id):
+        """(지금까지 보낸 텍스트, 완료 여부) 또는 None"""
+        with self._lock:
+            entry = self._streams.get(stream_id)
+            if entry is None or entry[0] is None or time.monotonic() - entry[2] > self.ttl:
+                return None
+            return "".join(entry[0]), entry[1]
+
+
+class _WriterStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, framing, frames, size, tokens):
+        with self._lock:
+            stats = self._stats.setdefault(framing, {"responses": 0, "frames": 0, "bytes": 0, "tokens": 0})
+            stats["responses"] += 1
+            stats["frames"] += frames
+            stats["bytes"] += size
+            stats["tokens"] += tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {framing: dict(stats) for framing, stats in self._stats.items()}
+
+
+_writer_stats = _WriterStats()
+
+
+def sse_stats():
+    """프레이밍 방식별 응답 · 프레임 · 바이트 · 토큰 수"""
+    return _writer_stats.snapshot()
+
+
+class SSEWriter:
+    """토큰 이터레이터 → SSE 프레임 문자열 이터레이터"""
+
+    FRAMINGS = ("compact", "legacy")
+
+    def __init__(self, framing: str = "compact", max_delay: float = 0.015, max_bytes: int = 4096,
+                 resume: ResumeBuffer = None):
+        self.framing = framing if framing in self.FRAMINGS else "compact"
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.resume = resume
+
+    @classmethod
+    def from_env(cls, framing: str = None, resume: ResumeBuffer = None):
+        return cls(
+            framing=framing or os.getenv("SSE_FRAMING", "compact"),
+            max_delay=float(os.getenv("SSE_MAX_DELAY_MS", "15")) / 1000,
+            max_bytes=int(os.getenv("SSE_MAX_BYTES", "4096")),
+            # 이벤트 id는 프레임당 ~16바이트 — 재연결이 필요 없으면 SSE_EVENT_IDS=0
+            resume=resume if os.getenv("SSE_EVENT_IDS", "1") == "1" else None,
+        )
+
+    @property
+    def idle_tick(self):
+        """토큰 이터레이터에 넘길 유휴 틱 간격 (legacy는 모을 필요가 없으므로 None)"""
+        return self.max_delay if self.framing == "compact" else None
+
+    def replay(self, last_event_id: str = None):
+        """
+        Last-Event-ID가 보관된 완료 스트림이면 놓친 부분 + [DONE] 프레임 목록, 아니면 None.
+        라우트가 스트림 함수를 부르기 전에 확인 → 끝난 스트림의 재연결은 새 생성을 시작하지 않는다.
+        """
+        if self.framing != "compact" or not last_event_id:
+            return None
+        state = _CompactState(self, last_event_id)
+        frames = state.resume_frames()
+        if not state.finished:
+            return None
+        counter = _FrameCounter(self.framing)
+        frames = [counter.frame(frame) for frame in frames]
+        counter.finish()
+        return frames
+
+    # -----------------------------------------------------------
+    # 동기 (Flask)
+    # -----------------------------------------------------------
+    def stream(self, tokens, last_event_id: str = None):
+        counter = _FrameCounter(self.framing)
+        try:
+            if self.framing == "legacy":
+                for token in tokens:
+                    if token:
+                        counter.token()
+                        yield counter.frame(f"data: {token}\n\n")
+                yield counter.frame(f"data: {DONE}\n\n")
+                return
+
+            state = _CompactState(self, last_event_id)
+            yield from (counter.frame(f) for f in state.resume_frames())
+            if state.finished:
+                return
+            pending, size, first_at, sent_any = [], 0, None, False
+            for token in tokens:
+                now = time.monotonic()
+                if token:
+                    counter.token()
+                    pending.append(token)
+                    size += len(token.encode("utf-8"))
+                    first_at = first_at or now
+                if not pending:
+                    continue
+                # 첫 토큰은 바로 보내 TTFT를 늘리지 않는다
+                if not sent_any or size >= self.max_bytes or now - first_at >= self.max_delay:
+                    frame = state.data_frame("".join(pending))
+                    pending, size, first_at, sent_any = [], 0, None, True
+                    if frame:
+                        yield counter.frame(frame)
+            if pending:
+                frame = state.data_frame("".join(pending))
+                if frame:
+                    yield counter.frame(frame)
+            yield counter.frame(state.done_frame())
+        finally:
+            counter.finish()
+            close = getattr(tokens, "close", None)
+            if close:
+                close()
+
+    # -----------------------------------------------------------
+    # 비동기 (starlette) — 기다리는 동안 다음 토큰 태스크를 취소하지 않고 타이머만 건다
+    # -----------------------------------------------------------
+    async def astream(self, tokens, last_event_id: str = None):
+        counter = _FrameCounter(self.framing)
+        pending_next = None
+        try:
+            if self.framing == "legacy":
+                async for token in tokens:
+                    if token:
+                        counter.token()
+                        yield counter.frame(f"data: {token}\n\n")
+                yield counter.frame(f"data: {DONE}\n\n")
+                return
+
+            state = _CompactState(self, last_event_id)
+            for frame in state.resume_frames():
+                yield counter.frame(frame)
+            if state.finished:
+                return
+            pending, size, first_at, sent_any = [], 0, None, False
+            iterator = tokens.__aiter__()
+            while True:
+                if pending_next is None:
+                    pending_next = asyncio.ensure_future(iterator.__anext__())
+                timeout = None
+                if pending:
+                    timeout = max(0.0, self.max_delay - (time.monotonic() - first_at))
+                done, _ = await asyncio.wait({pending_next}, timeout=timeout)
+                if done:
+                    task, pending_next = pending_next, None
+                    try:
+                        token = task.result()
+                    except StopAsyncIteration:
+                        break
+                    if token:
+                        counter.token()
+                        pending.append(token)
+                        size += len(token.encode("utf-8"))
+                        first_at = first_at or time.monotonic()
+                if not pending:
+                    continue
+                now = time.monotonic()
+                if not sent_any or size >= self.max_bytes or now - first_at >= self.max_delay:
+                    frame = state.data_frame("".join(pending))
+                    pending, size, first_at, sent_any = [], 0, None, True
+                    if frame:
+                        yield counter.frame(frame)
+            if pending:
+                frame = state.data_frame("".join(pending))
+                if frame:
+                    yield counter.frame(frame)
+            yield counter.frame(state.done_frame())
+        finally:
+            if pending_next is not None:
+                pending_next.cancel()
+            counter.finish()
+            aclose = getattr(tokens, "aclose", None)
+            if aclose:
+                await aclose()
+
+
+class _FrameCounter:
+    def __init__(self, framing):
+        self.framing = framing
+        self.frames = 0
+        self.bytes = 0
+        self.tokens = 0
+
+    def token(self):
+        self.tokens += 1
+
+    def frame(self, frame):
+        self.frames += 1
+        self.bytes += len(frame.encode("utf-8"))
+        return frame
+
+    def finish(self):
+        _writer_stats.add(self.framing, self.frames, self.bytes, self.tokens)
+
+
+class _CompactState:
+    """
+    compact 프레임의 id(스트림:누적 글자 수)와 재연결 처리.
+    재연결 시 보관된 텍스트에서 놓친 부분을 먼저 보내고, 새 생성 결과에서는
+    이미 보낸 앞부분을 건너뛴다 (캐시·요청 병합으로 같은 텍스트가 재생되는 경우).
+    새 결과가 보낸 내용과 다르면 "event: reset"으로 전체 텍스트를 다시 보낸다.
+    보관된 텍스트가 없으면(만료 · 길이 초과) 첫 프레임을 "event: reset"으로 보내 처음부터 다시 받게 한다.
+    """
+
+    def __init__(self, writer, last_event_id):
+        self.resume = writer.resume
+        self.stream_id = uuid.uuid4().hex[:8]
+        self.sent = 0          # 클라이언트가 받은 글자 수
+        self.skip = ""         # 새 생성 결과에서 건너뛸 이미 보낸 텍스트
+        self.replayed = ""     # 건너뛰는 중 받은 새 텍스트
+        self.finished = False
+        self.restart = False   # 클라이언트가 가진 텍스트를 버려야 함 (첫 프레임을 reset으로)
+        self._resume_text = None
+        self._resume_done = False
+
+        parsed = parse_last_event_id(last_event_id) if self.resume else None
+        stored = self.resume.get(parsed[0]) if parsed else None
+        if stored is not None:
+            self.stream_id = parsed[0]
+            text, done = stored
+            self.sent = min(parsed[1], len(text))
+            self._resume_text = text
+            self._resume_done = done
+        elif parsed and parsed[1] > 0:
+            self.restart = True
+
+    def _id(self):
+        return f"{self.stream_id}:{self.sent}" if self.resume else None
+
+    def resume_frames(self):
+        if self._resume_text is None:
+            return []
+        frames = []
+        missed = self._resume_text[self.sent:]
+        if missed:
+            self.sent += len(missed)
+            frames.append(encode_event(missed, event_id=self._id()))
+        if self._resume_done:
+            self.finished = True
+            frames.append(encode_event(DONE, event_id=self._id()))
+        else:
+            self.skip = self._resume_text
+        return frames
+
+    def data_frame(self, text):
+        if self.skip:
+            self.replayed += text
+            if self.skip.startswith(self.replayed):
+                if len(self.replayed) == len(self.skip):
+                    self.skip = self.replayed = ""
+                return None
+            if self.replayed.startswith(self.skip):
+                text = self.replayed[len(self.skip):]
+                self.skip = self.replayed = ""
+            else:
+                # 새 생성 결과가 다름 → 처음부터 다시
+                text, self.skip, self.replayed = self.replayed, "", ""
+                self.sent = len(text)
+                if self.resume:
+                    self.resume.reset(self.stream_id, text)
+                return encode_event(text, event="reset", event_id=self._id())
+        if self.restart:
+            self.restart = False
+            self.sent = len(text)
+            self.resume.append(self.stream_id, text)
+            return encode_event(text, event="reset", event_id=self._id())
+        self.sent += len(text)
+        if self.resume:
+            self.resume.append(self.stream_id, text)
+        return encode_event(text, event_id=self._id())
+
+    def done_frame(self):
+        if self.resume:
+            self.resume.append(self.stream_id, "", done=True)
+        return encode_event(DONE, event_id=self._id())
@@ -1,6 +1,8 @@
 """
 스트리밍 기능 테스트 스크립트
 실제로 스트리밍이 작동하는지 확인할 수 있습니다.
+API 키 없이 확인하려면 LLM_PROVIDER=fake 로 실행하세요 (fake_llm 사용).
+부하·지연 측정은 benchmark.py를 사용합니다.
 """
 import os
 from dotenv import load_dotenv
@@ -27,6 +29,8 @@ def test_streaming():
     try:
         token_count = 0
         for token in stream_predict_text(test_input, test_tone):
+            if not token:  # 유휴 틱
+                continue
             if token == "[DONE]":
                 print("\n[DONE] - 스트리밍 완료")
                 break
@@ -48,7 +52,9 @@ def test_streaming():
 if __name__ == "__main__":
     # API 키 확인
     api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    if os.getenv("LLM_PROVIDER") == "fake":
+        print("[확인] 가짜 LLM(fake_llm)으로 실행합니다.\n")
+    elif not api_key:
         print("[경고] OPENAI_API_KEY가 .env 파일에 설정되지 않았습니다.")
         print("테스트를 진행하지만 API 호출이 실패할 수 있습니다.\n")
     else:
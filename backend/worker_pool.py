@@ -0,0 +1,450 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+"""
+업스트림 LLM 작업용 공유 작업 풀 (입장 제어 + 부하 차단)
+요청마다 스레드를 새로 만들지 않고 고정된 수의 작업 스레드가 대기열에서 일을 꺼내 실행한다.
+- 기능별 동시 실행 한도: 한 기능(예: 타이핑 폭주 중의 predict)이 풀 전체를 차지하지 못한다.
+- 대기열 길이 한도: 가득 차면 submit이 즉시 PoolOverloaded(503)를 던진다.
+  한 기능의 대기 작업이 그 기능의 한도만큼 쌓여 있으면 429.
+- 대기 시간 한도: 대기열에서 너무 오래 기다린 작업은 실행하지 않고 PoolOverloaded로 끝낸다
+  (오래된 예측·제안은 도착해도 쓸모가 없다).
+거절에는 기능별 평균 실행 시간으로 추정한 retry_after(초)를 붙인다.
+대기열의 순서는 교체할 수 있다: 기본은 먼저 온 순서(FifoQueue),
+scheduler.PriorityScheduler는 우선순위 등급 · 사용자별 공정성 · 분당 요청/토큰 예산을 따른다.
+"""
+
+DEFAULT_LIMITS = {
+    "predict": 12,
+    "suggest": 6,
+    "suggest_stream": 8,
+    "suggest_streamed": 6,
+    "detect_batch": 6,
+    "detect_stream": 6,
+}
+DEFAULT_QUEUE_TIMEOUTS = {
+    "predict": 1.0,
+    "suggest_stream": 2.0,
+    # 일괄 응답은 기다릴 수 있다 (예산이 부족하면 scheduler가 오래된 작업을 먼저 버림)
+    "suggest": 10.0,
+    "detect_batch": 10.0,
+}
+
+
+def parse_map(raw: str, cast=float):
+    """'predict=8,suggest=4' → {"predict": 8, "suggest": 4} (형식이 틀린 항목은 무시)"""
+    result = {}
+    for part in (raw or "").split(","):
+        name, _, value = part.partition("=")
+        try:
+            result[name.strip()] = cast(value)
+        except ValueError:
+            continue
+    return result
+
+
+class PoolOverloaded(Exception):
+    """풀이 가득 차 작업을 받지 않음 — 응답은 status + Retry-After"""
+
+    def __init__(self, feature: str, reason: str, retry_after: int):
+        self.feature = feature
+        self.reason = reason  # queue_full / feature_busy / queue_timeout / stale (scheduler)
+        self.retry_after = retry_after
+        self.status = 429 if reason == "feature_busy" else 503
+        super().__init__(f"서버가 혼잡합니다 ({feature}: {reason}). {retry_after}초 후 다시 시도하세요.")
+
+
+class _Task:
+    __slots__ = ("feature", "fn", "args", "future", "enqueued", "deadline", "cost", "user", "priority", "recorded")
+
+    def __init__(self, feature, fn, args, deadline, cost=0, user=None):
+        self.feature = feature
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + deadline
+        self.cost = cost        # 예상 토큰 수 (scheduler 예산용)
+        self.user = user
+        self.priority = None
+        self.recorded = False   # 실제 출력 토큰이 기록됨 (scheduler 예산 정산용)
+
+
+class FifoQueue:
+    """기본 대기열 — 한도에 여유가 있는 기능 중 가장 먼저 들어온 작업"""
+
+    def __init__(self):
+        self._tasks = deque()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def push(self, task):
+        self._tasks.append(task)
+
+    def expire(self, now):
+        """대기 시간을 넘겼거나 취소된 작업을 빼서 돌려줌 → [(작업, 사유)]"""
+        expired = [(task, "queue_timeout") for task in self._tasks
+                   if task.deadline < now or task.future.cancelled()]
+        for task, _ in expired:
+            self._tasks.remove(task)
+        return expired
+
+    def pop(self, runnable):
+        for task in self._tasks:
+            if runnable(task.feature):
+                self._tasks.remove(task)
+                return task
+        return None
+
+    def wait_hint(self):
+        """실행 가능한 작업이 생길 때까지 기다릴 시간 (None: 상태 변화 알림까지)"""
+        return None
+
+    def start(self, task):
+        """작업을 실행하는 스레드 · asyncio 태스크에서 실행 직전에 호출 (락 밖)"""
+
+    def done(self, task, elapsed):
+        pass
+
+    def stats(self):
+        return None
+
+
+class WorkerPool:
+    """submit(feature, fn, *args) → concurrent.futures.Future"""
+
+    def __init__(self, max_workers: int = 32, max_queue: int = 64, queue_timeout: float = 3.0,
+                 limits=None, queue_timeouts=None, default_limit: int = 4, queue=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.queue_timeouts = dict(DEFAULT_QUEUE_TIMEOUTS, **(queue_timeouts or {}))
+        self.default_limit = default_limit
+
+        self._cond = threading.Condition()
+        self._pending = queue if queue is not None else FifoQueue()
+        self._running = {}        # feature -> 실행 중 작업 수
+        self._queued = {}         # feature -> 대기 작업 수
+        self._service = {}        # feature -> 평균 실행 시간 (지수 이동 평균)
+        self._workers = []
+        self._busy = 0
+        self._peak_queued = 0
+        self._stats = {}
+
+    @classmethod
+    def from_env(cls, queue=None):
+        return cls(
+            queue=queue,
+            max_workers=int(os.getenv("WORKER_POOL_SIZE", "32")),
+            max_queue=int(os.getenv("WORKER_QUEUE_SIZE", "64")),
+            queue_timeout=float(os.getenv("WORKER_QUEUE_TIMEOUT", "3")),
+            limits=parse_map(os.getenv("WORKER_LIMITS"), int),
+            queue_timeouts=parse_map(os.getenv("WORKER_QUEUE_TIMEOUTS")),
+        )
+
+    def limit(self, feature: str) -> int:
+        return min(self.limits.get(feature, self.default_limit), self.max_workers)
+
+    # -----------------------------------------------------------
+    # 입장
+    # -----------------------------------------------------------
+    def submit(self, feature: str, fn, *args, cost: int = 0, user: str = None):
+        """
+        대기열에 넣고 Future 반환 — 받을 수 없으면 즉시 PoolOverloaded
+        cost(예상 토큰 수)와 user는 대기열 정책(scheduler)이 순서를 정할 때 쓴다.
+        """
+        return self._enqueue(feature, fn, args, cost, user).future
+
+    def _enqueue(self, feature, fn, args, cost, user):
+        expired = []
+        with self._cond:
+            self._start_workers()
+            expired = self._drop_expired()
+            stats = self._feature_stats(feature)
+            stats["submitted"] += 1
+            reason = None
+            if len(self._pending) >= self.max_queue:
+                reason = "queue_full"
+            elif (self._queued.get(feature, 0) >= self.limit(feature)
+                  and self._running.get(feature, 0) >= self.limit(feature)):
+                reason = "feature_busy"
+            if reason:
+                stats["rejected"] += 1
+                error = PoolOverloaded(feature, reason, self._retry_after(feature))
+            else:
+                task = _Task(feature, fn, args, self.queue_timeouts.get(feature, self.queue_timeout), cost, user)
+                self._pending.push(task)
+                self._queued[feature] = self._queued.get(feature, 0) + 1
+                self._peak_queued = max(self._peak_queued, len(self._pending))
+                self._cond.notify()
+        self._fail(expired)
+        if reason:
+            raise error
+        return task
+
+    def _retry_after(self, feature):
+        """앞선 작업이 빠질 때까지 걸릴 시간 추정 (1~30초)"""
+        backlog = self._queued.get(feature, 0) + 1
+        seconds = self._service.get(feature, 2.0) * backlog / max(1, self.limit(feature))
+        return max(1, min(30, math.ceil(seconds)))
+
+    # -----------------------------------------------------------
+    # 작업 스레드
+    # -----------------------------------------------------------
+    def _start_workers(self):
+        # 첫 submit에서 시작 (gevent monkey patch 이후에 만들어지도록)
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"llm-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _drop_expired(self):
+        expired = self._pending.expire(time.monotonic())
+        for task, _ in expired:
+            self._queued[task.feature] -= 1
+        return expired
+
+    def _fail(self, expired):
+        """대기열에서 빠진 작업을 PoolOverloaded로 끝냄 (락 밖에서 — 완료 콜백이 실행되므로)"""
+        for task, reason in expired:
+            if task.future.cancelled():
+                continue
+            with self._cond:
+                self._feature_stats(task.feature)["expired"] += 1
+                retry_after = self._retry_after(task.feature)
+            task.future.set_exception(PoolOverloaded(task.feature, reason, retry_after))
+
+    def _next_task(self):
+        task = self._pending.pop(lambda feature: self._running.get(feature, 0) < self.limit(feature))
+        if task:
+            self._queued[task.feature] -= 1
+        return task
+
+    def _wait_timeout(self):
+        hint = self._pending.wait_hint()
+        return self.queue_timeout if hint is None else max(0.001, min(hint, self.queue_timeout))
+
+    def _work(self):
+        while True:
+            with self._cond:
+                expired = self._drop_expired()
+                task = None if expired else self._next_task()
+                while task is None and not expired:
+                    self._cond.wait(self._wait_timeout())
+                    expired = self._drop_expired()
+                    task = None if expired else self._next_task()
+                if task:
+                    self._running[task.feature] = self._running.get(task.feature, 0) + 1
+                    self._busy += 1
+            self._fail(expired)
+            if task is None:
+                continue
+            started = time.monotonic()
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    self._pending.start(task)
+                    try:
+                        task.future.set_result(task.fn(*task.args))
+                    except BaseException as e:
+                        task.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._finished(task, started, time.monotonic() - started)
+                    self._cond.notify_all()
+
+    def _finished(self, task, started, elapsed):
+        """실행을 마친 작업의 자리 반납 · 통계 (락 안에서)"""
+        self._pending.done(task, elapsed)
+        self._running[task.feature] -= 1
+        self._busy -= 1
+        previous = self._service.get(task.feature)
+        self._service[task.feature] = elapsed if previous is None else previous * 0.8 + elapsed * 0.2
+        stats = self._feature_stats(task.feature)
+        stats["completed"] += 1
+        stats["queue_wait_ms_total"] += round((started - task.enqueued) * 1000, 1)
+
+    # -----------------------------------------------------------
+    # 통계
+    # -----------------------------------------------------------
+    def _feature_stats(self, feature):
+        return self._stats.setdefault(feature, {
+            "submitted": 0, "completed": 0, "rejected": 0, "expired": 0, "queue_wait_ms_total": 0.0,
+        })
+
+    def stats(self):
+        """풀 점유율, 대기열, 기능별 처리·거절·만료 수"""
+        with self._cond:
+            features = {}
+            for feature, stats in self._stats.items():
+                features[feature] = dict(
+                    stats,
+                    running=self._running.get(feature, 0),
+                    queued=self._queued.get(feature, 0),
+                    limit=self.limit(feature),
+                    queue_wait_ms_total=round(stats["queue_wait_ms_total"], 1),
+                )
+            stats = {
+                "workers": self.max_workers,
+                "busy": self._busy,
+                "occupancy": round(self._busy / self.max_workers, 3) if self.max_workers else 0.0,
+                "queued": len(self._pending),
+                "max_queue": self.max_queue,
+                "peak_queued": self._peak_queued,
+                "features": features,
+            }
+            scheduler = self._pending.stats()
+            if scheduler is not None:
+                stats["scheduler"] = scheduler
+            return stats
+
+
+# -----------------------------------------------------------
+# asyncio 버전 (asgi_app) — 작업 스레드 대신 자리(slot)를 나눠 준다
+# -----------------------------------------------------------
+class AsyncWorkerPool(WorkerPool):
+    """
+    같은 입장 규칙(작업 수 · 기능별 한도 · 대기열 한도 · 대기 시간)과 같은 대기열 정책으로
+    코루틴이 업스트림을 부를 차례를 정한다. reserve()가 자리를 예약하고(받을 수 없으면 PoolOverloaded),
+    await slot.acquire()로 차례를 기다린 뒤 slot.release()로 반납한다. 이벤트 루프 스레드에서만 호출.
+    """
+
+    def submit(self, feature: str, fn, *args, cost: int = 0, user: str = None):
+        raise TypeError("AsyncWorkerPool은 reserve()로 자리를 예약한다")
+
+    def reserve(self, feature: str, cost: int = 0, user: str = None):
+        """대기열에 넣고 _Slot 반환 — 받을 수 없으면 즉시 PoolOverloaded"""
+        slot = _Slot(self, self._enqueue(feature, None, (), cost, user))
+        self._poll()  # 빈 자리가 있으면 바로 차례를 넘김 → 다음 입장 판단에 실행 중인 수가 반영됨
+        return slot
+
+    def _start_workers(self):
+        pass  # 작업 스레드 없음 — 자리를 받은 코루틴이 직접 실행
+
+    def _poll(self):
+        """만료된 작업을 끝내고 빈 자리만큼 대기 작업에 차례를 넘김"""
+        with self._cond:
+            expired = self._drop_expired()
+            ready = self._dispatch()
+        self._fail(expired)
+        self._start(ready)
+
+    def _dispatch(self):
+        ready = []
+        while self._busy < self.max_workers:
+            task = self._next_task()
+            if task is None:
+                break
+            self._running[task.feature] = self._running.get(task.feature, 0) + 1
+            self._busy += 1
+            ready.append(task)
+        return ready
+
+    def _start(self, ready):
+        now = time.monotonic()
+        for task in ready:
+            if task.future.set_running_or_notify_cancel():
+                task.future.set_result(now)  # 결과 = 차례를 받은 시각
+            else:
+                self._release(task, now)  # 기다리던 코루틴이 이미 떠남
+
+    def _release(self, task, started):
+        with self._cond:
+            self._finished(task, started, time.monotonic() - started)
+            ready = self._dispatch()
+        self._start(ready)
+
+    def _wake_after(self, task):
+        """차례를 기다리는 코루틴이 다시 확인할 때까지의 시간 (대기 마감 · 예산 대기 중 빠른 쪽)"""
+        with self._cond:
+            hint = self._pending.wait_hint()
+        timeout = task.deadline - time.monotonic()
+        return max(0.001, timeout if hint is None else min(hint, timeout))
+
+
+class _Slot:
+    def __init__(self, pool, task):
+        self._pool = pool
+        self._task = task
+        self._released = False
+
+    async def acquire(self):
+        """차례가 올 때까지 기다림 — 대기 시간을 넘기면 PoolOverloaded"""
+        self._pool._poll()
+        waiter = asyncio.wrap_future(self._task.future)
+        while not waiter.done():
+            await asyncio.wait({waiter}, timeout=self._pool._wake_after(self._task))
+            if not waiter.done():
+                self._pool._poll()
+        waiter.result()
+        self._pool._pending.start(self._task)  # 이 코루틴(태스크)이 실행 — 출력 사용량이 이 작업에 기록된다
+
+    def release(self):
+        """자리 반납 (아직 대기 중이면 대기열에서 뺌) — 여러 번 불러도 된다"""
+        if self._released:
+            return
+        self._released = True
+        future = self._task.future
+        if future.cancel():
+            return  # 대기 중이었음 → 다음 expire에서 대기열에서 빠짐
+        if future.exception() is None:
+            self._pool._release(self._task, future.result())
+
+
+def admit_eagerly(tokens):
+    """
+    토큰 제너레이터의 첫 항목을 미리 당겨 풀 입장 거절(PoolOverloaded)을 응답 시작 전에 드러낸다.
+    스트림 함수는 작업이 대기열에 들어가면 빈 문자열(유휴 틱)을 먼저 내보낸다.
+    """
+    first = next(tokens, None)
+
+    def chained():
+        try:
+            if first is not None:
+                yield first
+            yield from tokens
+        finally:
+            tokens.close()
+
+    return chained()
+
+
+async def aadmit_eagerly(tokens):
+    """admit_eagerly의 async 버전 (asgi_app) — 첫 항목을 기다려 당긴 뒤 나머지를 이어 붙인 async 이터레이터"""
+    try:
+        first = await tokens.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def chained():
+        try:
+            if first is not None:
+                yield first
+            async for token in tokens:
+                yield token
+        finally:
+            await tokens.aclose()
+
+    return chained()
+
+
+def offload(fn, *args):
+    """
+    CPU 작업(로컬 모델 연산 · 형태소 분석 · 임베딩)을 gevent monkey patch 상태면 허브 스레드풀(실제 OS 스레드)에서 실행
+    (아니면 그대로 호출) — 허브에서 직접 돌리면 그동안 워커의 다른 SSE 스트림이 모두 멈춘다.
+    """
+    try:
+        from gevent import monkey
+        patched = monkey.is_module_patched("threading")
+    except ImportError:
+        patched = False
+    if patched:
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
@@ -17,46 +17,90 @@ function App() {
   const textareaRef = useRef(null);
 
   // ============================================================
-  // 1️⃣ 실시간 예측 (AI Cursor)
+  // 0️⃣ POST 한 번으로 입력 전송 + SSE 수신 (왕복 1회)
   // ============================================================
-  const handleStream = async () => {
-    if (window.currentEventSource) {
-      window.currentEventSource.close();
-      window.currentEventSource = null;
+  // text/plain 본문은 CORS preflight(OPTIONS)를 유발하지 않으므로
+  // 예측 1회당 HTTP 요청이 하나로 줄어든다. 서버는 본문을 JSON으로 파싱한다.
+  const streamSSE = async (url, payload, onData, signal) => {
+    const res = await fetch(url, {
+      method: "POST",
+      headers: { "Content-Type": "text/plain;charset=UTF-8" },
+      body: JSON.stringify(payload),
+      signal,
+    });
+    if (!res.ok || !res.body) {
+      throw new Error(`HTTP ${res.status}`);
     }
 
-    setStreamText("");
-
-    try {
-      await fetch("http://localhost:5000/stream", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: input, tone: highlightMode }),
-      });
-
-      const eventSource = new EventSource("http://localhost:5000/stream-events");
-
-      eventSource.onmessage = (event) => {
-        const data = event.data;
-        if (data === "[DONE]") {
-          eventSource.close();
-          window.currentEventSource = null;
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        // EventSource와 동일한 규칙: "data:" 뒤 공백 한 칸만 제거, 여러 줄은 \n으로 결합
+        const lines = frame.split("\n");
+        const dataLines = lines
+          .filter((line) => line.startsWith("data:"))
+          .map((line) => line.slice(5).replace(/^ /, ""));
+        if (dataLines.length === 0) continue;
+        // 이벤트 이름 (없으면 "message") — "reset"이면 지금까지 받은 텍스트를 이 데이터로 교체
+        const eventLine = lines.find((line) => line.startsWith("event:"));
+        const event = eventLine ? eventLine.slice(6).trim() : "message";
+        if (onData(dataLines.join("\n"), event) === false) {
+          reader.cancel();
           return;
         }
-        setStreamText((prev) => prev + data);
-      };
+      }
+    }
+  };
 
-      eventSource.onerror = (err) => {
-        console.error("SSE error:", err);
-        setStreamText((prev) => prev + "\n\n[스트리밍 오류]");
-        eventSource.close();
-        window.currentEventSource = null;
-      };
+  // 진행 중인 스트림을 중단하고 새 AbortController를 등록
+  const restartStream = () => {
+    if (window.currentStreamController) {
+      window.currentStreamController.abort();
+    }
+    const controller = new AbortController();
+    window.currentStreamController = controller;
+    return controller;
+  };
 
-      window.currentEventSource = eventSource;
+  const releaseStream = (controller) => {
+    if (window.currentStreamController === controller) {
+      window.currentStreamController = null;
+    }
+  };
+
+  // ============================================================
+  // 1️⃣ 실시간 예측 (AI Cursor)
+  // ============================================================
+  const handleStream = async () => {
+    const controller = restartStream();
+    setStreamText("");
+
+    try {
+      await streamSSE(
+        "http://localhost:5000/stream-events",
+        { message: input, tone: highlightMode },
+        (data, event) => {
+          if (data === "[DONE]") return false;
+          setStreamText((prev) => (event === "reset" ? data : prev + data));
+        },
+        controller.signal
+      );
     } catch (err) {
-      console.error("Stream error:", err);
-      setStreamText("연결 오류 발생: " + err.message);
+      if (err.name === "AbortError") return;
+      console.error("SSE error:", err);
+      setStreamText((prev) => prev + "\n\n[스트리밍 오류]");
+    } finally {
+      releaseStream(controller);
     }
   };
 
@@ -84,50 +128,30 @@ function App() {
   // 3️⃣ 실시간 문장 제안 (SSE)
   // ============================================================
   const handleSuggestStream = async () => {
-    if (window.currentEventSource) {
-      window.currentEventSource.close();
-      window.currentEventSource = null;
-    }
-
+    const controller = restartStream();
     setStreamSuggestion("");
     setIsSuggestStreaming(true);
 
     try {
-      await fetch("http://localhost:5000/stream", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: input, tone: highlightMode }),
-      });
-
-      const eventSource = new EventSource("http://localhost:5000/suggest-stream");
-
-      eventSource.onmessage = (event) => {
-        const data = event.data;
-        if (data === "[DONE]") {
-          setIsSuggestStreaming(false);
-          eventSource.close();
-          window.currentEventSource = null;
-          return;
-        }
-        setStreamSuggestion((prev) => {
-          const newText = prev + data;
-          return newText;
-        });
-      };
-
-      eventSource.onerror = (err) => {
-        console.error("Suggest Stream SSE error:", err);
-        setStreamSuggestion((prev) => prev + "\n\n[스트리밍 오류]");
-        setIsSuggestStreaming(false);
-        eventSource.close();
-        window.currentEventSource = null;
-      };
-
-      window.currentEventSource = eventSource;
+      await streamSSE(
+        "http://localhost:5000/suggest-stream",
+        { message: input, tone: highlightMode },
+        (data, event) => {
+          if (data === "[DONE]") return false;
+          setStreamSuggestion((prev) => (event === "reset" ? data : prev + data));
+        },
+        controller.signal
+      );
     } catch (err) {
-      console.error("Suggest Stream error:", err);
-      setStreamSuggestion("연결 오류 발생: " + err.message);
-      setIsSuggestStreaming(false);
+      if (err.name === "AbortError") return;
+      console.error("Suggest Stream SSE error:", err);
+      setStreamSuggestion((prev) => prev + "\n\n[스트리밍 오류]");
+    } finally {
+      // 새 스트림으로 교체된 경우에는 상태를 건드리지 않음
+      if (window.currentStreamController === controller) {
+        setIsSuggestStreaming(false);
+      }
+      releaseStream(controller);
     }
   };
 